@@ -0,0 +1,92 @@
+"""
+Caché de administradores por chat
+Evita una llamada a get_chat_member en cada comando o botón de administrador
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+ADMIN_STATUSES = ('administrator', 'creator')
+
+class AdminCache:
+    def __init__(self, ttl: float, fail_open: bool = True):
+        self.ttl = ttl
+        self.fail_open = fail_open  # Resultado cuando Telegram no responde y no hay datos previos
+        self._admins: Dict[int, Tuple[float, Set[int]]] = {}  # {chat_id: (expira_en, {user_id})}
+        self._pending: Dict[int, asyncio.Future] = {}  # Refrescos en curso por chat
+
+    def _fresh_admins(self, chat_id: int) -> Optional[Set[int]]:
+        """Obtiene el conjunto de admins si la entrada no ha caducado"""
+        entry = self._admins.get(chat_id)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    async def refresh(self, bot, chat_id: int) -> Set[int]:
+        """Descarga la lista de administradores con una sola llamada a la API"""
+        pending = self._pending.get(chat_id)
+        if pending:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[chat_id] = future
+        try:
+            members = await bot.get_chat_administrators(chat_id)
+            admins = {member.user.id for member in members}
+            self._admins[chat_id] = (time.monotonic() + self.ttl, admins)
+            future.set_result(admins)
+            return admins
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Evitar aviso de excepción no recuperada
+            raise
+        finally:
+            del self._pending[chat_id]
+
+    async def warm(self, bot, chat_id: int):
+        """Precarga la caché de un chat si no hay datos vigentes"""
+        if self._fresh_admins(chat_id) is not None:
+            return
+        try:
+            await self.refresh(bot, chat_id)
+        except Exception as e:
+            logger.warning(f"No se pudo precargar admins de {chat_id}: {e}")
+
+    async def is_admin(self, bot, chat_id: int, user_id: int) -> bool:
+        """Verifica en memoria si el usuario es administrador, refrescando si caducó"""
+        admins = self._fresh_admins(chat_id)
+        if admins is not None:
+            return user_id in admins
+
+        try:
+            admins = await self.refresh(bot, chat_id)
+        except Exception as e:
+            logger.warning(f"Error verificando admin status para {user_id} en {chat_id}: {e}")
+            # Usar la última lista conocida aunque haya caducado
+            entry = self._admins.get(chat_id)
+            if entry:
+                return user_id in entry[1]
+            return self.fail_open
+        return user_id in admins
+
+    def prune(self, keep) -> int:
+        """Olvida las listas caducadas de los chats que no están en `keep`. Retorna cuántas se borraron"""
+        now = time.monotonic()
+        stale = [chat_id for chat_id, (expires, _) in self._admins.items() if expires <= now and chat_id not in keep]
+        for chat_id in stale:
+            del self._admins[chat_id]
+        return len(stale)
+
+    def update_member(self, chat_id: int, user_id: int, status: str):
+        """Aplica un cambio de estado de un miembro recibido por chat_member"""
+        entry = self._admins.get(chat_id)
+        if not entry:
+            return
+        if status in ADMIN_STATUSES:
+            entry[1].add(user_id)
+        else:
+            entry[1].discard(user_id)
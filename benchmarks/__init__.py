@@ -0,0 +1,4 @@
+"""
+Benchmarks y herramientas de prueba de carga del bot
+Se ejecutan desde la raíz del repositorio con `python -m benchmarks.<nombre>`
+"""
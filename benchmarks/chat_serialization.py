@@ -0,0 +1,346 @@
+"""
+Prueba de carga del procesamiento concurrente con orden por chat
+
+Juega --chats partidas a la vez enviando los updates por la cola de la aplicación (como el
+updater real), en ráfagas que compiten entre sí y con temporizadores de fase muy cortos:
+botones de configuración repetidos, /end_meet varias veces mientras vence la discusión, votos
+y "terminar votación" repetido mientras vence la votación, /next_player repetido...
+
+Con --scenarios se elige qué se envía:
+- rafagas: las ráfagas anteriores en todas las rondas
+- carrera: en cada ronda se pulsa "terminar votación" justo después de /end_meet, mientras
+  se envía la encuesta de votación (sendPoll tarda --poll-latency, más que cerrar la votación).
+  Sin cerrojo por chat la votación se cierra antes de tener encuesta, y al volver de enviarla
+  /end_meet programa el cierre automático encima del paso a la ronda siguiente: el juego se queda
+  en "procesando" para siempre. Con el cerrojo, el botón espera a que la encuesta esté enviada y
+  la ronda se repite sin votos hasta agotarlas (el modo secuencial no se usa: con sendPoll lento
+  las partidas no llegan a empezar)
+
+Al terminar se comprueba en el registro de cambios de fase de cada partida que no falta
+ninguno (cada partida termina y cada cambio parte de la fase anterior) y que ninguno se
+repite (como mucho un cambio de cada tipo por ronda), además del orden de los updates de cada
+chat y cuántos se procesaron a la vez. Se comparan tres modos:
+- chat: ChatUpdateProcessor (el del bot)
+- libre: updates concurrentes sin orden por chat
+- secuencial: un update detrás de otro
+
+Uso: python -m benchmarks.chat_serialization [--chats 200] [--players 5] [--rounds 2] [--latency 0.005] [--scenarios rafagas carrera]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+os.environ['GAME_DB_PATH'] = ''  # Sin persistencia durante la prueba
+os.environ['STATS_DB_PATH'] = ''
+os.environ.setdefault('OUTBOUND_GLOBAL_RATE', '1000000')
+os.environ.setdefault('OUTBOUND_GROUP_RATE', '1000000')
+os.environ.setdefault('OUTBOUND_PRIVATE_RATE', '1000000')
+
+from telegram import Update
+from telegram.ext import SimpleUpdateProcessor
+
+import bot
+import metrics
+from benchmarks.fake_api import FakeRequest, FakeTelegramAPI
+from benchmarks.synthetic import callback_update, message_update, poll_answer_update
+from game import (
+    STATE_DISCUSSING, STATE_FINISHED, STATE_PLAYING, STATE_PROCESSING, STATE_REVEALING, STATE_VOTING,
+    STATE_WAITING, add_transition_listener
+)
+from update_processor import ChatUpdateProcessor
+
+TOKEN = '123456:BENCHMARK'
+ADMIN_ID = 1
+
+# Temporizadores tan cortos que vencen a la vez que llegan los botones y comandos equivalentes
+TIMERS = {
+    'ROLE_REVEAL_DELAY': 0.01,
+    'RESULTS_DELAY': 0.01,
+    'DISCUSSION_DURATION': 0.02,
+    'VOTE_DURATION': 0.2,  # Algo más: si vence antes de los votos, la ronda se repite sin eliminar a nadie
+}
+
+# Escenario carrera: la ronda siguiente empieza después de que vuelva la encuesta (--poll-latency)
+RACE_TIMERS = dict(TIMERS, RESULTS_DELAY=0.5)
+
+# Cambios que cada partida hace exactamente una vez y los que hace como mucho una vez por ronda
+ONCE_PER_GAME = {(STATE_WAITING, STATE_REVEALING), (STATE_REVEALING, STATE_PLAYING)}
+ONCE_PER_ROUND = {
+    (STATE_PLAYING, STATE_DISCUSSING), (STATE_DISCUSSING, STATE_VOTING),
+    (STATE_VOTING, STATE_PROCESSING), (STATE_PROCESSING, STATE_PLAYING),
+}
+
+# {game_id: [(ronda, fase anterior, fase nueva)]} de la ejecución en curso
+transitions: Dict[str, List[tuple]] = defaultdict(list)
+
+def log_transition(game, old_state, new_state):
+    transitions[game.game_id].append((game.current_round, old_state, new_state))
+
+add_transition_listener(log_transition)
+
+class _Probe:
+    """Cuenta los updates que se procesan a la vez, en total y por chat, y los que terminan
+    antes que otro anterior del mismo chat"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.in_flight: Dict[int, int] = defaultdict(int)
+        self.max_in_chat = 0
+        self.total_in_flight = 0
+        self.max_total = 0
+        self.last_update_id: Dict[int, int] = {}
+        self.out_of_order = 0
+
+    async def do_process_update(self, update, coroutine):
+        await super().do_process_update(update, self._measured(update, coroutine))
+
+    async def _measured(self, update, coroutine):
+        chat_id = bot.update_chat_id(update)
+        if chat_id is not None:
+            self.in_flight[chat_id] += 1
+            self.max_in_chat = max(self.max_in_chat, self.in_flight[chat_id])
+        self.total_in_flight += 1
+        self.max_total = max(self.max_total, self.total_in_flight)
+        try:
+            await coroutine
+        finally:
+            self.total_in_flight -= 1
+            if chat_id is not None:
+                self.in_flight[chat_id] -= 1
+                if update.update_id < self.last_update_id.get(chat_id, 0):
+                    self.out_of_order += 1
+                self.last_update_id[chat_id] = max(update.update_id, self.last_update_id.get(chat_id, 0))
+
+class ProbedChatProcessor(_Probe, ChatUpdateProcessor):
+    pass
+
+class ProbedSimpleProcessor(_Probe, SimpleUpdateProcessor):
+    pass
+
+def build_processor(mode: str, concurrency: int):
+    if mode == 'chat':
+        # Los mismos cerrojos que los temporizadores de fase, como en build_application
+        return ProbedChatProcessor(concurrency, bot.update_chat_id, bot.chat_locks)
+    if mode == 'libre':
+        return ProbedSimpleProcessor(concurrency)
+    return ProbedSimpleProcessor(1)
+
+class BurstDriver:
+    """Juega una partida enviando ráfagas de updates que compiten entre sí"""
+
+    def __init__(self, application, api: FakeTelegramAPI, players: int, rounds: int, race: bool):
+        self.application = application
+        self.api = api
+        self.players = players
+        self.rounds = rounds
+        self.race = race  # Escenario carrera: "terminar votación" mientras se abre la votación
+        self.races = 0  # Veces que el botón llegó con la votación abierta y su encuesta sin enviar
+
+    async def push(self, *updates: dict):
+        for data in updates:
+            await self.application.update_queue.put(Update.de_json(data, self.application.bot))
+
+    async def wait_for(self, chat_id: int, states, timeout: float = 60):
+        deadline = time.monotonic() + timeout
+        while True:
+            game = bot.active_games.get(chat_id)
+            if game is None or game.state in states:
+                return game
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Chat {chat_id} atascado en {game.state}")
+            await asyncio.sleep(0.002)
+
+    async def play(self, chat_id: int):
+        user_ids = [abs(chat_id) * 100 + i for i in range(self.players)]
+        await self.push(message_update(chat_id, ADMIN_ID, '/start'))
+        deadline = time.monotonic() + 30
+        while chat_id not in self.api.poll_chats or chat_id not in bot.active_games:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Chat {chat_id} sin encuesta de unión")
+            await asyncio.sleep(0.002)
+        join_poll = self.api.poll_chats[chat_id]
+        await self.push(*(poll_answer_update(join_poll, user_id, [0]) for user_id in user_ids + user_ids[:2]))
+        await self.push(
+            callback_update(chat_id, ADMIN_ID, 'continue_game'),
+            callback_update(chat_id, ADMIN_ID, 'impostors_1'),
+            callback_update(chat_id, ADMIN_ID, f'rounds_{self.rounds}'),
+            callback_update(chat_id, ADMIN_ID, f'rounds_{self.rounds}'),  # Doble clic
+        )
+
+        while True:
+            game = await self.wait_for(chat_id, (STATE_PLAYING, STATE_FINISHED))
+            if game is None or game.state == STATE_FINISHED:
+                return
+            if game.current_round > self.rounds:
+                # Rondas sin votos (la votación venció antes): no cuentan para max_rounds
+                await self.push(message_update(chat_id, ADMIN_ID, '/cancel'))
+                await self.wait_for(chat_id, (STATE_FINISHED,))
+                return
+            while game.state == STATE_PLAYING:
+                player = game.current_player
+                if player is None:
+                    # Ya jugaron todos; la discusión empieza tras enviar el resumen
+                    await asyncio.sleep(0.002)
+                    continue
+                await self.push(
+                    message_update(chat_id, player, 'pista'),
+                    message_update(chat_id, player, '/next_player'),
+                    message_update(chat_id, player, '/next_player'),  # Repetido: ya no es su turno
+                )
+                turn = (game.current_round, player)
+                while game.state == STATE_PLAYING and (game.current_round, game.current_player) == turn:
+                    await asyncio.sleep(0.002)
+
+            # /end_meet repetido mientras vence la discusión
+            game = await self.wait_for(chat_id, (STATE_DISCUSSING, STATE_VOTING, STATE_FINISHED))
+            if game is None or game.state == STATE_FINISHED:
+                return
+            if self.race and game.state == STATE_DISCUSSING:
+                await self.race_end_voting(chat_id, game)
+                continue
+            await self.push(*(message_update(chat_id, ADMIN_ID, '/end_meet') for _ in range(3)))
+
+            # Votos y "terminar votación" repetido mientras vence la votación
+            game = await self.wait_for(chat_id, (STATE_VOTING, STATE_PROCESSING, STATE_PLAYING, STATE_FINISHED))
+            if game is None or game.state == STATE_FINISHED:
+                return
+            if game.state == STATE_VOTING:
+                target = next(p for p in game.active_players if p not in game.impostors)
+                option = game.players_order.index(target)
+                await self.push(*(poll_answer_update(game.voting_poll_id, voter, [option]) for voter in game.active_players))
+                await self.push(*(callback_update(chat_id, ADMIN_ID, 'end_voting') for _ in range(3)))
+            await self.wait_for(chat_id, (STATE_PROCESSING, STATE_PLAYING, STATE_FINISHED))
+
+    async def race_end_voting(self, chat_id: int, game):
+        """Envía /end_meet y pulsa 'terminar votación' en cuanto la votación está abierta pero su encuesta aún no"""
+        previous_poll = game.voting_poll_id  # La encuesta de la ronda anterior, si la hubo
+        await self.push(message_update(chat_id, ADMIN_ID, '/end_meet'))
+        deadline = time.monotonic() + 30
+        while game.state == STATE_DISCUSSING:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Chat {chat_id} atascado en {game.state}")
+            await asyncio.sleep(0)
+        if game.state == STATE_VOTING and game.voting_poll_id == previous_poll:
+            self.races += 1
+            await self.push(*(callback_update(chat_id, ADMIN_ID, 'end_voting') for _ in range(3)))
+        # Sin votos la ronda se repite; un juego que no sale de "procesando" se da por atascado
+        await self.wait_for(chat_id, (STATE_PLAYING, STATE_FINISHED), timeout=5)
+
+def check_transitions(game_ids: List[str]) -> Dict[str, int]:
+    """Cuenta partidas sin terminar, cambios que no parten de la fase anterior y cambios repetidos"""
+    problems = Counter()
+    for game_id in game_ids:
+        log = transitions.get(game_id, [])
+        previous = STATE_WAITING
+        seen = Counter()
+        for round_number, old_state, new_state in log:
+            if old_state != previous:
+                problems['perdidos'] += 1
+            previous = new_state
+            if (old_state, new_state) in ONCE_PER_GAME:
+                seen[(old_state, new_state)] += 1
+            elif (old_state, new_state) in ONCE_PER_ROUND:
+                seen[(round_number, old_state, new_state)] += 1
+        if previous != STATE_FINISHED or sum(1 for _, _, new in log if new == STATE_FINISHED) != 1:
+            problems['sin_terminar'] += 1
+        problems['duplicados'] += sum(count - 1 for count in seen.values() if count > 1)
+    return problems
+
+async def run(scenario: str, mode: str, args, offset: int) -> dict:
+    transitions.clear()
+    race = scenario == 'carrera'
+    for name, value in (RACE_TIMERS if race else TIMERS).items():
+        setattr(bot, name, value)
+    api = FakeTelegramAPI(admins=(ADMIN_ID,))
+    processor = build_processor(mode, args.concurrency)
+    request = FakeRequest(api, latency=args.latency, method_latency={'sendPoll': args.poll_latency} if race else None)
+    application = bot.build_application(TOKEN, with_updater=False, request=request, update_processor=processor)
+    errors = []
+
+    async def count_error(update, context):
+        errors.append(context.error)
+
+    application.add_error_handler(count_error)
+    driver = BurstDriver(application, api, args.players, args.rounds, race)
+    chat_ids = [-2000000 - offset - i for i in range(args.chats)]
+    game_ids = []
+
+    async def play(chat_id: int):
+        await driver.play(chat_id)
+
+    def remember_game(game, old_state, new_state):
+        if old_state == STATE_WAITING and new_state == STATE_REVEALING:
+            game_ids.append(game.game_id)
+
+    add_transition_listener(remember_game)
+    async with application:
+        await bot.post_init(application)
+        await application.start()
+        started = time.perf_counter()
+        results = await asyncio.gather(*(play(chat_id) for chat_id in chat_ids), return_exceptions=True)
+        elapsed = time.perf_counter() - started
+        await asyncio.sleep(0.2)  # Terminar las ediciones y temporizadores en curso
+        await application.stop()
+        await bot.post_shutdown(application)
+
+    stuck = [result for result in results if isinstance(result, Exception)]
+    problems = check_transitions(game_ids)
+    return {
+        'elapsed': elapsed,
+        'games': len(game_ids),
+        'stuck': len(stuck),
+        'stuck_example': repr(stuck[0]) if stuck else '',
+        'problems': problems,
+        'errors': len(errors),
+        'error_example': repr(errors[0]) if errors else '',
+        'max_in_chat': processor.max_in_chat,
+        'max_total': processor.max_total,
+        'out_of_order': processor.out_of_order,
+        'races': driver.races,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--players', type=int, default=5)
+    parser.add_argument('--rounds', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=0.005, help='Latencia por llamada a la API (s)')
+    parser.add_argument('--concurrency', type=int, default=256, help='Updates a la vez en los modos concurrentes')
+    parser.add_argument('--modes', nargs='+', default=['chat', 'libre', 'secuencial'], choices=['chat', 'libre', 'secuencial'])
+    parser.add_argument('--scenarios', nargs='+', default=['rafagas', 'carrera'], choices=['rafagas', 'carrera'])
+    parser.add_argument('--poll-latency', type=float, default=0.2, help='Latencia de sendPoll en el escenario carrera (s)')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    failed = False
+    runs = [
+        (scenario, mode) for scenario in args.scenarios for mode in args.modes
+        if not (scenario == 'carrera' and mode == 'secuencial')
+    ]
+    for index, (scenario, mode) in enumerate(runs):
+        result = asyncio.run(run(scenario, mode, args, index * args.chats))
+        problems = result['problems']
+        races = f"  carreras={result['races']}" if scenario == 'carrera' else ''
+        print(
+            f"{scenario:8} {mode:10} {result['elapsed']:6.2f}s  partidas={result['games']}{races}  atascadas={result['stuck']}  "
+            f"cambios perdidos={problems['perdidos']} duplicados={problems['duplicados']} "
+            f"sin terminar={problems['sin_terminar']}  errores={result['errors']}  "
+            f"fuera de orden={result['out_of_order']}  a la vez: por chat={result['max_in_chat']} total={result['max_total']}"
+        )
+        for example in (result['stuck_example'], result['error_example']):
+            if example:
+                print(f"  p. ej.: {example[:200]}")
+        if mode == 'chat':
+            failed = bool(result['stuck'] or result['errors'] or sum(problems.values()) or result['out_of_order'] or result['max_in_chat'] > 1)
+    handler_errors = sum(value for (_, outcome), value in metrics.HANDLER_CALLS.values().items() if outcome == 'error')
+    print(f"Errores en handlers (todos los modos): {handler_errors}")
+    if failed:
+        raise SystemExit("El modo chat perdió, repitió o desordenó cambios")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+"""
+Servidor local que imita la Bot API de Telegram
+Responde a los métodos que usa el bot con objetos sintéticos y sirve getUpdates
+desde una cola, para poder medir el bot sin conectarse a Telegram.
+La misma API se puede usar por HTTP (FakeAPIServer) o dentro del proceso (FakeRequest)
+"""
+
+import asyncio
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Set
+from urllib.parse import parse_qsl
+
+from telegram.request import BaseRequest, RequestData
+
+BOT_USER = {'id': 999999, 'is_bot': True, 'first_name': 'Impostor', 'username': 'impostor_bot'}
+
+def fake_chat(chat_id) -> Dict:
+    chat_id = int(chat_id)
+    return {'id': chat_id, 'type': 'supergroup' if chat_id < 0 else 'private', 'title': f'Grupo {chat_id}'}
+
+def fake_user(user_id) -> Dict:
+    return {'id': int(user_id), 'is_bot': False, 'first_name': f'Jugador{user_id}'}
+
+class FakeTelegramAPI:
+    """Lógica de la API falsa, independiente del transporte (HTTP o en proceso)"""
+
+    def __init__(self, admins=(1,), blocked_users=(), basic_groups=()):
+        self.admins = set(admins)  # Usuarios administradores en todos los grupos
+        self.blocked_users = set(blocked_users)  # Usuarios que no aceptan mensajes privados
+        self.basic_groups = set(basic_groups)  # Grupos normales (no supergrupos): no admiten restrictChatMember
+        self.calls: Dict[str, int] = {}  # {método: número de llamadas}
+        self.trace: Optional[Callable[[str, Dict], None]] = None  # Se llama con cada (método, parámetros)
+        self._message_ids = itertools.count(1000)
+        self._poll_ids = itertools.count(1)
+        self.poll_chats: Dict[int, str] = {}  # {chat_id: id de la última encuesta enviada}
+        self.muted: Dict[int, Set[int]] = {}  # {chat_id: usuarios restringidos sin permiso para escribir}
+        self._lock = threading.Lock()
+
+        # Cola de updates para getUpdates
+        self._updates: List[Dict] = []
+        self._updates_ready = threading.Condition(self._lock)
+
+    def push_update(self, update: Dict):
+        """Encola un update para que lo recoja getUpdates"""
+        with self._updates_ready:
+            self._updates.append(update)
+            self._updates_ready.notify_all()
+
+    def _get_updates(self, params: Dict) -> List[Dict]:
+        offset = int(params.get('offset') or 0)
+        timeout = float(params.get('timeout') or 0)
+        limit = int(params.get('limit') or 100)
+        deadline = time.monotonic() + timeout
+        with self._updates_ready:
+            self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._updates_ready.wait(deadline - time.monotonic())
+            return self._updates[:limit]
+
+    def _message(self, chat_id, **fields) -> Dict:
+        message = {'message_id': next(self._message_ids), 'date': int(time.time()), 'chat': fake_chat(chat_id)}
+        message.update(fields)
+        return message
+
+    def handle(self, method: str, params: Dict):
+        """Ejecuta un método. Retorna (ok, resultado o (código, descripción))"""
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if self.trace:
+            self.trace(method, params)
+
+        if method == 'getUpdates':
+            return True, self._get_updates(params)
+        if method == 'getMe':
+            return True, BOT_USER
+        if method == 'sendMessage':
+            if int(params['chat_id']) in self.blocked_users:
+                return False, (403, 'Forbidden: bot was blocked by the user')
+            return True, self._message(params['chat_id'], text=params.get('text', ''))
+        if method == 'sendPoll':
+            options = params['options']
+            if isinstance(options, str):
+                options = json.loads(options)
+            poll = {
+                'id': str(next(self._poll_ids)),
+                'question': params['question'],
+                'options': [
+                    {'text': o if isinstance(o, str) else o['text'], 'voter_count': 0, 'persistent_id': str(i)}
+                    for i, o in enumerate(options)
+                ],
+                'total_voter_count': 0,
+                'is_closed': False,
+                'is_anonymous': False,
+                'type': 'regular',
+                'allows_multiple_answers': False,
+                'allows_revoting': True,
+                'members_only': False,
+            }
+            self.poll_chats[int(params['chat_id'])] = poll['id']
+            return True, self._message(params['chat_id'], poll=poll)
+        if method == 'stopPoll':
+            return True, {
+                'id': '0', 'question': '', 'options': [], 'total_voter_count': 0, 'is_closed': True,
+                'is_anonymous': False, 'type': 'regular', 'allows_multiple_answers': False,
+                'allows_revoting': True, 'members_only': False,
+            }
+        if method in ('editMessageText', 'editMessageReplyMarkup'):
+            message = self._message(params.get('chat_id', -1), text=params.get('text', ''))
+            if 'message_id' in params:
+                message['message_id'] = int(params['message_id'])
+            return True, message
+        if method == 'restrictChatMember':
+            if int(params['chat_id']) in self.basic_groups:
+                return False, (400, 'Bad Request: method is available only for supergroups')
+            user_id = int(params['user_id'])
+            if user_id in self.admins:
+                return False, (400, 'Bad Request: user is an administrator of the chat')
+            permissions = params['permissions']
+            if isinstance(permissions, str):
+                permissions = json.loads(permissions)
+            with self._lock:
+                muted = self.muted.setdefault(int(params['chat_id']), set())
+                if permissions.get('can_send_messages'):
+                    muted.discard(user_id)
+                else:
+                    muted.add(user_id)
+            return True, True
+        if method == 'getChatAdministrators':
+            return True, [{'status': 'creator', 'user': fake_user(a), 'is_anonymous': False} for a in self.admins]
+        if method == 'getChatMember':
+            user_id = int(params['user_id'])
+            status = 'creator' if user_id in self.admins else 'member'
+            member = {'status': status, 'user': fake_user(user_id)}
+            if status == 'creator':
+                member['is_anonymous'] = False
+            return True, member
+        if method == 'getChat':
+            chat = fake_chat(params['chat_id'])
+            chat.update({'accent_color_id': 0, 'max_reaction_count': 11, 'accepted_gift_types': {
+                'unlimited_gifts': False, 'limited_gifts': False, 'unique_gifts': False,
+                'premium_subscription': False}})
+            return True, chat
+        # deleteMessage, setWebhook, deleteWebhook, answerCallbackQuery, pinChatMessage, ...
+        return True, True
+
+class _BacklogHTTPServer(ThreadingHTTPServer):
+    # Con la cola de conexiones por defecto (5), una ráfaga de conexiones nuevas pierde SYN y
+    # cada reintento del cliente tarda 1s o más
+    request_queue_size = 1024
+
+class FakeAPIServer:
+    """Servidor HTTP en un hilo aparte que expone FakeTelegramAPI en /bot<token>/<método>"""
+
+    def __init__(self, api: Optional[FakeTelegramAPI] = None, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0):
+        self.api = api or FakeTelegramAPI()
+        self.latency = latency  # Retardo artificial por petición (excepto getUpdates)
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Cabeceras y cuerpo van en escrituras separadas: sin TCP_NODELAY, Nagle y el ACK retardado
+            # añaden ~40ms a cada respuesta de una conexión keep-alive
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length).decode() if length else ''
+                if 'json' in (self.headers.get('Content-Type') or ''):
+                    params = json.loads(body or '{}')
+                else:
+                    params = dict(parse_qsl(body))
+                method = self.path.rsplit('/', 1)[-1]
+                if server.latency and method != 'getUpdates':
+                    time.sleep(server.latency)
+
+                ok, result = server.api.handle(method, params)
+                if ok:
+                    payload = {'ok': True, 'result': result}
+                    status = 200
+                else:
+                    status, description = result
+                    payload = {'ok': False, 'error_code': status, 'description': description}
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = _BacklogHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class FakeRequest(BaseRequest):
+    """Transporte en proceso: el Bot real llama a FakeTelegramAPI sin pasar por HTTP"""
+
+    def __init__(self, api: Optional[FakeTelegramAPI] = None, latency: float = 0.0, method_latency: Optional[Dict[str, float]] = None):
+        self.api = api or FakeTelegramAPI()
+        self.latency = latency  # Retardo artificial por llamada (excepto getUpdates)
+        self.method_latency = method_latency or {}  # {método: retardo} que sustituye a latency
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout=None,
+        write_timeout=None,
+        connect_timeout=None,
+        pool_timeout=None,
+    ):
+        api_method = url.rsplit('/', 1)[-1]
+        latency = self.method_latency.get(api_method, self.latency)
+        if latency and api_method != 'getUpdates':
+            await asyncio.sleep(latency)
+        # Los parámetros se pasan por JSON como por la red, para no compartir objetos con el bot
+        params = json.loads(request_data.json_payload) if request_data else {}
+        ok, result = self.api.handle(api_method, params)
+        if ok:
+            return 200, json.dumps({'ok': True, 'result': result}).encode()
+        status, description = result
+        return status, json.dumps({'ok': False, 'error_code': status, 'description': description}).encode()
@@ -0,0 +1,69 @@
+"""
+Memoria y latencia de ImpostorGame con partidas grandes y muchas partidas simultáneas
+
+- Memoria: bytes por partida (tracemalloc) con --games partidas de --players jugadores
+- Turnos: tiempo de una ronda completa (next_player + all_players_played en cada turno)
+  para partidas de 100 a 1000 jugadores, con algunos jugadores ya eliminados
+
+Uso: python -m benchmarks.game_footprint [--games 5000] [--players 8]
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+
+from game import ImpostorGame
+
+def make_game(chat_id: int, players: int) -> ImpostorGame:
+    game = ImpostorGame(chat_id)
+    for user_id in range(1, players + 1):
+        game.add_player(user_id, f"Jugador{user_id}")
+    game.num_impostors = max(1, players // 10)
+    game.assign_roles()
+    return game
+
+def measure_memory(games: int, players: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    alive = [make_game(-i, players) for i in range(1, games + 1)]
+    for game in alive:
+        game.start_new_round()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / len(alive)
+
+def measure_round(players: int, eliminated: int, repeats: int = 20) -> float:
+    """Milisegundos para recorrer todos los turnos de una ronda"""
+    game = make_game(-1, players)
+    for player_id in list(game.players_order)[:eliminated]:
+        game.eliminate_player(player_id)
+    total = 0.0
+    for _ in range(repeats):
+        game.state = 'processing_votes'  # Permite volver a empezar ronda sin pasar por la votación
+        game.start_new_round()
+        started = time.perf_counter()
+        while not game.all_players_played():
+            game.next_player()
+        total += time.perf_counter() - started
+    return total / repeats * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--games', type=int, default=5000)
+    parser.add_argument('--players', type=int, default=8)
+    args = parser.parse_args()
+
+    per_game = measure_memory(args.games, args.players)
+    print(f"Memoria: {per_game / 1024:.1f} KiB por partida de {args.players} jugadores "
+          f"({per_game * args.games / 1024 / 1024:.1f} MiB para {args.games} partidas)")
+    per_game = measure_memory(args.games // 10, 100)
+    print(f"Memoria: {per_game / 1024:.1f} KiB por partida de 100 jugadores")
+
+    for players in (100, 300, 1000):
+        elapsed = measure_round(players, eliminated=players // 10)
+        print(f"Ronda completa con {players} jugadores ({players // 10} eliminados): {elapsed:.2f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+"""
+Carga de miles de partidas simultáneas a través de los handlers reales del bot
+
+Construye la aplicación de bot.py con un transporte en proceso (FakeRequest) que responde como
+la Bot API con una latencia configurable, y juega --chats partidas a la vez con updates
+sintéticos: /start, uniones por la encuesta, configuración con los botones, turnos con texto
+y /next_player, /end_meet, votos por la encuesta y fin de votación. En una de cada
+--secret-word-every partidas el primer jugador de turno dice la palabra secreta, lo que termina
+el juego con victoria de los impostores. Cada partida avanza en orden; las distintas partidas se
+procesan de forma concurrente.
+
+Se informa de updates por segundo, latencia p50/p99 por tipo de update (todos los handlers
+que lo atienden), errores en handlers, llamadas a la API, pico de memoria y partidas terminadas
+sin ganador (no llegarían a /stats ni a /leaderboard).
+
+Uso: python -m benchmarks.game_load [--chats 1000] [--players 6] [--rounds 2] [--latency 0.002] [--secret-word-every 10]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import resource
+import statistics
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List
+
+os.environ['GAME_DB_PATH'] = ''  # Sin persistencia durante el benchmark
+os.environ['STATS_DB_PATH'] = ''
+os.environ.setdefault('OUTBOUND_GLOBAL_RATE', '1000000')  # Medir el bot, no el limitador
+os.environ.setdefault('OUTBOUND_GROUP_RATE', '1000000')
+os.environ.setdefault('OUTBOUND_PRIVATE_RATE', '1000000')
+
+from telegram import Update
+
+import bot
+import metrics
+from benchmarks.fake_api import FakeRequest, FakeTelegramAPI
+from benchmarks.synthetic import callback_update, message_update, poll_answer_update
+from game import STATE_DISCUSSING, STATE_FINISHED, STATE_PLAYING, STATE_VOTING, add_transition_listener
+
+TOKEN = '123456:BENCHMARK'
+ADMIN_ID = 1
+
+# Los temporizadores de fase se acortan para no esperar minutos por partida
+for _name in ('ROLE_REVEAL_DELAY', 'RESULTS_DELAY'):
+    setattr(bot, _name, 0.01)
+
+class GameDriver:
+    """Juega partidas enviando updates sintéticos y midiendo cuánto tarda cada uno"""
+
+    def __init__(self, application, api: FakeTelegramAPI, players: int, rounds: int, messages: int, secret_word_every: int):
+        self.application = application
+        self.api = api
+        self.players = players
+        self.rounds = rounds
+        self.messages = messages  # Mensajes del jugador de turno antes de /next_player
+        self.secret_word_every = secret_word_every  # Una de cada N partidas termina al decir la palabra (0 = ninguna)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)  # {tipo de update: [segundos]}
+        self.finished = 0
+        self.secret_word_chats = set()
+        self.winners: Dict[int, str] = {}  # {chat_id: ganador} de los juegos terminados
+        add_transition_listener(self.record_winner)
+
+    def record_winner(self, game, old_state, new_state):
+        if new_state == STATE_FINISHED:
+            self.winners[game.chat_id] = game.winner
+
+    async def send(self, kind: str, data: dict):
+        update = Update.de_json(data, self.application.bot)
+        started = time.perf_counter()
+        await self.application.process_update(update)
+        self.latencies[kind].append(time.perf_counter() - started)
+
+    async def wait_for(self, chat_id: int, states, timeout: float = 60):
+        """Espera a que el juego llegue a una de las fases (o termine)"""
+        deadline = time.monotonic() + timeout
+        while True:
+            game = bot.active_games.get(chat_id)
+            if game is None or game.state in states:
+                return game
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Chat {chat_id} atascado en {game.state}")
+            await asyncio.sleep(0.005)
+
+    async def play(self, chat_index: int):
+        chat_id = -1000000 - chat_index
+        user_ids = [100000 + chat_index * self.players + i for i in range(self.players)]
+        secret_word = bool(self.secret_word_every) and chat_index % self.secret_word_every == 0
+        if secret_word:
+            self.secret_word_chats.add(chat_id)
+
+        await self.send('start', message_update(chat_id, ADMIN_ID, '/start'))
+        join_poll = self.api.poll_chats[chat_id]
+        for user_id in user_ids:
+            await self.send('join', poll_answer_update(join_poll, user_id, [0]))
+
+        await self.send('callback', callback_update(chat_id, ADMIN_ID, 'continue_game'))
+        await self.send('callback', callback_update(chat_id, ADMIN_ID, 'impostors_1'))
+        await self.send('callback', callback_update(chat_id, ADMIN_ID, f'rounds_{self.rounds}'))
+
+        while True:
+            game = await self.wait_for(chat_id, (STATE_PLAYING, STATE_FINISHED))
+            if game is None or game.state == STATE_FINISHED:
+                break
+            while game.state == STATE_PLAYING:
+                player = game.current_player
+                if secret_word:
+                    await self.send('secret_word', message_update(chat_id, player, f'creo que es {game.current_word}'))
+                    break
+                for i in range(self.messages):
+                    await self.send('turn_text', message_update(chat_id, player, f'pista {i}'))
+                await self.send('next_player', message_update(chat_id, player, '/next_player'))
+
+            game = await self.wait_for(chat_id, (STATE_DISCUSSING,))
+            if game is None:
+                break
+            await self.send('end_meet', message_update(chat_id, ADMIN_ID, '/end_meet'))
+            game = await self.wait_for(chat_id, (STATE_VOTING,))
+            if game is None:
+                break
+
+            # Todos votan al primer ciudadano activo: la partida dura todas las rondas posibles
+            target = next(p for p in game.active_players if p not in game.impostors)
+            option = game.players_order.index(target)
+            poll_id = game.voting_poll_id
+            for voter in list(game.active_players):
+                await self.send('vote', poll_answer_update(poll_id, voter, [option]))
+            await self.send('callback', callback_update(chat_id, ADMIN_ID, 'end_voting'))
+
+        self.finished += 1
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+async def run(args) -> dict:
+    api = FakeTelegramAPI(admins=(ADMIN_ID,))
+    application = bot.build_application(TOKEN, with_updater=False, request=FakeRequest(api, latency=args.latency))
+    driver = GameDriver(application, api, args.players, args.rounds, args.messages, args.secret_word_every)
+    semaphore = asyncio.Semaphore(args.concurrency or args.chats)
+
+    async def play(chat_index: int):
+        async with semaphore:
+            await driver.play(chat_index)
+
+    async with application:
+        await bot.post_init(application)
+        await application.start()
+        started = time.perf_counter()
+        results = await asyncio.gather(*(play(i) for i in range(args.chats)), return_exceptions=True)
+        elapsed = time.perf_counter() - started
+        await application.stop()
+        await bot.post_shutdown(application)
+
+    failures = [r for r in results if isinstance(r, Exception)]
+    for failure in failures[:3]:
+        print(f"  partida fallida: {failure!r}")
+    handler_errors = sum(
+        value for (handler, outcome), value in metrics.HANDLER_CALLS.values().items() if outcome == 'error'
+    )
+    return {
+        'elapsed': elapsed,
+        'latencies': driver.latencies,
+        'finished': driver.finished,
+        'failed': len(failures),
+        'handler_errors': handler_errors,
+        'api_calls': sum(api.calls.values()),
+        'no_winner': sum(1 for winner in driver.winners.values() if winner is None),
+        'secret_word_games': len(driver.secret_word_chats),
+        # Partidas terminadas al decir la palabra que no se anotaron como victoria de los impostores
+        'secret_word_wrong': sum(1 for c in driver.secret_word_chats if driver.winners.get(c) != 'impostor'),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, default=1000, help='Partidas simultáneas')
+    parser.add_argument('--players', type=int, default=6)
+    parser.add_argument('--rounds', type=int, default=2)
+    parser.add_argument('--messages', type=int, default=1, help='Mensajes por turno antes de /next_player')
+    parser.add_argument('--latency', type=float, default=0.002, help='Latencia por llamada a la API (s)')
+    parser.add_argument('--concurrency', type=int, default=0, help='Máximo de partidas a la vez (0 = todas)')
+    parser.add_argument('--secret-word-every', type=int, default=10, help='Una de cada N partidas termina al decir la palabra secreta (0 = ninguna)')
+    parser.add_argument('--tracemalloc', action='store_true', help='Medir también el pico del heap de Python (más lento)')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if args.tracemalloc:
+        tracemalloc.start()
+    result = asyncio.run(run(args))
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KiB en Linux
+
+    latencies = result['latencies']
+    total = sum(len(values) for values in latencies.values())
+    print(
+        f"{args.chats} partidas ({result['finished']} completas, {result['failed']} fallidas)  "
+        f"{total} updates en {result['elapsed']:.2f}s  {total / result['elapsed']:.0f} upd/s  "
+        f"llamadas API={result['api_calls']}  errores en handlers={result['handler_errors']}"
+    )
+    for kind, values in sorted(latencies.items()):
+        print(
+            f"  {kind:12} {len(values):7}  p50={statistics.median(values) * 1000:.2f}ms  "
+            f"p99={percentile(values, 0.99) * 1000:.2f}ms  max={max(values) * 1000:.2f}ms"
+        )
+    all_values = [value for values in latencies.values() for value in values]
+    print(f"  {'total':12} {total:7}  p50={statistics.median(all_values) * 1000:.2f}ms  p99={percentile(all_values, 0.99) * 1000:.2f}ms")
+    print(
+        f"Partidas sin ganador: {result['no_winner']}  "
+        f"palabra secreta: {result['secret_word_games']} ({result['secret_word_wrong']} sin victoria de los impostores)"
+    )
+    print(f"Pico de memoria (RSS): {rss_peak / 1024:.1f} MiB (+{(rss_peak - rss_before) / 1024:.1f} MiB durante la carga)")
+    if args.tracemalloc:
+        print(f"Pico del heap de Python: {tracemalloc.get_traced_memory()[1] / 1024 / 1024:.1f} MiB")
+
+if __name__ == '__main__':
+    main()
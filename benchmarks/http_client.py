@@ -0,0 +1,131 @@
+"""
+Envíos a la Bot API con distintos ajustes del cliente HTTP
+
+Levanta el servidor local que imita la Bot API (con --latency segundos por petición) y, para
+cada configuración, envía --sends mensajes con --concurrency envíos a la vez mientras un bucle
+de getUpdates mantiene un long poll abierto, como en modo polling. Las configuraciones cambian
+el tamaño del pool, el keep-alive y si getUpdates comparte el cliente de los envíos.
+
+Se informa de envíos por segundo, latencia p50/p99 y errores (PoolTimeout aparece como TimedOut).
+El servidor local solo habla HTTP/1.1, así que BOT_HTTP_HTTP2 no se puede medir aquí. Con más de
+unas 20 peticiones en curso el cuello de botella pasa a ser la CPU del propio pool de httpcore,
+que recorre todas sus conexiones cada vez que reparte peticiones en espera.
+
+Uso: python -m benchmarks.http_client [--sends 1500] [--concurrency 16] [--latency 0.05] [--pool-timeout 1]
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import statistics
+import time
+from collections import Counter
+from typing import Dict, List
+
+from telegram.ext import ExtBot
+
+from benchmarks.fake_api import FakeAPIServer, FakeTelegramAPI
+from config import BOT_HTTP, UPDATES_HTTP
+from telegram_http import build_request
+
+TOKEN = '123456:BENCHMARK'
+
+def serve(latency: float, urls, stop):
+    """Servidor local en un proceso aparte: en el mismo proceso, sus hilos y el event loop del
+    cliente se disputan el GIL y la latencia medida sería la del intérprete"""
+    server = FakeAPIServer(FakeTelegramAPI(), latency=latency).start()
+    urls.put(server.url)
+    stop.wait()
+    server.stop()
+
+def configurations(args) -> List[tuple]:
+    """(nombre, ajustes del cliente de envíos, getUpdates comparte ese cliente)"""
+    base = dict(BOT_HTTP, http2=False, pool_timeout=args.pool_timeout)
+    return [
+        ('compartido, pool=8', dict(base, pool_size=8, keepalive=8), True),
+        ('pool=8', dict(base, pool_size=8, keepalive=8), False),
+        ('pool=32', dict(base, pool_size=32, keepalive=32), False),
+        ('pool=64', dict(base, pool_size=64, keepalive=64), False),
+        ('pool=256', dict(base, pool_size=256, keepalive=256), False),
+        ('pool=256 sin keep-alive', dict(base, pool_size=256, keepalive=0), False),
+    ]
+
+async def long_poll(bot: ExtBot, stop: asyncio.Event, timeout: float, polls: List[int]):
+    """Mantiene siempre un getUpdates en curso, como el Updater"""
+    while not stop.is_set():
+        try:
+            await bot.get_updates(timeout=timeout)
+            polls[0] += 1
+        except Exception:
+            await asyncio.sleep(0.1)
+
+async def measure(url: str, settings: Dict, shared: bool, args) -> dict:
+    request = build_request(settings)
+    updates_request = request if shared else build_request(dict(UPDATES_HTTP, http2=False))
+    bot = ExtBot(TOKEN, base_url=f"{url}/bot", request=request, get_updates_request=updates_request)
+    latencies: List[float] = []
+    errors: Counter = Counter()
+    polls = [0]
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def send(index: int):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await bot.send_message(-1000 - index % 100, f"mensaje {index}")
+            except Exception as e:
+                errors[type(e).__name__] += 1
+                return
+            latencies.append(time.perf_counter() - started)
+
+    async with bot:
+        stop = asyncio.Event()
+        poller = asyncio.create_task(long_poll(bot, stop, args.poll_timeout, polls))
+        await asyncio.sleep(0.05)  # Que el long poll ya esté abierto
+        started = time.perf_counter()
+        await asyncio.gather(*(send(i) for i in range(args.sends)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await poller
+
+    latencies.sort()
+    return {
+        'elapsed': elapsed,
+        'sent': len(latencies),
+        'p50': statistics.median(latencies) if latencies else 0.0,
+        'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0.0,
+        'errors': dict(errors),
+        'polls': polls[0],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sends', type=int, default=1500, help='Mensajes enviados por configuración')
+    parser.add_argument('--concurrency', type=int, default=16, help='Envíos a la vez')
+    parser.add_argument('--latency', type=float, default=0.05, help='Latencia por petición del servidor local (s)')
+    parser.add_argument('--pool-timeout', type=float, default=1.0, help='Espera máxima por una conexión libre (s)')
+    parser.add_argument('--poll-timeout', type=float, default=1.0, help='Duración de cada long poll de getUpdates (s)')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    context = multiprocessing.get_context('spawn')
+    urls, stop = context.Queue(), context.Event()
+    process = context.Process(target=serve, args=(args.latency, urls, stop), daemon=True)
+    process.start()
+    url = urls.get(timeout=30)
+    print(f"{args.sends} envíos, {args.concurrency} a la vez, {args.latency * 1000:.0f}ms por petición, pool_timeout={args.pool_timeout}s")
+    try:
+        for name, settings, shared in configurations(args):
+            result = asyncio.run(measure(url, settings, shared, args))
+            errors = ', '.join(f"{kind}={count}" for kind, count in sorted(result['errors'].items())) or '0'
+            print(
+                f"  {name:24} {result['elapsed']:6.2f}s  {result['sent'] / result['elapsed']:6.0f} envíos/s  "
+                f"p50={result['p50'] * 1000:7.1f}ms  p99={result['p99'] * 1000:7.1f}ms  errores: {errors}  long polls={result['polls']}"
+            )
+    finally:
+        stop.set()
+        process.join(5)
+
+if __name__ == '__main__':
+    main()
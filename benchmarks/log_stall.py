@@ -0,0 +1,172 @@
+"""
+Bloqueos del event loop por los logs durante una avalancha de votos
+
+Pone --chats juegos en votación con --players jugadores y los hace votar a la vez (cada
+jugador cambia de voto --changes veces) a través de los handlers reales del bot, a --rate
+votos por segundo en total (0 = tan rápido como se pueda). Mientras, una tarea mide cuánto
+se retrasa el event loop respecto a un tic de 1 ms.
+
+Los logs van a un destino lento (--sink-latency por escritura, como un stderr que la
+plataforma de logs lee con retraso) y se comparan tres configuraciones:
+- sync: StreamHandler escribiendo desde el event loop (el logging.basicConfig de antes)
+- cola: log_pipeline sin muestreo
+- cola+muestreo: log_pipeline con LOG_SAMPLE_RATE
+
+Uso: python -m benchmarks.log_stall [--chats 50] [--players 40] [--rate 2000] [--sink-latency 0.0005]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+from typing import List
+
+os.environ['GAME_DB_PATH'] = ''  # Sin persistencia durante el benchmark
+os.environ['STATS_DB_PATH'] = ''
+os.environ.setdefault('OUTBOUND_GLOBAL_RATE', '1000000')
+os.environ.setdefault('OUTBOUND_GROUP_RATE', '1000000')
+os.environ.setdefault('OUTBOUND_PRIVATE_RATE', '1000000')
+
+from telegram import Update
+
+import bot
+import log_pipeline
+from benchmarks.fake_api import FakeRequest, FakeTelegramAPI
+from benchmarks.synthetic import message_update, poll_answer_update
+from game import STATE_DISCUSSING, ImpostorGame
+
+TOKEN = '123456:BENCHMARK'
+ADMIN_ID = 1
+
+class SlowSink:
+    """Destino de logs que tarda `latency` segundos en cada escritura"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.lines = 0
+        self._devnull = open(os.devnull, 'w')
+
+    def write(self, text: str):
+        time.sleep(self.latency)
+        self.lines += text.count('\n')
+        self._devnull.write(text)
+
+    def flush(self):
+        pass
+
+def use_sync_logging(sink: SlowSink):
+    """Configuración anterior: el handler escribe en el mismo hilo que el event loop"""
+    log_pipeline.stop_logging()
+    handler = logging.StreamHandler(sink)
+    handler.setFormatter(logging.Formatter(log_pipeline.TEXT_FORMAT))
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+async def monitor_loop(lags: List[float], stop: asyncio.Event, tick: float = 0.001):
+    """Mide el retraso de cada tic respecto a lo pedido"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(tick)
+        lags.append(max(0.0, time.perf_counter() - started - tick))
+
+def discussing_game(chat_id: int, user_ids: List[int]) -> ImpostorGame:
+    """Juego ya en discusión, listo para que /end_meet abra la votación"""
+    game = ImpostorGame(chat_id)
+    for user_id in user_ids:
+        game.add_player(user_id, f"Jugador{user_id}")
+    game.assign_roles()
+    game.start_new_round()
+    game.transition(STATE_DISCUSSING)
+    return game
+
+async def storm(application, api: FakeTelegramAPI, args, offset: int) -> float:
+    """Abre la votación en todos los juegos y envía los votos. Retorna los segundos que tardó"""
+
+    async def send(data: dict):
+        await application.process_update(Update.de_json(data, application.bot))
+
+    async def vote_in(chat_index: int):
+        chat_id = -1000000 - offset - chat_index
+        user_ids = [100000 + (offset + chat_index) * args.players + i for i in range(args.players)]
+        bot.active_games[chat_id] = game = discussing_game(chat_id, user_ids)
+        await send(message_update(chat_id, ADMIN_ID, '/end_meet'))
+        poll_id = game.voting_poll_id
+        interval = args.chats / args.rate if args.rate else 0  # Cada juego envía su parte del ritmo total
+        next_at = time.perf_counter()
+        for change in range(args.changes + 1):
+            for position, user_id in enumerate(user_ids):
+                await send(poll_answer_update(poll_id, user_id, [(position + change) % args.players]))
+                if interval:
+                    next_at += interval
+                    await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+        bot.active_games.pop(chat_id, None)
+        bot.unregister_poll(poll_id)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(vote_in(i) for i in range(args.chats)))
+    return time.perf_counter() - started
+
+async def run_mode(mode: str, args, offset: int) -> dict:
+    sink = SlowSink(args.sink_latency)
+    if mode == 'sync':
+        use_sync_logging(sink)
+    else:
+        rate = args.sample_rate if mode == 'cola+muestreo' else 0
+        log_pipeline.setup_logging('INFO', 'text', bot.SAMPLED_LOG_EVENTS, rate, args.queue_size, stream=sink)
+
+    api = FakeTelegramAPI(admins=(ADMIN_ID,))
+    application = bot.build_application(TOKEN, with_updater=False, request=FakeRequest(api, latency=args.latency))
+    lags: List[float] = []
+    stop = asyncio.Event()
+    async with application:
+        await bot.post_init(application)
+        await application.start()
+        monitor = asyncio.create_task(monitor_loop(lags, stop))
+        elapsed = await storm(application, api, args, offset)
+        stop.set()
+        await monitor
+        await application.stop()
+        await bot.post_shutdown(application)
+    log_pipeline.stop_logging()  # Espera a que se escriba lo encolado
+
+    lags.sort()
+    return {
+        'elapsed': elapsed,
+        'p50': statistics.median(lags) if lags else 0.0,
+        'p99': lags[min(len(lags) - 1, int(len(lags) * 0.99))] if lags else 0.0,
+        'max': lags[-1] if lags else 0.0,
+        'lines': sink.lines,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, default=50, help='Juegos votando a la vez')
+    parser.add_argument('--players', type=int, default=40)
+    parser.add_argument('--changes', type=int, default=2, help='Veces que cada jugador cambia de voto')
+    parser.add_argument('--rate', type=float, default=2000, help='Votos por segundo entre todos los juegos (0 = sin límite)')
+    parser.add_argument('--sink-latency', type=float, default=0.0005, help='Segundos por escritura en el destino de logs')
+    parser.add_argument('--sample-rate', type=float, default=5, help='LOG_SAMPLE_RATE del modo con muestreo')
+    parser.add_argument('--queue-size', type=int, default=10000)
+    parser.add_argument('--latency', type=float, default=0.0, help='Latencia por llamada a la API (s)')
+    args = parser.parse_args()
+
+    votes = args.chats * args.players * (args.changes + 1)
+    print(f"{args.chats} juegos x {args.players} jugadores, {votes} votos, {args.sink_latency * 1000:.2f}ms por línea de log")
+    for index, mode in enumerate(('sync', 'cola', 'cola+muestreo')):
+        result = asyncio.run(run_mode(mode, args, index * args.chats))
+        print(
+            f"  {mode:14} {result['elapsed']:6.2f}s  {votes / result['elapsed']:7.0f} votos/s  "
+            f"retraso del loop p50={result['p50'] * 1000:.2f}ms p99={result['p99'] * 1000:.2f}ms "
+            f"max={result['max'] * 1000:.1f}ms  líneas escritas={result['lines']}"
+        )
+    dropped = log_pipeline.LOG_DROPPED.values()
+    if dropped:
+        print("Registros descartados: " + ', '.join(f"{reason}/{event}={int(count)}" for (reason, event), count in sorted(dropped.items())))
+
+if __name__ == '__main__':
+    main()
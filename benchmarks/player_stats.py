@@ -0,0 +1,107 @@
+"""
+Coste de las estadísticas de jugadores con muchas partidas registradas
+
+Suma --games partidas sintéticas (--players jugadores de un total de --users, repartidas entre
+--chats grupos) a un StatsStore en un fichero temporal, en lotes de --batch como hace el bot.
+En cada punto de --checkpoints se informa de las partidas sumadas por segundo y de la latencia
+p50/p99 de las consultas de /stats (un jugador en su grupo y global) y de /leaderboard (un grupo
+y global), que deben mantenerse planas aunque crezca el número de partidas. Al final se muestra
+el plan de SQLite de la clasificación (debe usar el índice player_stats_ranking sin ordenar).
+
+Uso: python -m benchmarks.player_stats [--games 100000] [--checkpoints 1000 10000 100000] [--chats 1000]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Callable, List
+
+from player_stats import GLOBAL_CHAT, LEADERBOARD_QUERY, GameResult, StatsStore
+
+def synthetic_results(count: int, start: int, args, rng: random.Random) -> List[GameResult]:
+    results = []
+    for index in range(start, start + count):
+        chat_id = -1000000 - rng.randrange(args.chats)
+        user_ids = rng.sample(range(1, args.users + 1), args.players)
+        winner = rng.choice(('impostor', 'citizen'))
+        impostor = user_ids[0]
+        caught = winner == 'citizen'
+        rows = [
+            (
+                user_id, f"Jugador{user_id}",
+                int(user_id == impostor and winner == 'impostor'),
+                int(user_id != impostor and winner == 'citizen'),
+                int(user_id == impostor and caught),
+                0 if user_id == impostor else rng.randint(0, 2),
+            )
+            for user_id in user_ids
+        ]
+        results.append(GameResult(f"juego-{index}", chat_id, winner, time.time(), rows))
+    return results
+
+def latencies(query: Callable, samples: int) -> tuple:
+    """(p50, p99) en milisegundos"""
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        query()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--games', type=int, default=100000, help='Partidas sumadas en total')
+    parser.add_argument('--checkpoints', type=int, nargs='+', default=[1000, 10000, 100000], help='Partidas tras las que se mide')
+    parser.add_argument('--chats', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=50000, help='Jugadores distintos')
+    parser.add_argument('--players', type=int, default=6, help='Jugadores por partida')
+    parser.add_argument('--batch', type=int, default=200, help='Partidas por lote de escritura')
+    parser.add_argument('--samples', type=int, default=500, help='Consultas por medición')
+    args = parser.parse_args()
+    rng = random.Random(1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = StatsStore(os.path.join(directory, 'stats.db'))
+        store.open()
+        print(f"{args.chats} grupos, {args.users} jugadores, {args.players} por partida, lotes de {args.batch}")
+        recorded = 0
+        for checkpoint in sorted(c for c in args.checkpoints if c <= args.games):
+            added = checkpoint - recorded
+            started = time.perf_counter()
+            while recorded < checkpoint:
+                count = min(args.batch, checkpoint - recorded)
+                store._write_batch(synthetic_results(count, recorded, args, rng))
+                recorded += count
+            elapsed = time.perf_counter() - started
+
+            chat_ids = [-1000000 - rng.randrange(args.chats) for _ in range(args.samples)]
+            user_ids = [rng.randint(1, args.users) for _ in range(args.samples)]
+            lookups = iter(zip(chat_ids * 4, user_ids * 4))
+            chat_player = latencies(lambda: store._read_player(*next(lookups)), args.samples)
+            global_player = latencies(lambda: store._read_player(GLOBAL_CHAT, next(lookups)[1]), args.samples)
+            chat_top = latencies(lambda: store._read_leaderboard(next(lookups)[0], 10), args.samples)
+            global_top = latencies(lambda: store._read_leaderboard(GLOBAL_CHAT, 10), args.samples)
+            size = os.path.getsize(store.path) + os.path.getsize(store.path + '-wal')
+            print(
+                f"  {recorded:8} partidas  {added / elapsed if added else 0:7.0f} partidas/s al sumar  "
+                f"fichero={size / 2 ** 20:6.1f} MiB"
+            )
+            print(
+                f"           /stats grupo p50={chat_player[0]:.3f}ms p99={chat_player[1]:.3f}ms  "
+                f"global p50={global_player[0]:.3f}ms p99={global_player[1]:.3f}ms"
+            )
+            print(
+                f"           /leaderboard grupo p50={chat_top[0]:.3f}ms p99={chat_top[1]:.3f}ms  "
+                f"global p50={global_top[0]:.3f}ms p99={global_top[1]:.3f}ms"
+            )
+
+        plan = store._conn.execute(f"EXPLAIN QUERY PLAN {LEADERBOARD_QUERY}", (GLOBAL_CHAT, 10)).fetchall()
+        print("Plan de /leaderboard: " + "; ".join(row[-1] for row in plan))
+        store.close()
+
+if __name__ == '__main__':
+    main()
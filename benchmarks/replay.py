@@ -0,0 +1,202 @@
+"""
+Reproduce una grabación de updates (RECORD_UPDATES_PATH) a través de los handlers del bot
+
+Los updates grabados se envían a la aplicación real de bot.py, con la API falsa en proceso en
+lugar de Telegram, respetando los tiempos entre updates divididos por --speed. Los temporizadores
+del juego (los grabados al arrancar el bot) se aceleran en la misma proporción, así que la
+partida avanza igual que se grabó:
+- Cada juego nuevo usa la semilla grabada (mismos roles y orden de turnos) y la palabra grabada
+- Las respuestas a encuestas se enlazan con las encuestas que crea el bot al reproducir
+- Son administradores los usuarios que usaron comandos o botones de admin (o --admins)
+
+Sirve para reproducir incidencias (--chat para un solo grupo, --trace para ver cada llamada
+a la API) y para repetir la forma de la carga de producción a mayor velocidad.
+
+Uso: python -m benchmarks.replay updates.jsonl.gz [updates-w1.jsonl.gz ...] [--speed 20] [--chat -100123]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from typing import Dict, List, Optional
+
+os.environ['GAME_DB_PATH'] = ''  # La reproducción no toca la base de datos
+os.environ['STATS_DB_PATH'] = ''
+os.environ['RECORD_UPDATES_PATH'] = ''  # Ni se graba a sí misma
+os.environ.setdefault('OUTBOUND_GLOBAL_RATE', '1000000')
+os.environ.setdefault('OUTBOUND_GROUP_RATE', '1000000')
+os.environ.setdefault('OUTBOUND_PRIVATE_RATE', '1000000')
+
+from telegram import Update
+
+import bot
+import metrics
+from benchmarks.fake_api import FakeRequest, FakeTelegramAPI
+from recorder import read_recording
+
+TOKEN = '123456:REPLAY'
+
+ADMIN_COMMANDS = ('/start', '/cancel', '/end_meet', '/pack')
+
+def update_chat(data: Dict, poll_chats: Dict[str, int]) -> Optional[int]:
+    """Chat al que pertenece un update grabado (las respuestas a encuestas, por su encuesta)"""
+    if 'message' in data:
+        return data['message']['chat']['id']
+    if 'callback_query' in data:
+        message = data['callback_query'].get('message')
+        return message['chat']['id'] if message else None
+    if 'poll_answer' in data:
+        return poll_chats.get(data['poll_answer']['poll_id'])
+    if 'chat_member' in data:
+        return data['chat_member']['chat']['id']
+    return None
+
+def recorded_admins(updates: List[Dict]) -> set:
+    """Usuarios que usaron comandos o botones de administrador en la grabación"""
+    admins = set()
+    for data in updates:
+        if 'callback_query' in data:
+            admins.add(data['callback_query']['from']['id'])
+        elif 'message' in data:
+            text = data['message'].get('text') or ''
+            command = text.split()[0].split('@')[0] if text.startswith('/') else ''
+            if command in ADMIN_COMMANDS and (command != '/pack' or len(text.split()) > 1):
+                admins.add(data['message']['from']['id'])
+    return admins
+
+class Replayer:
+    def __init__(self, events: List[Dict], speed: float, latency: float, admins=None, trace: bool = False):
+        self.speed = speed
+        self.seeds: Dict[int, deque] = defaultdict(deque)  # {chat_id: semillas en orden}
+        self.words: Dict[int, deque] = defaultdict(deque)  # {chat_id: palabras en orden}
+        self.recorded_polls: Dict[int, deque] = defaultdict(deque)  # {chat_id: poll_ids grabados en orden}
+        self.poll_map: Dict[str, str] = {}  # {poll_id grabado: poll_id de la reproducción}
+        self.updates: List[tuple] = []  # [(t, update)]
+        self.settings = bot.timing_settings()  # Se sustituyen por los grabados
+        for event in events:
+            if 'settings' in event:
+                self.settings.update(event['settings'])
+            elif 'seed' in event:
+                self.seeds[event['seed']['chat_id']].append(event['seed']['seed'])
+            elif 'word' in event:
+                self.words[event['word']['chat_id']].append(event['word']['word'])
+            elif 'poll' in event:
+                self.recorded_polls[event['poll']['chat_id']].append(event['poll']['poll_id'])
+            elif 'update' in event:
+                self.updates.append((event['t'], event['update']))
+
+        self.api = FakeTelegramAPI(admins=admins if admins is not None else recorded_admins([u for _, u in self.updates]))
+        if trace:
+            self.api.trace = self._trace
+        self.application = bot.build_application(TOKEN, with_updater=False, request=FakeRequest(self.api, latency=latency))
+        self.max_lag = 0.0
+
+    @staticmethod
+    def _trace(method: str, params: Dict):
+        if method in ('getUpdates', 'getMe'):
+            return
+        text = params.get('text') or params.get('question') or ''
+        print(f"  -> {method} chat={params.get('chat_id', '')} {text[:70]!r}")
+
+    def _next_seed(self, chat_id: int) -> Optional[int]:
+        seeds = self.seeds.get(chat_id)
+        return seeds.popleft() if seeds else None
+
+    def _next_word(self, chat_id: int) -> Optional[str]:
+        words = self.words.get(chat_id)
+        return words.popleft() if words else None
+
+    def _on_poll(self, event: str, poll_id: str, chat_id: int):
+        """Enlaza cada encuesta nueva con la que se grabó en el mismo lugar del mismo chat"""
+        recorded = self.recorded_polls.get(chat_id)
+        if event == "register" and recorded:
+            self.poll_map[recorded.popleft()] = poll_id
+
+    def _prepare(self, data: Dict) -> Update:
+        answer = data.get('poll_answer')
+        if answer and answer['poll_id'] in self.poll_map:
+            data = dict(data, poll_answer=dict(answer, poll_id=self.poll_map[answer['poll_id']]))
+        return Update.de_json(data, self.application.bot)
+
+    async def run(self, tail: float) -> float:
+        """Reproduce todos los updates. Retorna los segundos que tardó"""
+        for name, value in self.settings.items():
+            if name == 'STATUS_EDIT_INTERVAL':
+                bot.status_board.min_interval = value / self.speed
+            else:
+                setattr(bot, name, value / self.speed)
+        bot.game_seed_source = self._next_seed
+        bot.game_word_source = self._next_word
+        bot.poll_listeners.append(self._on_poll)
+
+        async with self.application:
+            await bot.post_init(self.application)
+            await self.application.start()
+            started = time.perf_counter()
+            first = self.updates[0][0] if self.updates else 0.0
+            for recorded_at, data in self.updates:
+                due = started + (recorded_at - first) / self.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    self.max_lag = max(self.max_lag, -delay)
+                await self.application.process_update(self._prepare(data))
+            # Dejar que venzan los temporizadores pendientes (fin de votación, siguiente ronda...)
+            await asyncio.sleep(tail / self.speed)
+            elapsed = time.perf_counter() - started
+            await self.application.stop()
+            await bot.post_shutdown(self.application)
+        return elapsed
+
+def load_events(paths: List[str], chat: Optional[int]) -> List[Dict]:
+    events = [event for path in paths for event in read_recording(path)]
+    events.sort(key=lambda event: event['t'])
+    if chat is None:
+        return events
+    poll_chats = {e['poll']['poll_id']: e['poll']['chat_id'] for e in events if 'poll' in e}
+    selected = []
+    for event in events:
+        if 'update' in event:
+            if update_chat(event['update'], poll_chats) == chat:
+                selected.append(event)
+        elif 'settings' in event or event.get('seed', event.get('word', event.get('poll', {}))).get('chat_id') == chat:
+            selected.append(event)
+    return selected
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('recordings', nargs='+', help='Ficheros .jsonl.gz grabados (uno por worker en modo multiproceso)')
+    parser.add_argument('--speed', type=float, default=20, help='Factor de aceleración de tiempos y temporizadores')
+    parser.add_argument('--chat', type=int, help='Reproducir solo este chat')
+    parser.add_argument('--admins', type=int, nargs='*', help='Administradores (por defecto, los deducidos de la grabación)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Latencia por llamada a la API (s)')
+    parser.add_argument('--tail', type=float, default=60, help='Segundos grabados que se esperan tras el último update')
+    parser.add_argument('--trace', action='store_true', help='Mostrar cada llamada a la API')
+    parser.add_argument('--verbose', action='store_true', help='Mostrar los logs del bot')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    events = load_events(args.recordings, args.chat)
+    admins = set(args.admins) if args.admins is not None else None
+    replayer = Replayer(events, args.speed, args.latency, admins=admins, trace=args.trace)
+    if not replayer.updates:
+        print("La grabación no tiene updates")
+        return
+    elapsed = asyncio.run(replayer.run(args.tail))
+
+    recorded_span = replayer.updates[-1][0] - replayer.updates[0][0]
+    handler_errors = sum(value for (_, outcome), value in metrics.HANDLER_CALLS.values().items() if outcome == 'error')
+    print(
+        f"{len(replayer.updates)} updates ({recorded_span:.0f}s grabados) reproducidos en {elapsed:.2f}s "
+        f"a x{args.speed:g}  retraso máximo={replayer.max_lag * 1000:.0f}ms  errores en handlers={handler_errors}"
+    )
+    print("Llamadas a la API: " + ', '.join(f"{method}={count}" for method, count in sorted(replayer.api.calls.items())))
+    for chat_id, game in sorted(bot.active_games.items()):
+        print(f"  juego sin terminar en {chat_id}: {game.state} (ronda {game.current_round}/{game.max_rounds})")
+
+if __name__ == '__main__':
+    main()
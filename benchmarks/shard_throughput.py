@@ -0,0 +1,110 @@
+"""
+Rendimiento del modo multiproceso según el número de workers
+
+Levanta un servidor local que imita la Bot API (con una latencia artificial por llamada) y
+reparte, a través del router del proceso frontal, el tráfico de muchos grupos: /start, las
+respuestas a la encuesta de unión y una ráfaga de mensajes y /check_game por grupo.
+Se mide cuánto tardan los workers en procesarlo todo.
+
+Uso: python -m benchmarks.shard_throughput [--chats 200] [--players 6] [--messages 20] [--workers 1 2 4]
+"""
+
+import argparse
+import logging
+import os
+import time
+
+os.environ['GAME_DB_PATH'] = ''  # Sin persistencia durante el benchmark (lo heredan los workers)
+os.environ['STATS_DB_PATH'] = ''
+os.environ.setdefault('OUTBOUND_GLOBAL_RATE', '1000000')  # Medir el bot, no el limitador
+os.environ.setdefault('OUTBOUND_GROUP_RATE', '1000000')
+
+from telegram import Update
+
+from benchmarks.fake_api import FakeAPIServer, FakeTelegramAPI
+from benchmarks.synthetic import message_update, poll_answer_update
+from sharding import ShardCluster
+
+TOKEN = '123456:BENCHMARK'
+ADMIN_ID = 1
+
+def wait_until(condition, timeout: float, what: str):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Tiempo agotado esperando {what}")
+        time.sleep(0.01)
+
+def send(cluster: ShardCluster, data: dict):
+    cluster.router.route(Update.de_json(data, None))
+
+def processed(cluster: ShardCluster) -> int:
+    cluster.stats.clear()
+    cluster.request_stats()
+    wait_until(lambda: len(cluster.stats) == cluster.workers, 30, "estadísticas de los workers")
+    return sum(cluster.stats.values())
+
+def measure(workers: int, chats: int, players: int, messages: int, latency: float) -> dict:
+    api = FakeTelegramAPI(admins=(ADMIN_ID,))
+    server = FakeAPIServer(api, latency=latency).start()
+    cluster = ShardCluster(TOKEN, workers, base_url=server.url)
+    cluster.start()
+    try:
+        wait_until(lambda: len(cluster.ready_workers) == workers, 60, "el arranque de los workers")
+        chat_ids = [-100000 - i for i in range(chats)]
+        sent = 0
+
+        started = time.perf_counter()
+        for chat_id in chat_ids:
+            send(cluster, message_update(chat_id, ADMIN_ID, '/start'))
+            sent += 1
+        # Las respuestas a la encuesta se enrutan con el poll_id que informan los workers
+        wait_until(lambda: len(cluster.router.poll_routes) >= chats, 60, "las encuestas de unión")
+
+        for chat_id in chat_ids:
+            poll_id = api.poll_chats[chat_id]
+            for player in range(players):
+                send(cluster, poll_answer_update(poll_id, 10 + player, [0]))
+                sent += 1
+            for i in range(messages):
+                text = '/check_game' if i % 5 == 0 else f'mensaje {i}'
+                send(cluster, message_update(chat_id, 10 + i % players, text))
+                sent += 1
+
+        wait_until(lambda: processed(cluster) >= sent, 300, "el procesamiento de los updates")
+        elapsed = time.perf_counter() - started
+    finally:
+        cluster.stop()
+        server.stop()
+
+    return {
+        'workers': workers,
+        'updates': sent,
+        'elapsed_s': elapsed,
+        'updates_per_s': sent / elapsed,
+        'api_calls': sum(api.calls.values()),
+        'broadcast': cluster.router.counters['broadcast'],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--players', type=int, default=6)
+    parser.add_argument('--messages', type=int, default=20, help='Mensajes por grupo tras unirse')
+    parser.add_argument('--latency', type=float, default=0.005, help='Latencia por llamada a la API (s)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    baseline = None
+    for workers in args.workers:
+        result = measure(workers, args.chats, args.players, args.messages, args.latency)
+        baseline = baseline or result['updates_per_s']
+        print(
+            f"{result['workers']} worker(s)  {result['updates']} updates en {result['elapsed_s']:.2f}s  "
+            f"{result['updates_per_s']:.0f} upd/s  x{result['updates_per_s'] / baseline:.2f}  "
+            f"llamadas API={result['api_calls']}  difundidos={result['broadcast']}"
+        )
+
+if __name__ == '__main__':
+    main()
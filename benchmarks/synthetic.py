@@ -0,0 +1,58 @@
+"""
+Fábricas de updates sintéticos en formato JSON de la Bot API
+"""
+
+import itertools
+import time
+from typing import Dict, List, Optional
+
+from benchmarks.fake_api import fake_chat, fake_user
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+def next_update_id() -> int:
+    return next(_update_ids)
+
+def message_update(chat_id: int, user_id: int, text: str, update_id: Optional[int] = None) -> Dict:
+    """Mensaje de texto; si empieza por / se marca como comando"""
+    message = {
+        'message_id': next(_message_ids),
+        'date': int(time.time()),
+        'chat': fake_chat(chat_id),
+        'from': fake_user(user_id),
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id or next_update_id(), 'message': message}
+
+def poll_answer_update(poll_id: str, user_id: int, option_ids: List[int], update_id: Optional[int] = None) -> Dict:
+    """Respuesta (o retirada, con option_ids vacío) a una encuesta"""
+    return {
+        'update_id': update_id or next_update_id(),
+        'poll_answer': {
+            'poll_id': poll_id,
+            'user': fake_user(user_id),
+            'option_ids': option_ids,
+            'option_persistent_ids': [str(option) for option in option_ids],
+        },
+    }
+
+def callback_update(chat_id: int, user_id: int, data: str, update_id: Optional[int] = None) -> Dict:
+    """Pulsación de un botón inline"""
+    return {
+        'update_id': update_id or next_update_id(),
+        'callback_query': {
+            'id': str(next(_message_ids)),
+            'from': fake_user(user_id),
+            'chat_instance': str(chat_id),
+            'data': data,
+            'message': {
+                'message_id': next(_message_ids),
+                'date': int(time.time()),
+                'chat': fake_chat(chat_id),
+                'text': '',
+            },
+        },
+    }
@@ -0,0 +1,218 @@
+"""
+Coste en llamadas a la API de cada forma de hacer respetar los turnos
+
+Juega --chats partidas con --players jugadores por los handlers reales del bot, una vez con cada
+modo de /turn_mode. Durante cada turno, cada jugador sin turno intenta escribir --noise mensajes
+repartidos a lo largo de --turn-duration segundos, y --spectators miembros que no juegan escriben
+uno cada uno. En el modo "mute" la API falsa no entrega los mensajes de los jugadores silenciados
+(Telegram ni siquiera deja enviarlos).
+
+Se informa, por modo, de las llamadas a la API hechas para respetar los turnos por ronda
+(borrados, avisos y cambios de permisos), de los mensajes fuera de turno que llegaron al bot
+y de las llamadas totales a la API por ronda. Con --basic-groups, esas partidas se juegan en
+grupos normales, donde Telegram no deja silenciar: el modo "mute" debe volver a "delete" con el
+primer intento y no insistir jugador por jugador.
+
+Uso: python -m benchmarks.turn_enforcement [--chats 50] [--players 8] [--rounds 2] [--noise 2] [--spectators 0] [--basic-groups 0]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import Dict
+
+os.environ['GAME_DB_PATH'] = ''  # Sin persistencia durante el benchmark
+os.environ['STATS_DB_PATH'] = ''
+os.environ.setdefault('OUTBOUND_GLOBAL_RATE', '1000000')  # Medir el bot, no el limitador
+os.environ.setdefault('OUTBOUND_GROUP_RATE', '1000000')
+os.environ.setdefault('OUTBOUND_PRIVATE_RATE', '1000000')
+
+from telegram import Update
+
+import bot
+import turn_guard
+from benchmarks.fake_api import FakeRequest, FakeTelegramAPI
+from benchmarks.synthetic import callback_update, message_update, poll_answer_update
+from game import STATE_DISCUSSING, STATE_FINISHED, STATE_PLAYING, STATE_VOTING, TURN_MODE_MUTE, TURN_MODES
+
+TOKEN = '123456:BENCHMARK'
+ADMIN_ID = 1
+
+# Los temporizadores de fase se acortan para no esperar minutos por partida
+for _name in ('ROLE_REVEAL_DELAY', 'RESULTS_DELAY'):
+    setattr(bot, _name, 0.01)
+
+class NoisyGameDriver:
+    """Juega partidas en las que los jugadores sin turno no paran de escribir"""
+
+    def __init__(self, application, api: FakeTelegramAPI, args, offset: int):
+        self.application = application
+        self.api = api
+        self.args = args
+        self.offset = offset  # Los ids de chat y de usuario no se repiten entre modos
+        self.counters = {'stray_sent': 0, 'stray_blocked': 0}
+        self.games = {}  # {chat_id: juego}, para ver su modo al terminar
+
+    async def send(self, data: dict):
+        await self.application.process_update(Update.de_json(data, self.application.bot))
+
+    async def wait_for(self, chat_id: int, condition, what: str, timeout: float = 60):
+        deadline = time.monotonic() + timeout
+        while True:
+            game = bot.active_games.get(chat_id)
+            if game is None or game.state == STATE_FINISHED or condition(game):
+                return game
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Chat {chat_id} atascado esperando {what} ({game.state})")
+            await asyncio.sleep(0.005)
+
+    async def stray(self, chat_id: int, user_id: int, text: str):
+        """Mensaje fuera de turno; no sale si Telegram tiene silenciado al usuario"""
+        self.counters['stray_sent'] += 1
+        if user_id in self.api.muted.get(chat_id, ()):
+            self.counters['stray_blocked'] += 1
+            return
+        await self.send(message_update(chat_id, user_id, text))
+
+    async def play_turn(self, chat_id: int, game, spectators):
+        player = game.current_player
+        # El jugador de turno escribe cuando Telegram se lo permite
+        await self.wait_for(chat_id, lambda g: player not in self.api.muted.get(chat_id, ()), "el permiso del jugador de turno")
+        await self.send(message_update(chat_id, player, 'pista'))
+        others = [p for p in game.active_players if p != player]
+        pause = self.args.turn_duration / max(1, self.args.noise)
+        for i in range(self.args.noise):
+            await asyncio.sleep(pause)
+            for user_id in others:
+                await self.stray(chat_id, user_id, f'fuera de turno {i}')
+        for user_id in spectators:
+            await self.stray(chat_id, user_id, 'comentario')
+        await self.send(message_update(chat_id, player, '/next_player'))
+
+    async def play(self, chat_index: int, mode: str):
+        index = self.offset + chat_index
+        chat_id = -2000000 - index
+        user_ids = [200000 + index * self.args.players + i for i in range(self.args.players)]
+        spectators = [900000000 + index * 1000 + i for i in range(self.args.spectators)]
+
+        await self.send(message_update(chat_id, ADMIN_ID, f'/turn_mode {mode}'))
+        await self.send(message_update(chat_id, ADMIN_ID, '/start'))
+        self.games[chat_id] = bot.active_games[chat_id]
+        join_poll = self.api.poll_chats[chat_id]
+        for user_id in user_ids:
+            await self.send(poll_answer_update(join_poll, user_id, [0]))
+        await self.send(callback_update(chat_id, ADMIN_ID, 'continue_game'))
+        await self.send(callback_update(chat_id, ADMIN_ID, 'impostors_1'))
+        await self.send(callback_update(chat_id, ADMIN_ID, f'rounds_{self.args.rounds}'))
+
+        while True:
+            game = await self.wait_for(chat_id, lambda g: g.state == STATE_PLAYING, "la ronda")
+            if game is None or game.state == STATE_FINISHED:
+                break
+            if game.current_round > self.args.rounds:
+                # Sin votos decisivos el juego seguiría; basta con las rondas pedidas
+                await self.send(message_update(chat_id, ADMIN_ID, '/cancel'))
+                break
+            while game.state == STATE_PLAYING and game.current_player:
+                await self.play_turn(chat_id, game, spectators)
+
+            game = await self.wait_for(chat_id, lambda g: g.state == STATE_DISCUSSING, "la discusión")
+            if game is None:
+                break
+            await self.send(message_update(chat_id, ADMIN_ID, '/end_meet'))
+            game = await self.wait_for(chat_id, lambda g: g.state == STATE_VOTING, "la votación")
+            if game is None:
+                break
+            # Todos votan al primer ciudadano activo: la partida dura todas las rondas posibles
+            target = next(p for p in game.active_players if p not in game.impostors)
+            option = game.players_order.index(target)
+            for voter in list(game.active_players):
+                await self.send(poll_answer_update(game.voting_poll_id, voter, [option]))
+            await self.send(callback_update(chat_id, ADMIN_ID, 'end_voting'))
+
+        # Esperar a que se devuelvan los permisos antes de contar
+        deadline = time.monotonic() + 10
+        while self.api.muted.get(chat_id) and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+
+def turn_calls(mode: str) -> Dict[str, float]:
+    return {method: value for (label, method), value in turn_guard.TURN_CALLS.values().items() if label == mode}
+
+async def run_mode(mode: str, args, offset: int) -> dict:
+    # Las primeras --basic-groups partidas se juegan en grupos normales
+    basic_groups = {-2000000 - offset - i for i in range(args.basic_groups)}
+    api = FakeTelegramAPI(admins=(ADMIN_ID,), basic_groups=basic_groups)
+    restricts = []
+    api.trace = lambda method, params: restricts.append(int(params['chat_id'])) if method == 'restrictChatMember' else None
+    application = bot.build_application(TOKEN, with_updater=False, request=FakeRequest(api, latency=args.latency))
+    driver = NoisyGameDriver(application, api, args, offset)
+    rounds_before = turn_guard.TURN_ROUNDS.values().get((mode,), 0)
+    calls_before = turn_calls(mode)
+
+    async with application:
+        await bot.post_init(application)
+        await application.start()
+        started = time.perf_counter()
+        results = await asyncio.gather(*(driver.play(i, mode) for i in range(args.chats)), return_exceptions=True)
+        elapsed = time.perf_counter() - started
+        await asyncio.sleep(bot.TURN_WARNING_DURATION + 0.1)  # Borrado de los últimos avisos
+        await application.stop()
+        await bot.post_shutdown(application)
+
+    for failure in [r for r in results if isinstance(r, Exception)][:3]:
+        print(f"  partida fallida: {failure!r}")
+    calls = {method: value - calls_before.get(method, 0) for method, value in turn_calls(mode).items()}
+    return {
+        'elapsed': elapsed,
+        'rounds': turn_guard.TURN_ROUNDS.values().get((mode,), 0) - rounds_before,
+        'calls': {method: value for method, value in calls.items() if value},
+        'api_calls': sum(api.calls.values()),
+        'still_muted': sum(len(users) for users in api.muted.values()),
+        'basic_groups': len(basic_groups),
+        'basic_fallbacks': sum(1 for chat_id in basic_groups if driver.games[chat_id].turn_mode != mode),
+        'basic_restricts': sum(1 for chat_id in restricts if chat_id in basic_groups),
+        **driver.counters,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, default=50, help='Partidas simultáneas')
+    parser.add_argument('--players', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=2)
+    parser.add_argument('--noise', type=int, default=2, help='Mensajes fuera de turno de cada jugador sin turno, por turno')
+    parser.add_argument('--spectators', type=int, default=0, help='Miembros que no juegan y escriben una vez por turno')
+    parser.add_argument('--turn-duration', type=float, default=0.2, help='Segundos que dura cada turno')
+    parser.add_argument('--warning-duration', type=float, default=0.05, help='Segundos visibles del aviso de turno (TURN_WARNING_DURATION)')
+    parser.add_argument('--latency', type=float, default=0.002, help='Latencia por llamada a la API (s)')
+    parser.add_argument('--basic-groups', type=int, default=0, help='Partidas que se juegan en grupos normales (no supergrupos)')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    bot.TURN_WARNING_DURATION = args.warning_duration
+
+    print(
+        f"{args.chats} partidas x {args.players} jugadores, {args.rounds} rondas, {args.noise} mensajes fuera de turno "
+        f"por jugador y turno, {args.spectators} espectadores"
+    )
+    for index, mode in enumerate(TURN_MODES):
+        result = asyncio.run(run_mode(mode, args, index * args.chats))
+        rounds = result['rounds'] or 1
+        per_round = ', '.join(f"{method}={value / rounds:.1f}" for method, value in sorted(result['calls'].items()))
+        print(
+            f"  {mode:7} {result['rounds']:5.0f} rondas en {result['elapsed']:.2f}s  "
+            f"llamadas de turnos por ronda={sum(result['calls'].values()) / rounds:.1f} ({per_round or '-'})  "
+            f"llamadas API por ronda={result['api_calls'] / rounds:.1f}"
+        )
+        print(
+            f"          fuera de turno: {result['stray_sent']} escritos, {result['stray_blocked']} bloqueados por Telegram, "
+            f"{result['stray_sent'] - result['stray_blocked']} llegaron al bot; silenciados al terminar={result['still_muted']}"
+        )
+        if result['basic_groups'] and mode == TURN_MODE_MUTE:
+            print(
+                f"          grupos normales: {result['basic_fallbacks']}/{result['basic_groups']} volvieron a delete, "
+                f"{result['basic_restricts'] / result['basic_groups']:.1f} restrictChatMember por partida"
+            )
+
+if __name__ == '__main__':
+    main()
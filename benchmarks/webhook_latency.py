@@ -0,0 +1,131 @@
+"""
+Latencia update -> handler en modo polling y en modo webhook
+
+Levanta un servidor local que imita la Bot API. En modo polling los updates se encolan
+en su getUpdates; en modo webhook se envían por POST al servidor de webhooks del bot,
+como haría Telegram. Se mide el tiempo hasta que el update llega a los handlers.
+
+Uso: python -m benchmarks.webhook_latency [--updates 500] [--rate 200]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import statistics
+import time
+import urllib.error
+import urllib.request
+
+os.environ.setdefault('GAME_DB_PATH', '')  # Sin persistencia durante el benchmark
+os.environ.setdefault('STATS_DB_PATH', '')
+
+from telegram import Update
+from telegram.ext import TypeHandler
+
+import bot
+from benchmarks.fake_api import FakeAPIServer
+from benchmarks.synthetic import message_update
+
+TOKEN = '123456:BENCHMARK'
+SECRET = 'benchmark-secret'
+CHAT_ID = -1000
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def post_update(url: str, update: dict, secret: str) -> int:
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(update).encode(),
+        headers={'Content-Type': 'application/json', 'X-Telegram-Bot-Api-Secret-Token': secret},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+async def measure(mode: str, server: FakeAPIServer, count: int, rate: float) -> dict:
+    application = bot.build_application(TOKEN, base_url=server.url)
+    sent_at = {}
+    latencies = []
+    done = asyncio.Event()
+
+    async def record(update: Update, context):
+        latencies.append(time.perf_counter() - sent_at[update.update_id])
+        if len(latencies) >= count:
+            done.set()
+
+    # Grupo -1: se ejecuta antes que los handlers del juego
+    application.add_handler(TypeHandler(Update, record), group=-1)
+
+    async with application:
+        if mode == 'webhook':
+            port = free_port()
+            await application.updater.start_webhook(
+                listen='127.0.0.1',
+                port=port,
+                url_path='telegram',
+                webhook_url=f"{server.url}/telegram",
+                secret_token=SECRET,
+                allowed_updates=bot.ALLOWED_UPDATES,
+            )
+            webhook_url = f"http://127.0.0.1:{port}/telegram"
+            # Un update sin el token secreto debe rechazarse
+            rejected = await asyncio.to_thread(post_update, webhook_url, message_update(CHAT_ID, 1, 'x'), 'wrong')
+            assert rejected == 403, f"El webhook aceptó un token secreto incorrecto ({rejected})"
+        else:
+            await application.updater.start_polling(poll_interval=0, timeout=10, allowed_updates=bot.ALLOWED_UPDATES)
+        await application.start()
+
+        started = time.perf_counter()
+        for i in range(count):
+            update = message_update(CHAT_ID, 1000 + i, f'mensaje {i}')
+            sent_at[update['update_id']] = time.perf_counter()
+            if mode == 'webhook':
+                await asyncio.to_thread(post_update, webhook_url, update, SECRET)
+            else:
+                server.api.push_update(update)
+            await asyncio.sleep(1 / rate)
+
+        await asyncio.wait_for(done.wait(), timeout=60)
+        elapsed = time.perf_counter() - started
+
+        await application.updater.stop()
+        await application.stop()
+
+    latencies.sort()
+    return {
+        'mode': mode,
+        'updates': count,
+        'updates_per_s': count / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        'max_ms': latencies[-1] * 1000,
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=500)
+    parser.add_argument('--rate', type=float, default=200, help='Updates por segundo enviados')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    server = FakeAPIServer().start()
+    try:
+        for mode in ('polling', 'webhook'):
+            result = await measure(mode, server, args.updates, args.rate)
+            print(
+                f"{result['mode']:8} {result['updates']} updates  {result['updates_per_s']:.0f} upd/s  "
+                f"p50={result['p50_ms']:.2f}ms  p99={result['p99_ms']:.2f}ms  max={result['max_ms']:.2f}ms"
+            )
+    finally:
+        server.stop()
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+"""
+Mensajes por segundo al buscar la palabra secreta: comprobación anterior frente a WordMatcher
+
+La comprobación anterior era `palabra.lower() in mensaje.lower()`. Se miden ambas sobre
+mensajes sintéticos (con tildes, emojis y, a veces, la palabra o una variante) y se listan
+los casos en los que dan resultados distintos.
+
+Uso: python -m benchmarks.word_matcher [--messages 100000] [--word león]
+"""
+
+import argparse
+import random
+import time
+
+from word_matcher import WordMatcher
+from words import get_all_words
+
+FILLER = [
+    'creo', 'que', 'es', 'algo', 'muy', 'grande', 'pequeño', 'lo', 'vi', 'ayer', 'en', 'la',
+    'tele', 'también', 'está', 'cerca', 'del', 'mar', 'café', 'canción', '¿seguro?', '😅', 'jajaja',
+]
+
+def make_messages(word: str, count: int, seed: int = 1):
+    rng = random.Random(seed)
+    variants = [word, word.upper(), word + 's', word.replace('ó', 'o').replace('á', 'a')]
+    vocabulary = FILLER + get_all_words()[:50]
+    messages = []
+    for _ in range(count):
+        parts = rng.choices(vocabulary, k=rng.randint(3, 15))
+        if rng.random() < 0.05:
+            parts.insert(rng.randrange(len(parts) + 1), rng.choice(variants))
+        messages.append(' '.join(parts))
+    return messages
+
+def rate(check, messages) -> float:
+    started = time.perf_counter()
+    for message in messages:
+        check(message)
+    return len(messages) / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--word', default='león')
+    args = parser.parse_args()
+
+    messages = make_messages(args.word, args.messages)
+    matcher = WordMatcher(args.word)
+
+    def old_check(text):
+        return args.word.lower() in text.lower()
+
+    old_rate = rate(old_check, messages)
+    new_rate = rate(matcher.search, messages)
+    print(f"Anterior (lower + in): {old_rate:,.0f} mensajes/s")
+    print(f"WordMatcher:           {new_rate:,.0f} mensajes/s  (x{new_rate / old_rate:.2f})")
+
+    # Falsos positivos de la comprobación anterior (subcadenas) y variantes que no detectaba
+    only_old = [m for m in messages if old_check(m) and not matcher.search(m)]
+    only_new = [m for m in messages if matcher.search(m) and not old_check(m)]
+    print(f"Solo la anterior: {len(only_old)}  Solo WordMatcher: {len(only_new)}  (de {len(messages)})")
+    for label, examples in (('anterior', only_old), ('WordMatcher', only_new)):
+        for message in examples[:3]:
+            print(f"  solo {label}: {message}")
+
+if __name__ == '__main__':
+    main()
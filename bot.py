@@ -6,6 +6,8 @@ Administra grupos de Telegram para el juego de roles donde hay impostores y ciud
 
 import logging
 import asyncio
+import time
+import secrets
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Poll
 from telegram.ext import (
     Application, 
@@ -13,24 +15,375 @@ from telegram.ext import (
     MessageHandler, 
     CallbackQueryHandler,
     PollAnswerHandler,
+    ChatMemberHandler,
+    TypeHandler,
     ContextTypes,
     filters
 )
 from telegram.constants import ChatType
-from game import ImpostorGame
-from config import BOT_TOKEN, MSG_IMPOSTOR, MSG_CITIZEN
+from apscheduler.jobstores.base import JobLookupError
+from game import (
+    ImpostorGame, add_transition_listener, STATE_WAITING, STATE_REVEALING, STATE_PLAYING,
+    STATE_DISCUSSING, STATE_VOTING, STATE_PROCESSING, STATE_FINISHED, TURN_MODES, TURN_MODE_DELETE, TURN_MODE_MUTE
+)
+from admin_cache import AdminCache
+from chat_filters import ChatSetFilter
+from log_pipeline import game_fields, setup_logging
+from metrics import Collected, Counter, Histogram, MetricsServer, instrumented
+from outbound import OutboundScheduler, PRIORITY_HIGH, PRIORITY_LOW
+from player_stats import GLOBAL_CHAT, StatsStore
+from recorder import UpdateRecorder
+from status_board import StatusBoard
+from storage import GameStore
+from telegram_http import build_bot
+from turn_guard import TurnGuard, TURN_ROUNDS, count_call
+from update_processor import ChatLocks, ChatUpdateProcessor
+from word_packs import available_packs, get_pack, prune_chat_decks
+from config import (
+    BOT_TOKEN, MSG_IMPOSTOR, MSG_CITIZEN, ADMIN_CACHE_TTL, ADMIN_CHECK_FAIL_OPEN,
+    POLL_DURATION, VOTE_DURATION, DISCUSSION_DURATION, ROLE_REVEAL_DELAY, RESULTS_DELAY,
+    ROLE_DM_CONCURRENCY, TURN_WARNING_DURATION, OUTBOUND_GLOBAL_RATE, OUTBOUND_GROUP_RATE,
+    OUTBOUND_PRIVATE_RATE, OUTBOUND_MAX_RETRIES, OUTBOUND_LOW_PRIORITY_MAX_WAIT,
+    GAME_DB_PATH, STORE_FLUSH_INTERVAL, BOT_MODE, BOT_API_BASE_URL, WEBHOOK_URL, WEBHOOK_LISTEN,
+    WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, SHARD_WORKERS, STATUS_EDIT_INTERVAL,
+    METRICS_HOST, METRICS_PORT, RECORD_UPDATES_PATH, RECORD_FLUSH_INTERVAL, LOG_LEVEL, LOG_FORMAT,
+    LOG_SAMPLE_RATE, LOG_QUEUE_SIZE, MAX_ACTIVE_GAMES, GAME_IDLE_TIMEOUT_WAITING, GAME_IDLE_TIMEOUT_PLAYING,
+    GAME_IDLE_TIMEOUT, GAME_SWEEP_INTERVAL, MAX_CONCURRENT_UPDATES, TURN_MODE, TURN_MUTE_CONCURRENCY,
+    GET_UPDATES_TIMEOUT, DROP_PENDING_UPDATES, STATS_DB_PATH, LEADERBOARD_SIZE, WORD_DECK_TTL
+)
 import traceback
 
-# Configurar logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Eventos que llegan en ráfagas (uno por jugador); sus logs se muestrean con LOG_SAMPLE_RATE
+SAMPLED_LOG_EVENTS = ('join', 'vote', 'vote_retracted')
+
+# Configurar logging: se escribe desde un hilo aparte para no bloquear el event loop
+setup_logging(LOG_LEVEL, LOG_FORMAT, SAMPLED_LOG_EVENTS, LOG_SAMPLE_RATE, LOG_QUEUE_SIZE)
 logger = logging.getLogger(__name__)
 
 # Diccionario para almacenar juegos activos por chat_id
 active_games = {}
 
+# Índice de encuestas activas: {poll_id: (chat_id, tipo)}
+POLL_KIND_JOIN = "join"
+POLL_KIND_VOTE = "vote"
+poll_index = {}
+
+# Avisos de turno visibles por chat: {chat_id: message_id o None mientras se envía}
+turn_warnings = {}
+
+# Caché de administradores por chat
+admin_cache = AdminCache(ADMIN_CACHE_TTL, fail_open=ADMIN_CHECK_FAIL_OPEN)
+
+# Planificador por el que pasan todas las llamadas salientes a Telegram
+outbound = OutboundScheduler(
+    global_rate=OUTBOUND_GLOBAL_RATE,
+    group_rate_per_minute=OUTBOUND_GROUP_RATE,
+    private_rate=OUTBOUND_PRIVATE_RATE,
+    max_retries=OUTBOUND_MAX_RETRIES,
+    low_priority_max_wait=OUTBOUND_LOW_PRIORITY_MAX_WAIT
+)
+
+# Almacenamiento persistente de los juegos (None si está desactivado)
+game_store = GameStore(GAME_DB_PATH) if GAME_DB_PATH else None
+
+# Estadísticas de jugadores para /stats y /leaderboard (None si están desactivadas)
+stats_store = StatsStore(STATS_DB_PATH) if STATS_DB_PATH else None
+
+# Grabación de updates para reproducir incidencias (None si está desactivada)
+update_recorder = UpdateRecorder(RECORD_UPDATES_PATH) if RECORD_UPDATES_PATH else None
+
+# Si se define, da la semilla de cada juego nuevo: game_seed_source(chat_id) -> int o None
+# La reproducción de grabaciones la usa para repetir los repartos grabados
+game_seed_source = None
+
+# Si se define, da la palabra de cada juego al repartir roles: game_word_source(chat_id) -> str o None
+# La palabra sale del mazo del chat, no de la semilla: la reproducción usa la grabada
+game_word_source = None
+
+# Paquete y categoría de palabras elegidos en cada chat con /pack: {chat_id: (paquete, categoría)}
+chat_word_settings = {}
+
+# Control de turnos elegido en cada chat con /turn_mode: {chat_id: modo}; el resto usa TURN_MODE
+chat_turn_modes = {}
+
+# Máximo de juegos simultáneos (0 = sin límite; en modo multiproceso, la parte de cada worker)
+max_active_games = MAX_ACTIVE_GAMES
+
+# Segundos sin actividad tras los que se expulsa un juego, por fase. En las fases con temporizador
+# se cuentan desde su hora límite: solo se expulsa el juego si el temporizador no llegó a ejecutarse
+IDLE_TIMEOUTS = {
+    STATE_WAITING: GAME_IDLE_TIMEOUT_WAITING,
+    STATE_PLAYING: GAME_IDLE_TIMEOUT_PLAYING,
+}
+
+# Servidor de métricas y sondas de salud (puerto 0 = desactivado; los workers usan su propio puerto)
+metrics_port = METRICS_PORT
+metrics_server = None
+
+def count_games_by_state():
+    """Juegos activos por fase, para la métrica impostor_active_games"""
+    counts = {(state,): 0 for state in (STATE_WAITING, STATE_REVEALING, STATE_PLAYING, STATE_DISCUSSING, STATE_VOTING, STATE_PROCESSING)}
+    for game in active_games.values():
+        counts[(game.state,)] = counts.get((game.state,), 0) + 1
+    return counts
+
+Collected('impostor_active_games', 'Juegos activos por fase', ('state',), count_games_by_state)
+Collected(
+    'impostor_outbound_requests_total', 'Eventos del planificador de salida (encoladas, retrasadas, reintentadas, descartadas)',
+    ('event',), lambda: {(event,): value for event, value in outbound.counters.items()}, kind='counter'
+)
+PHASE_TRANSITIONS = Counter('impostor_phase_transitions_total', 'Cambios de fase de los juegos', ('from_state', 'to_state'))
+PHASE_DURATION = Histogram(
+    'impostor_phase_seconds', 'Duración de cada fase del juego', ('state',),
+    buckets=(1, 5, 10, 30, 60, 120, 180, 300, 600, 1800)
+)
+GAMES_EVICTED = Counter('impostor_games_evicted_total', 'Juegos expulsados por inactividad', ('state',))
+EVICTED_BYTES = Counter('impostor_evicted_bytes_total', 'Bytes aproximados liberados al expulsar juegos inactivos')
+GAMES_REFUSED = Counter('impostor_games_refused_total', 'Juegos no creados por alcanzar MAX_ACTIVE_GAMES')
+DM_FAILURES = Counter('impostor_dm_failures_total', 'Roles que no se pudieron enviar por privado', ('reason',))
+
+def observe_phase_change(game, old_state, new_state):
+    """Registra la duración de la fase que termina"""
+    PHASE_TRANSITIONS.inc(old_state, new_state)
+    PHASE_DURATION.observe(game.last_phase_duration, old_state)
+
+add_transition_listener(observe_phase_change)
+
+def mark_game_dirty(game):
+    """Marca un juego como activo y para guardarlo en el próximo lote de escritura"""
+    game.touch()
+    if game_store:
+        game_store.mark_dirty(game)
+
+def persist_phase_change(game, old_state, new_state):
+    """Guarda una instantánea en cada cambio de fase y borra los juegos terminados"""
+    if not game_store:
+        return
+    if new_state == STATE_FINISHED:
+        game_store.discard(game.chat_id)
+    else:
+        game_store.mark_dirty(game)
+
+add_transition_listener(persist_phase_change)
+
+def record_game_stats(game, old_state, new_state):
+    """Anota el resultado de los juegos terminados con ganador para las estadísticas"""
+    if stats_store and new_state == STATE_FINISHED:
+        stats_store.record(game)
+
+add_transition_listener(record_game_stats)
+
+# Chats en ronda de turnos, mantenido con los cambios de fase. El filtro descarta los mensajes
+# de texto de los demás chats antes de llegar a handle_messages
+playing_chats = set()
+playing_chat_filter = ChatSetFilter(playing_chats, 'playing_chat')
+
+# Funciones avisadas al empezar o terminar un juego: listener(evento, chat_id) con "start" o "end"
+# El modo multiproceso las usa para que el proceso frontal sepa qué chats tienen juego
+game_listeners = []
+
+def add_game(game):
+    """Registra un juego nuevo o restaurado como activo"""
+    active_games[game.chat_id] = game
+    if game.state == STATE_PLAYING:
+        playing_chats.add(game.chat_id)
+    for listener in game_listeners:
+        listener("start", game.chat_id)
+
+def track_game_chats(game, old_state, new_state):
+    """Mantiene el conjunto de chats en ronda y avisa de los juegos terminados"""
+    if new_state == STATE_PLAYING:
+        playing_chats.add(game.chat_id)
+    else:
+        playing_chats.discard(game.chat_id)
+    if new_state == STATE_FINISHED:
+        for listener in game_listeners:
+            listener("end", game.chat_id)
+
+add_transition_listener(track_game_chats)
+
+# Funciones avisadas al registrar o retirar encuestas: listener(evento, poll_id, chat_id)
+# El modo multiproceso las usa para enrutar las respuestas al worker correcto
+poll_listeners = []
+
+# Si se define, solo se restauran los juegos de los chats para los que devuelve True
+chat_filter = None
+
+def register_poll(poll_id, chat_id, kind):
+    """Registra una encuesta en el índice para resolver sus respuestas en O(1)"""
+    poll_index[poll_id] = (chat_id, kind)
+    for listener in poll_listeners:
+        listener("register", poll_id, chat_id)
+
+def unregister_poll(poll_id):
+    """Elimina una encuesta del índice"""
+    if poll_id is None:
+        return
+    entry = poll_index.pop(poll_id, None)
+    if entry:
+        for listener in poll_listeners:
+            listener("unregister", poll_id, entry[0])
+
+# Un cerrojo por chat: los updates de un chat y sus temporizadores de fase se ejecutan de uno en uno
+chat_locks = ChatLocks()
+
+def update_chat_id(update):
+    """Chat al que pertenece un update; las respuestas a encuestas se resuelven por su encuesta"""
+    if isinstance(update, Update):
+        if update.poll_answer:
+            entry = poll_index.get(update.poll_answer.poll_id)
+            return entry[0] if entry else None
+        if update.effective_chat:
+            return update.effective_chat.id
+    return None
+
+# Temporizadores de fase pendientes: {chat_id: Job}. Cada juego tiene como máximo uno
+phase_jobs = {}
+
+def set_phase_timer(job_queue, game, name, delay):
+    """Programa la acción `name` de PHASE_TIMERS para cuando termine la fase actual"""
+    cancel_phase_timer(game.chat_id)
+    game.phase_timer = name
+    game.phase_deadline = time.time() + delay
+    mark_game_dirty(game)
+    if job_queue:
+        phase_jobs[game.chat_id] = job_queue.run_once(
+            run_phase_timer,
+            delay,
+            data=(game.chat_id, game.game_id, name),
+            name=f"{name}_{game.chat_id}",
+            # Con carga el trabajo puede ejecutarse tarde; APScheduler lo descartaría tras 1s
+            # y el juego se quedaría sin salir de la fase
+            job_kwargs={'misfire_grace_time': None}
+        )
+
+def cancel_phase_timer(chat_id):
+    """Cancela el temporizador de fase pendiente de un chat"""
+    job = phase_jobs.pop(chat_id, None)
+    if job:
+        try:
+            job.schedule_removal()
+        except JobLookupError:
+            # Ya se disparó y espera al cerrojo del chat; run_phase_timer lo descartará por obsoleto
+            pass
+
+def on_phase_change(game, old_state, new_state):
+    """Todo cambio de fase invalida el temporizador de la fase anterior"""
+    cancel_phase_timer(game.chat_id)
+
+add_transition_listener(on_phase_change)
+
+def render_status(game, note=None):
+    """Texto y botones del mensaje de estado según la fase del juego (sin Markdown: los nombres pueden romperlo)"""
+    names = lambda ids: ', '.join(game.players[p].name for p in ids if p in game.players)
+    markup = None
+    
+    if game.state == STATE_WAITING:
+        text = (
+            f"🎮 ¡NUEVO JUEGO DE IMPOSTOR!\n\n"
+            f"📊 Vota en la encuesta para unirte. El juego empieza en {POLL_DURATION // 60} minutos o cuando el admin presione 'Continuar'.\n"
+            f"⚠️ Todos deben enviar /start al bot en privado para recibir su rol.\n\n"
+            f"👥 Jugadores ({len(game.players)}, mínimo 3): {names(game.players) or 'Ninguno'}"
+        )
+        markup = InlineKeyboardMarkup([[InlineKeyboardButton("▶️ Continuar al siguiente paso", callback_data="continue_game")]])
+    elif game.state == STATE_REVEALING:
+        text = (
+            f"🎮 JUEGO EN CURSO\n\n"
+            f"👥 Jugadores: {len(game.players)} | 👹 Impostores: {game.num_impostors} | 🔄 Rondas: {game.max_rounds}\n"
+            f"📨 Revisen su rol por privado. La primera ronda empieza en unos segundos..."
+        )
+    elif game.state == STATE_PLAYING:
+        text = (
+            f"🎯 RONDA {game.current_round}/{game.max_rounds}\n\n"
+            f"👤 Turno de: {game.get_current_player_name()}\n"
+            f"💬 Solo esta persona puede escribir. Escribe una palabra relacionada (sin revelarla) y usa /next_player.\n"
+            f"✅ Ya jugaron: {len(game.players_played_this_round)}/{len(game.active_players)}"
+        )
+    elif game.state == STATE_DISCUSSING:
+        text = (
+            f"💭 DISCUSIÓN - RONDA {game.current_round}/{game.max_rounds}\n\n"
+            f"🗣️ Todos pueden hablar para decidir quién es el impostor.\n"
+            f"⏰ Tienen {DISCUSSION_DURATION // 60} minutos o hasta que el admin presione el botón."
+        )
+        markup = InlineKeyboardMarkup([[InlineKeyboardButton("🗣️ Terminar discusión y votar", callback_data="start_voting")]])
+    elif game.state == STATE_VOTING:
+        tie = " (empate)" if game.vote_tally.is_tie() else ""
+        text = (
+            f"🗳️ VOTACIÓN - RONDA {game.current_round}/{game.max_rounds}\n\n"
+            f"⏰ Tienen {VOTE_DURATION} segundos para votar en la encuesta.\n"
+            f"📊 Votos: {len(game.votes)}/{len(game.active_players)}{tie}"
+        )
+        markup = InlineKeyboardMarkup([[InlineKeyboardButton("⏹️ Terminar votación (Admin)", callback_data="end_voting")]])
+    elif game.state == STATE_PROCESSING:
+        text = f"⏱️ VOTACIÓN TERMINADA - RONDA {game.current_round}/{game.max_rounds}"
+    else:
+        text = f"🏁 JUEGO TERMINADO\n\n👥 Jugadores: {names(game.players)}"
+    
+    if game.eliminated_players and game.state != STATE_WAITING:
+        text += f"\n❌ Eliminados: {names(game.eliminated_players)}"
+    if note:
+        text += f"\n\n{note}"
+    return text, markup
+
+# Mensaje de estado fijado de cada juego, editado con como mucho una edición por intervalo
+status_board = StatusBoard(render_status, STATUS_EDIT_INTERVAL)
+
+def update_status_on_phase_change(game, old_state, new_state):
+    """Refleja cada cambio de fase en el mensaje de estado y lo cierra al terminar"""
+    if new_state == STATE_FINISHED:
+        try:
+            asyncio.get_running_loop().create_task(status_board.close(game))
+        except RuntimeError:
+            pass
+    else:
+        if new_state == STATE_PLAYING:
+            # Ronda nueva: el resultado de la anterior ya no aplica. El turno se anuncia sin esperas
+            status_board.set_note(game.chat_id, None)
+            status_board.update_now(game, PRIORITY_HIGH)
+        else:
+            status_board.request_update(game)
+
+add_transition_listener(update_status_on_phase_change)
+
+def turn_mode_unavailable(game):
+    """Avisa en el mensaje de estado de que el bot no puede silenciar a los jugadores"""
+    status_board.set_note(
+        game.chat_id,
+        "⚠️ No puedo silenciar a los jugadores (hace falta un supergrupo y permiso para restringir miembros): "
+        "los mensajes fuera de turno se borrarán"
+    )
+    status_board.request_update(game)
+    mark_game_dirty(game)
+
+# Silencia a los jugadores sin turno en los chats con el modo "mute"
+turn_guard = TurnGuard(TURN_MUTE_CONCURRENCY, on_unavailable=turn_mode_unavailable)
+
+def enforce_turns_on_phase_change(game, old_state, new_state):
+    """Cuenta las rondas por modo y ajusta los permisos al empezar o terminar la ronda de turnos"""
+    if new_state == STATE_PLAYING:
+        TURN_ROUNDS.inc(game.turn_mode)
+    turn_guard.sync(game)
+
+add_transition_listener(enforce_turns_on_phase_change)
+
+async def run_phase_timer(context):
+    """Ejecuta la acción de un temporizador de fase si sigue vigente"""
+    chat_id, game_id, name = context.job.data
+    if phase_jobs.get(chat_id) is context.job:
+        del phase_jobs[chat_id]
+    
+    # Esperar a que termine el update del chat que se esté procesando
+    async with chat_locks.hold(chat_id):
+        game = active_games.get(chat_id)
+        # Ignorar temporizadores de juegos terminados, reiniciados o de fases ya superadas
+        if not game or game.game_id != game_id or game.phase_timer != name:
+            logger.debug(f"Temporizador {name} obsoleto para chat {chat_id}")
+            return
+        
+        game.phase_timer = None
+        game.phase_deadline = None
+        await PHASE_TIMERS[name](context, chat_id, game)
+
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /start - Inicia un nuevo juego en grupos o habilita chat privado"""
     chat = update.effective_chat
@@ -60,9 +413,25 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⚠️ Ya hay un juego activo en este grupo. Usa /cancel para cancelarlo.")
         return
     
+    # Límite de juegos simultáneos para acotar la memoria
+    if max_active_games and len(active_games) >= max_active_games:
+        GAMES_REFUSED.inc()
+        logger.warning(f"Juego rechazado en {chat.id}: {len(active_games)} juegos activos (máximo {max_active_games})")
+        await update.message.reply_text(
+            "🚦 Ahora mismo hay demasiadas partidas en marcha y no puedo empezar otra.\n\n"
+            "Inténtalo de nuevo en unos minutos."
+        )
+        return
+    
     # Crear nuevo juego
-    game = ImpostorGame(chat.id)
-    active_games[chat.id] = game
+    game = ImpostorGame(chat.id, seed=game_seed_source(chat.id) if game_seed_source else None)
+    if update_recorder:
+        update_recorder.record_seed(game)
+    game.word_pack, game.word_category = chat_word_settings.get(chat.id, (None, None))
+    game.turn_mode = chat_turn_modes.get(chat.id, TURN_MODE)
+    add_game(game)
+    mark_game_dirty(game)
+    await admin_cache.warm(context.bot, chat.id)
     
     # Crear encuesta para unirse al juego
     poll_message = await context.bot.send_poll(
@@ -75,30 +444,19 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     
     game.poll_message_id = poll_message.poll.id
+    register_poll(game.poll_message_id, chat.id, POLL_KIND_JOIN)
     logger.info(f"Created join poll with ID: {poll_message.poll.id} for chat {chat.id}")
     
-    # Crear botón para que el admin pueda continuar
-    keyboard = [[InlineKeyboardButton("▶️ Continuar al siguiente paso", callback_data="continue_game")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Programar auto-continuación después de 3 minutos (antes de publicar: si falla, el juego sigue avanzando)
+    set_phase_timer(context.job_queue, game, "auto_continue", POLL_DURATION)
     
-    await update.message.reply_text(
-        f"🎮 **¡NUEVO JUEGO DE IMPOSTOR!**\n\n"
-        f"📊 Los jugadores tienen 3 minutos para unirse o hasta que el admin presione 'Continuar'.\n"
-        f"👥 Mínimo 3 jugadores para empezar.\n\n"
-        f"🔸 **¿Cómo jugar?**\n"
-        f"• Algunos serán impostores (no conocen la palabra)\n"
-        f"• Otros serán ciudadanos (conocen la palabra secreta)\n"
-        f"• Los impostores deben actuar como si supieran la palabra\n"
-        f"• Al final de cada ronda, votan para eliminar al impostor\n\n"
-        f"⚠️ **IMPORTANTE:** Todos deben enviar /start al bot en privado para recibir su rol.\n\n"
-        f"**Vota en la encuesta de arriba para participar** ⬆️",
-        reply_markup=reply_markup,
-        parse_mode='Markdown'
-    )
-    
-    # Programar auto-continuación después de 3 minutos
-    if context.job_queue:
-        context.job_queue.run_once(auto_continue_game, 180, data=chat.id)
+    # Mensaje de estado fijado: se irá editando con los jugadores que se unan y cada fase
+    try:
+        await status_board.post(game)
+    except Exception as e:
+        logger.warning(f"No se pudo publicar el mensaje de estado en {chat.id}: {e}")
+        status_board.use_plain_messages(game)
+        status_board.request_update(game)
 
 async def poll_answer_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Maneja las respuestas a las encuestas"""
@@ -106,42 +464,50 @@ async def poll_answer_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
     user = update.poll_answer.user
     
     # Buscar el juego correspondiente a esta encuesta
-    game = None
-    chat_id = None
-    
-    logger.info(f"Poll answer recibido: poll_id={poll_answer.poll_id}, user={user.id}, options={poll_answer.option_ids}")
-    
-    for cid, g in active_games.items():
-        logger.info(f"Checking game {cid}: poll_message_id={getattr(g, 'poll_message_id', None)}, voting_poll_id={getattr(g, 'voting_poll_id', None)}")
-        if hasattr(g, 'poll_message_id') and g.poll_message_id == poll_answer.poll_id:
-            game = g
-            chat_id = cid
-            logger.info(f"Found matching join game poll for chat {cid}")
-            break
-        elif hasattr(g, 'voting_poll_id') and g.voting_poll_id == poll_answer.poll_id:
-            game = g
-            chat_id = cid
-            logger.info(f"Found matching voting poll for chat {cid}")
-            break
+    entry = poll_index.get(poll_answer.poll_id)
+    if not entry:
+        return
     
+    chat_id, kind = entry
+    game = active_games.get(chat_id)
     if not game:
+        unregister_poll(poll_answer.poll_id)
         return
     
+    logger.debug(f"Poll answer recibido: poll_id={poll_answer.poll_id}, chat={chat_id}, tipo={kind}, user={user.id}, options={poll_answer.option_ids}")
+    
     # Si es la encuesta de unirse al juego
-    if hasattr(game, 'poll_message_id') and game.poll_message_id == poll_answer.poll_id:
+    if kind == POLL_KIND_JOIN:
         if poll_answer.option_ids and poll_answer.option_ids[0] == 0:  # "Sí, quiero jugar"
             if user.id not in game.players:
                 player_name = user.first_name or user.username or f"Jugador{user.id}"
                 game.add_player(user.id, player_name)
-                logger.info(f"Jugador {player_name} ({user.id}) se unió al juego en chat {chat_id}. Total: {len(game.players)}")
+                mark_game_dirty(game)
+                status_board.request_update(game)
+                logger.info(
+                    f"Jugador {player_name} ({user.id}) se unió al juego en chat {chat_id}. Total: {len(game.players)}",
+                    extra=game_fields(game, 'join', user_id=user.id)
+                )
     
     # Si es una encuesta de votación durante el juego
-    elif hasattr(game, 'voting_poll_id') and game.voting_poll_id == poll_answer.poll_id:
-        if poll_answer.option_ids and game.state == "voting":
+    elif kind == POLL_KIND_VOTE:
+        if game.state != STATE_VOTING:
+            return
+        if poll_answer.option_ids:
             voted_player_index = poll_answer.option_ids[0]
-            logger.info(f"Usuario {user.id} votó por índice {voted_player_index}. Orden de jugadores: {game.players_order}")
             game.add_vote(user.id, voted_player_index)
-            logger.info(f"Voto registrado. Total votos: {len(game.votes)}")
+            event, action = 'vote', f"votó por índice {voted_player_index}"
+        else:
+            # Lista vacía: el usuario retiró su voto
+            game.retract_vote(user.id)
+            event, action = 'vote_retracted', "retiró su voto"
+        mark_game_dirty(game)
+        status_board.request_update(game)
+        logger.info(
+            f"Usuario {user.id} {action} en chat {chat_id}. Total votos: {len(game.votes)}. "
+            f"Máximo: {game.vote_tally.max_votes}{' (empate)' if game.vote_tally.is_tie() else ''}",
+            extra=game_fields(game, event, user_id=user.id)
+        )
 
 async def continue_game_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Callback para continuar el juego después de la encuesta"""
@@ -149,35 +515,35 @@ async def continue_game_callback(update: Update, context: ContextTypes.DEFAULT_T
     user = query.from_user
     chat_id = query.message.chat_id
     
-    await query.answer()
-    
+    # Los errores se muestran como alerta para no sobrescribir el mensaje de estado
     # Verificar permisos de administrador
     if not await is_admin(context.bot, chat_id, user.id):
-        await query.edit_message_text("❌ Solo los administradores pueden continuar el juego.")
+        await query.answer("❌ Solo los administradores pueden continuar el juego.", show_alert=True)
         return
     
     if chat_id not in active_games:
-        await query.edit_message_text("❌ No hay juego activo en este chat.")
+        await query.answer("❌ No hay juego activo en este chat.", show_alert=True)
         return
     
     game = active_games[chat_id]
     
     # Verificar que hay suficientes jugadores
     if len(game.players) < 3:
-        await query.edit_message_text(
-            f"❌ **Jugadores insuficientes**\n\n"
-            f"📋 Jugadores actuales: {len(game.players)}\n"
-            f"✅ Mínimo requerido: 3\n\n"
-            f"📝 Lista actual: {', '.join([p['name'] for p in game.players.values()]) if game.players else 'Ninguno'}"
+        await query.answer(
+            f"❌ Jugadores insuficientes: {len(game.players)} (mínimo 3)",
+            show_alert=True
         )
         return
     
     # Validar configuración del juego
     is_valid, error_msg = game.validate_game_settings()
     if not is_valid:
-        await query.edit_message_text(f"❌ Error de configuración: {error_msg}")
+        await query.answer(f"❌ Error de configuración: {error_msg}", show_alert=True)
         return
     
+    await query.answer()
+    game.touch()
+    
     # Mostrar configuración del juego
     max_impostors = max(1, len(game.players) // 3)  # Máximo 1/3 de impostores
     
@@ -185,10 +551,12 @@ async def continue_game_callback(update: Update, context: ContextTypes.DEFAULT_T
     for i in range(1, max_impostors + 1):
         keyboard.append([InlineKeyboardButton(f"👹 {i} impostor(es)", callback_data=f"impostors_{i}")])
     
+    # El mensaje de estado muestra la configuración hasta que empiece el juego
+    status_board.hold(chat_id)
     await query.edit_message_text(
         f"⚙️ **CONFIGURACIÓN DEL JUEGO**\n\n"
         f"👥 Jugadores: {len(game.players)}\n"
-        f"📝 Jugadores: {', '.join([p['name'] for p in game.players.values()])}\n\n"
+        f"📝 Jugadores: {', '.join([p.name for p in game.players.values()])}\n\n"
         f"🎯 Selecciona el número de impostores:",
         reply_markup=InlineKeyboardMarkup(keyboard),
         parse_mode='Markdown'
@@ -200,19 +568,20 @@ async def set_impostors_callback(update: Update, context: ContextTypes.DEFAULT_T
     chat_id = query.message.chat_id
     user = query.from_user
     
-    await query.answer()
-    
     # Verificar permisos de administrador
     if not await is_admin(context.bot, chat_id, user.id):
-        await query.edit_message_text("❌ Solo los administradores pueden configurar el juego.")
+        await query.answer("❌ Solo los administradores pueden configurar el juego.", show_alert=True)
         return
     
+    await query.answer()
+    
     if chat_id not in active_games:
         return
     
     game = active_games[chat_id]
     num_impostors = int(query.data.split('_')[1])
     game.num_impostors = num_impostors
+    mark_game_dirty(game)
     
     # Ahora seleccionar número de rondas
     keyboard = []
@@ -235,92 +604,101 @@ async def set_rounds_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     chat_id = query.message.chat_id
     user = query.from_user
     
-    await query.answer()
-    
     # Verificar permisos de administrador
     if not await is_admin(context.bot, chat_id, user.id):
-        await query.edit_message_text("❌ Solo los administradores pueden configurar el juego.")
+        await query.answer("❌ Solo los administradores pueden configurar el juego.", show_alert=True)
         return
     
+    await query.answer()
+    
     if chat_id not in active_games:
         return
     
     game = active_games[chat_id]
+    if game.state != STATE_WAITING:
+        return
+    
     num_rounds = int(query.data.split('_')[1])
     game.max_rounds = num_rounds
     
     # Empezar el juego
-    await start_game_rounds(context.bot, chat_id, game, query)
+    await start_game_rounds(context, chat_id, game)
 
-async def start_game_rounds(bot, chat_id, game, query=None):
+async def start_game_rounds(context, chat_id, game):
     """Inicia las rondas del juego"""
+    bot = context.bot
     try:
         # Asignar roles y palabra
-        game.assign_roles()
+        game.assign_roles(word=game_word_source(chat_id) if game_word_source else None)
+        if update_recorder:
+            update_recorder.record_word(game)
         
-        if query:
-            await query.edit_message_text(
-                f"🎮 **INICIANDO JUEGO**\n\n"
-                f"👥 Jugadores: {len(game.players)}\n"
-                f"👹 Impostores: {game.num_impostors}\n"
-                f"🔄 Rondas: {game.max_rounds}\n\n"
-                f"📨 Enviando roles por privado...",
-                parse_mode='Markdown'
-            )
+        # Recuperar el mensaje de estado (lo usaban los botones de configuración)
+        status_board.release(chat_id)
+        status_board.set_note(chat_id, "📨 Enviando roles por privado...")
+        status_board.request_update(game)
         
         # Enviar roles a cada jugador por privado
-        failed_private_messages = []
-        success_count = 0
-        
-        for player_id, player_data in game.players.items():
-            try:
-                if player_data['role'] == 'impostor':
-                    await bot.send_message(player_id, MSG_IMPOSTOR)
-                else:
-                    await bot.send_message(player_id, MSG_CITIZEN.format(word=game.current_word))
-                success_count += 1
-            except Exception as e:
-                logger.warning(f"No se pudo enviar mensaje privado a {player_id}: {e}")
-                failed_private_messages.append(player_data['name'])
-        
-        # Mensaje de estado en el grupo
-        status_msg = f"📨 **ROLES ENVIADOS**\n\n✅ {success_count}/{len(game.players)} jugadores recibieron su rol"
+        success_count, failed_private_messages = await send_roles(bot, game)
         
+        # Resultado del envío en el mensaje de estado
+        note = f"📨 {success_count}/{len(game.players)} jugadores recibieron su rol"
         if failed_private_messages:
-            status_msg += f"\n\n⚠️ Los siguientes jugadores deben enviar /start al bot en privado:\n" + "\n".join([f"• @{name}" for name in failed_private_messages])
-        else:
-            status_msg += "\n\n🎉 ¡Todos los jugadores recibieron su rol!"
+            note += f"\n⚠️ Deben enviar /start al bot en privado: " + ", ".join(failed_private_messages)
+        status_board.set_note(chat_id, note)
+        status_board.request_update(game)
         
-        await bot.send_message(chat_id, status_msg)
-        
-        # Esperar 10 segundos
-        await asyncio.sleep(10)
-        
-        # Empezar primera ronda
-        await start_round(bot, chat_id, game)
+        # Empezar la primera ronda cuando pase el tiempo para ver los roles
+        set_phase_timer(context.job_queue, game, "begin_round", ROLE_REVEAL_DELAY)
         
     except Exception as e:
         logger.error(f"Error iniciando juego: {e}\n{traceback.format_exc()}")
         await bot.send_message(chat_id, f"❌ Error al iniciar el juego: {str(e)}")
 
-async def start_round(bot, chat_id, game):
+async def send_roles(bot, game):
+    """Envía los roles por privado en paralelo con concurrencia limitada.
+    El ritmo global lo impone el planificador de salida. Retorna (enviados, nombres_fallidos)"""
+    semaphore = asyncio.Semaphore(ROLE_DM_CONCURRENCY)
+    
+    async def send_role(player_id, player_data):
+        async with semaphore:
+            if player_data.role == 'impostor':
+                text = MSG_IMPOSTOR
+            else:
+                text = MSG_CITIZEN.format(word=game.current_word)
+            await bot.send_message(player_id, text, rate_limit_args=PRIORITY_HIGH)
+    
+    players = list(game.players.items())
+    started = time.monotonic()
+    results = await asyncio.gather(
+        *(send_role(player_id, player_data) for player_id, player_data in players),
+        return_exceptions=True
+    )
+    
+    failed_private_messages = []
+    for (player_id, player_data), result in zip(players, results):
+        if isinstance(result, Exception):
+            DM_FAILURES.inc(type(result).__name__)
+            logger.warning(f"No se pudo enviar mensaje privado a {player_id}: {result}")
+            failed_private_messages.append(player_data.name)
+    
+    success_count = len(players) - len(failed_private_messages)
+    logger.info(
+        f"Roles enviados en chat {game.chat_id}: {success_count}/{len(players)} "
+        f"en {time.monotonic() - started:.2f}s"
+    )
+    return success_count, failed_private_messages
+
+async def start_round(context, chat_id, game):
     """Inicia una nueva ronda"""
     # Verificar que el juego esté en estado correcto
-    if chat_id not in active_games or game.state not in ["playing_round", "discussing", "voting", "processing_votes"]:
+    if chat_id not in active_games or game.state not in [STATE_REVEALING, STATE_PROCESSING]:
         logger.warning(f"start_round llamado con estado incorrecto: {getattr(game, 'state', 'no_game')}")
         return
     
+    # El mensaje de estado muestra la ronda y el turno al cambiar de fase
     game.start_new_round()
-    logger.info(f"Iniciando ronda {game.current_round}/{game.max_rounds} para chat {chat_id}")
-    
-    await bot.send_message(
-        chat_id,
-        f"🎯 **RONDA {game.current_round}/{game.max_rounds}**\n\n"
-        f"️ Es el turno de **{game.get_current_player_name()}**\n"
-        f"💬 Solo esta persona puede escribir ahora.\n"
-        f"⏰ Escribe una palabra relacionada con la palabra secreta (sin revelarla).",
-        parse_mode='Markdown'
-    )
+    logger.info(f"Iniciando ronda {game.current_round}/{game.max_rounds} para chat {chat_id}", extra=game_fields(game))
 
 async def handle_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Maneja todos los mensajes durante el juego"""
@@ -334,66 +712,91 @@ async def handle_messages(update: Update, context: ContextTypes.DEFAULT_TYPE):
     game = active_games[chat_id]
     
     # Solo durante las rondas de juego
-    if game.state == "playing_round":
+    if game.state == STATE_PLAYING:
         # Solo puede escribir el jugador actual
         if user_id != game.current_player:
-            try:
-                await update.message.delete()
-                # Enviar mensaje temporal de advertencia
-                warning_msg = await context.bot.send_message(
-                    chat_id,
-                    f"⚠️ Solo {game.get_current_player_name()} puede escribir ahora.\n💡 Usa /next_player para pasar turno."
-                )
-                # Borrar la advertencia después de 3 segundos
-                await asyncio.sleep(3)
-                try:
-                    await warning_msg.delete()
-                except:
-                    pass
-            except Exception:
-                # Ignorar si no se puede borrar el mensaje
-                pass
+            # Borrar y avisar no cambia el juego: se hace aparte para no retener los demás updates del chat
+            context.application.create_task(reject_off_turn_message(context, update, game), update=update)
             return
         
         # Verificar si dijo la palabra secreta
-        if game.current_word.lower() in message_text.lower():
+        if game.mentions_secret_word(message_text):
             await update.message.reply_text(
                 f"🎯 **¡{game.get_current_player_name()} dijo la palabra secreta!**\n\n"
                 f"🏆 **¡Los IMPOSTORES han ganado!**\n"
                 f"📝 La palabra era: **{game.current_word}**\n\n"
-                f"👹 Impostores: {', '.join([game.players[p]['name'] for p in game.impostors])}\n"
-                f"👤 Ciudadanos: {', '.join([game.players[p]['name'] for p in game.citizens])}",
+                f"👹 Impostores: {', '.join([game.players[p].name for p in game.impostors])}\n"
+                f"👤 Ciudadanos: {', '.join([game.players[p].name for p in game.citizens])}",
                 parse_mode='Markdown'
             )
+            game.winner = 'impostor'
             await end_game(chat_id)
             return
         
         # Guardar temporalmente el último mensaje (se registrará al ejecutar /next_player)
         game.set_current_player_message(message_text)
+        mark_game_dirty(game)
 
-async def start_discussion(bot, chat_id, game, context=None):
-    """Inicia la fase de discusión"""
-    game.state = "discussing"
-    
-    keyboard = [[InlineKeyboardButton("🗣️ Terminar discusión y votar", callback_data="start_voting")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+async def reject_off_turn_message(context, update, game):
+    """Borra un mensaje escrito fuera de turno y avisa de quién tiene el turno"""
+    chat_id = update.effective_chat.id
+    count_call(game.turn_mode, 'deleteMessage')
+    try:
+        await context.bot.delete_message(chat_id, update.message.message_id, rate_limit_args=PRIORITY_LOW)
+    except Exception:
+        # Ignorar si no se puede borrar el mensaje
+        pass
+    await send_turn_warning(context, chat_id, game)
+
+async def send_turn_warning(context, chat_id, game):
+    """Envía el aviso de turno, como máximo uno visible por chat, y programa su borrado"""
+    if chat_id in turn_warnings:
+        return
+    turn_warnings[chat_id] = None
     
-    await bot.send_message(
-        chat_id,
-        f"💭 **TIEMPO DE DISCUSIÓN**\n\n"
-        f"🗣️ Todos pueden hablar ahora para decidir quién es el impostor.\n"
-        f"⏰ Tienen 3 minutos o hasta que el admin presione el botón.",
-        reply_markup=reply_markup,
-        parse_mode='Markdown'
-    )
+    count_call(game.turn_mode, 'sendMessage')
+    try:
+        warning_msg = await context.bot.send_message(
+            chat_id,
+            f"⚠️ Solo {game.get_current_player_name()} puede escribir ahora.\n💡 Usa /next_player para pasar turno.",
+            rate_limit_args=PRIORITY_LOW
+        )
+    except Exception as e:
+        logger.debug(f"No se pudo enviar aviso de turno en {chat_id}: {e}")
+        turn_warnings.pop(chat_id, None)
+        return
     
-    # Programar auto-inicio de votación después de 3 minutos si hay context con job_queue
-    if context and context.job_queue:
+    turn_warnings[chat_id] = warning_msg.message_id
+    if context.job_queue:
         context.job_queue.run_once(
-            auto_start_voting,
-            180,  # 3 minutos
-            data=chat_id
+            delete_turn_warning,
+            TURN_WARNING_DURATION,
+            data=(chat_id, game.turn_mode),
+            name=f"turn_warning_{chat_id}",
+            job_kwargs={'misfire_grace_time': None}
         )
+    else:
+        turn_warnings.pop(chat_id, None)
+
+async def delete_turn_warning(context):
+    """Borra el aviso de turno de un chat y abre la ventana para el siguiente"""
+    chat_id, turn_mode = context.job.data
+    message_id = turn_warnings.pop(chat_id, None)
+    if message_id is None:
+        return
+    count_call(turn_mode, 'deleteMessage')
+    try:
+        await context.bot.delete_message(chat_id, message_id, rate_limit_args=PRIORITY_LOW)
+    except Exception:
+        pass
+
+async def start_discussion(context, chat_id, game):
+    """Inicia la fase de discusión"""
+    # El mensaje de estado pasa a mostrar la discusión con el botón para votar
+    game.transition(STATE_DISCUSSING)
+    
+    # Programar auto-inicio de votación al terminar el tiempo de discusión
+    set_phase_timer(context.job_queue, game, "auto_start_voting", DISCUSSION_DURATION)
 
 async def start_voting_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Callback para iniciar votación"""
@@ -401,39 +804,35 @@ async def start_voting_callback(update: Update, context: ContextTypes.DEFAULT_TY
     chat_id = query.message.chat_id
     user = query.from_user
     
-    await query.answer()
-    
     if not await is_admin(context.bot, chat_id, user.id):
-        await query.edit_message_text("❌ Solo los administradores pueden iniciar la votación.")
+        await query.answer("❌ Solo los administradores pueden iniciar la votación.", show_alert=True)
         return
     
     if chat_id not in active_games:
-        await query.edit_message_text("❌ No hay juego activo.")
+        await query.answer("❌ No hay juego activo.", show_alert=True)
         return
     
     game = active_games[chat_id]
-    if game.state != "discussing":
-        await query.edit_message_text("❌ No estamos en fase de discusión.")
+    if game.state != STATE_DISCUSSING:
+        await query.answer("❌ No estamos en fase de discusión.", show_alert=True)
         return
     
-    await start_voting(context.bot, chat_id, game, query)
-    
-    # Programar auto-terminación de votación después de 30 segundos
-    if context.job_queue:
-        context.job_queue.run_once(
-            lambda ctx: end_voting(ctx.bot, chat_id, game), 
-            30,  # 30 segundos
-            data={'chat_id': chat_id, 'game': game}
-        )
+    await query.answer()
+    await start_voting(context, chat_id, game)
 
-async def start_voting(bot, chat_id, game, query=None):
-    """Inicia la votación"""
-    game.state = "voting"
-    game.votes.clear()
+async def start_voting(context, chat_id, game):
+    """Inicia la votación y programa su cierre automático"""
+    bot = context.bot
+    # Comprobar y cambiar de fase sin esperas intermedias para no abrir dos votaciones
+    if game.state != STATE_DISCUSSING:
+        logger.info(f"start_voting ignorado en chat {chat_id}: estado {game.state}")
+        return
+    game.transition(STATE_VOTING)
+    game.clear_votes()
     
     # Crear opciones de votación con los nombres en el mismo orden que players_order
-    options = [game.players[player_id]['name'] for player_id in game.players_order]
-    logger.info(f"Opciones de votación: {options} (orden: {game.players_order})")
+    options = [game.players[player_id].name for player_id in game.players_order]
+    logger.debug(f"Opciones de votación: {options} (orden: {game.players_order})", extra=game_fields(game))
     
     poll = await bot.send_poll(
         chat_id=chat_id,
@@ -445,20 +844,10 @@ async def start_voting(bot, chat_id, game, query=None):
     )
     
     game.voting_poll_id = poll.poll.id
+    register_poll(game.voting_poll_id, chat_id, POLL_KIND_VOTE)
     
-    # Crear botón para que admin termine votación
-    keyboard = [[InlineKeyboardButton("⏹️ Terminar votación (Admin)", callback_data="end_voting")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    if query:
-        await query.edit_message_text("🗳️ **VOTACIÓN INICIADA**\n\n⏰ Tienen 30 segundos para votar en la encuesta de arriba.")
-        await bot.send_message(chat_id, "⚡ Admin puede terminar la votación inmediatamente:", reply_markup=reply_markup)
-    else:
-        await bot.send_message(chat_id, "🗳️ **VOTACIÓN INICIADA**\n\n⏰ Tienen 30 segundos para votar en la encuesta de arriba.")
-        await bot.send_message(chat_id, "⚡ Admin puede terminar la votación inmediatamente:", reply_markup=reply_markup)
-    
-    # Programar auto-terminación de votación después de 1 minuto
-    # La votación se terminará manualmente o por tiempo en el callback
+    # Programar auto-terminación de votación; el admin puede terminarla antes con el botón
+    set_phase_timer(context.job_queue, game, "auto_end_voting", VOTE_DURATION)
 
 async def end_voting_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Callback para terminar votación inmediatamente"""
@@ -466,75 +855,72 @@ async def end_voting_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     chat_id = query.message.chat_id
     user = query.from_user
     
-    await query.answer()
-    
     if not await is_admin(context.bot, chat_id, user.id):
-        await query.edit_message_text("❌ Solo los administradores pueden terminar la votación.")
+        await query.answer("❌ Solo los administradores pueden terminar la votación.", show_alert=True)
         return
     
     if chat_id not in active_games:
-        await query.edit_message_text("❌ No hay juego activo.")
+        await query.answer("❌ No hay juego activo.", show_alert=True)
         return
     
     game = active_games[chat_id]
-    if game.state != "voting":
-        await query.edit_message_text("❌ No hay votación activa.")
+    if game.state != STATE_VOTING:
+        await query.answer("❌ No hay votación activa.", show_alert=True)
         return
     
-    await query.edit_message_text("🗺️ **Votación terminada por el admin**")
-    await end_voting(context.bot, chat_id, game)
+    await query.answer()
+    status_board.set_note(chat_id, "🗺️ Votación terminada por el admin")
+    await end_voting(context, chat_id, game)
+
+def show_round_result(game, result):
+    """Muestra el resultado de la votación en el mensaje de estado"""
+    status_board.set_note(game.chat_id, result)
+    status_board.request_update(game)
 
-async def end_voting(bot, chat_id, game):
+async def end_voting(context, chat_id, game):
     """Termina la votación y procesa resultados"""
-    if chat_id not in active_games or game.state != "voting":
+    bot = context.bot
+    if chat_id not in active_games or game.state != STATE_VOTING:
         logger.info(f"end_voting llamado pero juego no está en estado voting. Estado: {getattr(game, 'state', 'no_game')}")
         return
     
-    logger.info(f"Terminando votación para chat {chat_id}")
+    logger.info(f"Terminando votación para chat {chat_id}", extra=game_fields(game))
     
     # Cambiar estado inmediatamente para evitar llamadas múltiples
-    game.state = "processing_votes"
+    game.transition(STATE_PROCESSING)
+    unregister_poll(game.voting_poll_id)
     
     # Parar la encuesta
     try:
         await bot.stop_poll(chat_id, game.voting_poll_id)
-        await bot.send_message(chat_id, "⏱️ **VOTACIÓN TERMINADA**")
     except Exception as e:
         logger.warning(f"Error stopping poll: {e}")
     
     # Verificar si hay votos
     if not game.votes:
-        await bot.send_message(
-            chat_id,
-            f"🤷 **NADIE VOTÓ**\n\n"
-            f"🔄 No se elimina a nadie. Continuamos con la siguiente ronda..."
-        )
+        show_round_result(game, "🤷 NADIE VOTÓ. No se elimina a nadie; continuamos con la siguiente ronda...")
         # Continuar a la siguiente ronda sin eliminar a nadie
-        await asyncio.sleep(2)
-        await start_round(bot, chat_id, game)
+        set_phase_timer(context.job_queue, game, "next_round", RESULTS_DELAY)
         return
     
     # Mostrar resumen de votos para debug
-    logger.info(f"Votos recibidos: {game.votes}")
-    logger.info(f"Orden de jugadores: {game.players_order}")
-    logger.info(f"Impostores: {game.impostors}")
+    logger.debug(
+        f"Votos recibidos: {game.votes}. Orden de jugadores: {game.players_order}. Impostores: {game.impostors}",
+        extra=game_fields(game)
+    )
     
     # Procesar votos y encontrar al más votado
+    game.count_correct_votes()
     most_voted_player = game.get_most_voted_player()
     
     if not most_voted_player:
-        await bot.send_message(
-            chat_id,
-            f"🤷 **EMPATE EN VOTACIÓN**\n\n"
-            f"🔄 No se elimina a nadie. Continuamos con la siguiente ronda..."
-        )
-        await asyncio.sleep(2)
-        await start_round(bot, chat_id, game)
+        show_round_result(game, "🤷 EMPATE EN VOTACIÓN. No se elimina a nadie; continuamos con la siguiente ronda...")
+        set_phase_timer(context.job_queue, game, "next_round", RESULTS_DELAY)
         return
     
     # Alguien fue votado
-    player_name = game.players[most_voted_player]['name']
-    vote_count = sum(1 for vote in game.votes.values() if vote == game.players_order.index(most_voted_player))
+    player_name = game.players[most_voted_player].name
+    vote_count = game.vote_tally.max_votes  # Votos del más votado
     
     if most_voted_player in game.impostors:
         # ¡Atraparon a un impostor!
@@ -544,70 +930,64 @@ async def end_voting(bot, chat_id, game):
         
         if impostors_left == 0:
             # Todos los impostores eliminados - Ciudadanos ganan
+            game.winner = 'citizen'
             await bot.send_message(
                 chat_id,
                 f"🎯 **¡IMPOSTOR ELIMINADO!**\n\n"
                 f"👹 **{player_name}** era impostor ({vote_count} votos).\n\n"
                 f"🏆 **¡VICTORIA DE LOS CIUDADANOS!**\n\n"
                 f"🎮 **¡JUEGO TERMINADO!** Todos los impostores eliminados.\n\n"
-                f"👹 Impostores eliminados: {', '.join([game.players[p]['name'] for p in game.eliminated_players if p in game.players])}\n"
-                f"👤 Ciudadanos: {', '.join([game.players[p]['name'] for p in game.citizens])}",
+                f"👹 Impostores eliminados: {', '.join([game.players[p].name for p in game.eliminated_players if p in game.players])}\n"
+                f"👤 Ciudadanos: {', '.join([game.players[p].name for p in game.citizens])}",
                 parse_mode='Markdown'
             )
             await end_game(chat_id)
         else:
             # Aún quedan impostores - continuar juego
-            await bot.send_message(
-                chat_id,
-                f"🎯 **¡IMPOSTOR ELIMINADO!**\n\n"
-                f"👹 **{player_name}** era impostor ({vote_count} votos).\n\n"
-                f"⚠️ Aún quedan {impostors_left} impostor(es) activo(s).\n"
-                f"🔄 Continuamos a la siguiente ronda...",
-                parse_mode='Markdown'
+            result = (
+                f"🎯 ¡IMPOSTOR ELIMINADO! {player_name} era impostor ({vote_count} votos).\n"
+                f"⚠️ Aún quedan {impostors_left} impostor(es) activo(s)."
             )
             
             if game.current_round >= game.max_rounds:
                 # Se acabaron las rondas pero quedan impostores
+                game.winner = 'impostor'
                 await bot.send_message(
                     chat_id,
+                    f"{result}\n\n"
                     f"🎮 **¡JUEGO TERMINADO!**\n\n"
                     f"🏆 **¡VICTORIA DE LOS IMPOSTORES!**\n\n"
-                    f"Impostores restantes: {', '.join([game.players[p]['name'] for p in game.impostors])}",
+                    f"Impostores restantes: {', '.join([game.players[p].name for p in game.impostors])}",
                     parse_mode='Markdown'
                 )
                 await end_game(chat_id)
             else:
-                await asyncio.sleep(3)
-                await start_round(bot, chat_id, game)
+                show_round_result(game, f"{result}\n🔄 Continuamos a la siguiente ronda...")
+                set_phase_timer(context.job_queue, game, "next_round", RESULTS_DELAY)
     else:
         # No atraparon al impostor (eliminaron a un ciudadano)
-        await bot.send_message(
-            chat_id,
-            f"❌ **IMPOSTOR NO DESCUBIERTO**\n\n"
-            f"👤 **{player_name}** era ciudadano ({vote_count} votos).\n"
-            f"👹 El impostor sigue entre nosotros...",
-            parse_mode='Markdown'
+        result = (
+            f"❌ IMPOSTOR NO DESCUBIERTO. {player_name} era ciudadano ({vote_count} votos).\n"
+            f"👹 El impostor sigue entre nosotros..."
         )
         
         if game.current_round >= game.max_rounds:
             # Juego terminado, ganan los impostores
+            game.winner = 'impostor'
             await bot.send_message(
                 chat_id,
+                f"{result}\n\n"
                 f"🎮 **¡JUEGO TERMINADO!**\n\n"
                 f"🏆 **¡VICTORIA DE LOS IMPOSTORES!**\n\n"
-                f"👹 Impostores: {', '.join([game.players[p]['name'] for p in game.impostors])}\n"
-                f"👤 Ciudadanos: {', '.join([game.players[p]['name'] for p in game.citizens])}",
+                f"👹 Impostores: {', '.join([game.players[p].name for p in game.impostors])}\n"
+                f"👤 Ciudadanos: {', '.join([game.players[p].name for p in game.citizens])}",
                 parse_mode='Markdown'
             )
             await end_game(chat_id)
         else:
             # Siguiente ronda
-            await bot.send_message(
-                chat_id,
-                f"🔄 Continuamos con la siguiente ronda..."
-            )
-            await asyncio.sleep(3)
-            await start_round(bot, chat_id, game)
+            show_round_result(game, f"{result}\n🔄 Continuamos con la siguiente ronda...")
+            set_phase_timer(context.job_queue, game, "next_round", RESULTS_DELAY)
 
 async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /cancel - Cancela el juego actual"""
@@ -619,7 +999,7 @@ async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     if chat_id in active_games:
-        del active_games[chat_id]
+        await end_game(chat_id)
         await update.message.reply_text("🚫 **Juego cancelado**")
     else:
         await update.message.reply_text("❌ No hay juego activo para cancelar.")
@@ -638,17 +1018,9 @@ async def end_meet_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     game = active_games[chat_id]
-    if game.state == "discussing":
+    if game.state == STATE_DISCUSSING:
         await update.message.reply_text("🗣️ **Terminando discusión por comando del admin...**")
-        await start_voting(context.bot, chat_id, game)
-        
-        # Programar auto-terminación de votación después de 30 segundos
-        if context.job_queue:
-            context.job_queue.run_once(
-                lambda ctx: end_voting(ctx.bot, chat_id, game), 
-                30,
-                data={'chat_id': chat_id, 'game': game}
-            )
+        await start_voting(context, chat_id, game)
     else:
         await update.message.reply_text("❌ No estamos en fase de discusión.")
 
@@ -664,7 +1036,7 @@ async def next_player_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     game = active_games[chat_id]
     
     # Solo durante las rondas de juego
-    if game.state != "playing_round":
+    if game.state != STATE_PLAYING:
         await update.message.reply_text("❌ No estamos en una ronda de juego.")
         return
     
@@ -680,18 +1052,103 @@ async def next_player_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     # Pasar al siguiente jugador
     game.next_player()
+    mark_game_dirty(game)
     
     if game.all_players_played():
         # Todos jugaron, mostrar resumen y empezar discusión
         summary = game.get_round_words_summary()
         await context.bot.send_message(chat_id, summary)
-        await start_discussion(context.bot, chat_id, game, context)
+        await start_discussion(context, chat_id, game)
     else:
-        # Siguiente turno
+        # Siguiente turno: se muestra en el mensaje de estado sin esperas y, en modo "mute", pasa la palabra
+        status_board.update_now(game, PRIORITY_HIGH)
+        turn_guard.sync(game)
+
+async def pack_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /pack [paquete] [categoría] - Muestra o cambia el paquete de palabras del grupo"""
+    chat_id = update.effective_chat.id
+    user = update.effective_user
+    pack_name, category = chat_word_settings.get(chat_id, (None, None))
+    
+    if not context.args:
+        current = get_pack(pack_name)
         await update.message.reply_text(
-            f"✅ Turno de {game.get_current_player_name()}\n"
-            f"💬 Solo esta persona puede escribir ahora."
+            f"📚 Paquete actual: {current.name}" + (f" ({category})" if category else "") + "\n\n"
+            f"📦 Disponibles: {', '.join(available_packs())}\n"
+            f"🗂️ Categorías de {current.name}: {', '.join(current.categories)}\n\n"
+            f"Usa /pack <paquete> [categoría] para cambiarlo."
         )
+        return
+    
+    if not await is_admin(context.bot, chat_id, user.id):
+        await update.message.reply_text("❌ Solo los administradores pueden cambiar el paquete de palabras.")
+        return
+    
+    pack_name = context.args[0]
+    category = ' '.join(context.args[1:]) or None
+    try:
+        pack = get_pack(pack_name)
+    except KeyError:
+        await update.message.reply_text(f"❌ No existe el paquete '{pack_name}'. Disponibles: {', '.join(available_packs())}")
+        return
+    if category and category not in pack.categories:
+        await update.message.reply_text(f"❌ El paquete {pack.name} no tiene la categoría '{category}'. Categorías: {', '.join(pack.categories)}")
+        return
+    
+    chat_word_settings[chat_id] = (pack.name, category)
+    if game_store:
+        await game_store.save_chat_settings(chat_id, pack.name, category)
+    
+    # Un juego que aún no ha repartido roles usa ya el paquete nuevo
+    game = active_games.get(chat_id)
+    if game and game.state == STATE_WAITING:
+        game.word_pack, game.word_category = pack.name, category
+        mark_game_dirty(game)
+    
+    await update.message.reply_text(
+        f"✅ Paquete de palabras: {pack.name}" + (f" ({category})" if category else "") + f" - {len(pack.indices(category))} palabras"
+    )
+
+TURN_MODE_DESCRIPTIONS = {
+    TURN_MODE_DELETE: "delete - se borra cada mensaje fuera de turno y se avisa de quién tiene el turno",
+    TURN_MODE_MUTE: "mute - los jugadores sin turno quedan silenciados durante la ronda (el bot necesita poder restringir miembros)",
+}
+
+async def turn_mode_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /turn_mode [delete|mute] - Muestra o cambia cómo se hacen respetar los turnos en el grupo"""
+    chat_id = update.effective_chat.id
+    user = update.effective_user
+
+    if not context.args:
+        current = chat_turn_modes.get(chat_id, TURN_MODE)
+        await update.message.reply_text(
+            f"🔇 Control de turnos actual: {TURN_MODE_DESCRIPTIONS.get(current, current)}\n\n"
+            f"Disponibles:\n" + "\n".join(f"• {text}" for text in TURN_MODE_DESCRIPTIONS.values()) + "\n\n"
+            f"Usa /turn_mode <modo> para cambiarlo."
+        )
+        return
+
+    if not await is_admin(context.bot, chat_id, user.id):
+        await update.message.reply_text("❌ Solo los administradores pueden cambiar el control de turnos.")
+        return
+
+    mode = context.args[0].lower()
+    if mode not in TURN_MODES:
+        await update.message.reply_text(f"❌ No existe el modo '{mode}'. Disponibles: {', '.join(TURN_MODES)}")
+        return
+
+    chat_turn_modes[chat_id] = mode
+    if game_store:
+        await game_store.save_turn_mode(chat_id, mode)
+
+    # El juego en curso cambia ya: si la ronda está en marcha se silencia o se devuelve la palabra
+    game = active_games.get(chat_id)
+    if game:
+        game.turn_mode = mode
+        mark_game_dirty(game)
+        turn_guard.sync(game)
+
+    await update.message.reply_text(f"✅ Control de turnos: {TURN_MODE_DESCRIPTIONS[mode]}")
 
 async def check_game_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /check_game - Muestra el estado actual del juego"""
@@ -706,15 +1163,15 @@ async def check_game_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     # Construir mensaje de estado sin Markdown para evitar errores
     status_msg = f"🎮 ESTADO DEL JUEGO\n\n"
     status_msg += f"🔄 Ronda: {game.current_round}/{game.max_rounds}\n"
-    status_msg += f"👥 Jugadores activos: {len([p for p in game.players_order if p not in game.eliminated_players])}\n"
+    status_msg += f"👥 Jugadores activos: {len(game.active_players)}\n"
     
     if game.eliminated_players:
-        eliminated_names = [game.players[p]['name'] for p in game.eliminated_players if p in game.players]
+        eliminated_names = [game.players[p].name for p in game.eliminated_players if p in game.players]
         status_msg += f"❌ Eliminados: {', '.join(eliminated_names)}\n"
     
     status_msg += f"\n⚙️ Estado: {game.state}\n"
     
-    if game.state == "playing_round" and game.current_player:
+    if game.state == STATE_PLAYING and game.current_player:
         status_msg += f"🎯 Turno actual: {game.get_current_player_name()}\n"
     
     # Mostrar palabras de la ronda actual
@@ -725,80 +1182,288 @@ async def check_game_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     await update.message.reply_text(status_msg)
 
+def stats_scope(update: Update, args) -> tuple:
+    """(chat de las estadísticas, descripción): el grupo, o todos con "global" o por privado"""
+    if update.effective_chat.type == ChatType.PRIVATE or (args and args[0].lower() == 'global'):
+        return GLOBAL_CHAT, "en todos los grupos"
+    return update.effective_chat.id, "en este grupo"
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /stats [global] - Estadísticas del usuario (o de aquel a quien responde)"""
+    if not stats_store:
+        await update.message.reply_text("❌ Las estadísticas están desactivadas.")
+        return
+    
+    reply = update.message.reply_to_message
+    user = reply.from_user if reply and reply.from_user and not reply.from_user.is_bot else update.effective_user
+    chat_id, scope = stats_scope(update, context.args)
+    await stats_store.flush_async()  # Incluir los juegos recién terminados
+    stats = await stats_store.player(chat_id, user.id)
+    
+    if not stats:
+        await update.message.reply_text(f"📊 {user.first_name} aún no ha terminado ninguna partida {scope}.")
+        return
+    
+    await update.message.reply_text(
+        f"📊 ESTADÍSTICAS DE {stats.name} {scope.upper()}\n\n"
+        f"🎮 Partidas: {stats.games}\n"
+        f"🏆 Victorias: {stats.wins} ({stats.wins * 100 // stats.games}%)\n"
+        f"👹 Como impostor: {stats.impostor_wins}\n"
+        f"👤 Como ciudadano: {stats.citizen_wins}\n"
+        f"🚨 Veces atrapado: {stats.caught}\n"
+        f"🎯 Votos acertados: {stats.correct_votes}"
+    )
+
+LEADERBOARD_MEDALS = ("🥇", "🥈", "🥉")
+
+async def leaderboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /leaderboard [global] - Clasificación de jugadores por victorias"""
+    if not stats_store:
+        await update.message.reply_text("❌ Las estadísticas están desactivadas.")
+        return
+    
+    chat_id, scope = stats_scope(update, context.args)
+    await stats_store.flush_async()  # Incluir los juegos recién terminados
+    games, impostor_wins, citizen_wins = await stats_store.chat_totals(chat_id)
+    top = await stats_store.leaderboard(chat_id, LEADERBOARD_SIZE)
+    
+    if not top:
+        await update.message.reply_text(f"🏆 Aún no hay partidas terminadas {scope}.")
+        return
+    
+    lines = [
+        f"🏆 CLASIFICACIÓN {scope.upper()}\n",
+        f"🎮 {games} partidas: {impostor_wins} victorias de impostores, {citizen_wins} de ciudadanos\n",
+    ]
+    for position, stats in enumerate(top, 1):
+        medal = LEADERBOARD_MEDALS[position - 1] if position <= len(LEADERBOARD_MEDALS) else f"{position}."
+        lines.append(
+            f"{medal} {stats.name}: {stats.wins} victorias en {stats.games} partidas, "
+            f"{stats.correct_votes} votos acertados"
+        )
+    await update.message.reply_text("\n".join(lines))
+
 async def is_admin(bot, chat_id, user_id):
     """Verifica si el usuario es administrador del grupo"""
-    try:
-        member = await bot.get_chat_member(chat_id, user_id)
-        return member.status in ['administrator', 'creator']
-    except Exception as e:
-        logger.warning(f"Error verificando admin status para {user_id} en {chat_id}: {e}")
-        # En caso de error, permitir para evitar bloqueos
-        return True
+    return await admin_cache.is_admin(bot, chat_id, user_id)
 
-async def auto_continue_game(context):
-    """Auto-continúa el juego después de 3 minutos"""
-    chat_id = context.job.data
-    if chat_id in active_games:
-        game = active_games[chat_id]
-        # Solo auto-continuar si está esperando jugadores
-        if game.state == "waiting_for_players" and len(game.players) >= 3:
-            # Auto-continuar configurando impostores y empezando
-            max_impostors = max(1, len(game.players) // 3)
-            game.num_impostors = 1  # Default 1 impostor
-            game.max_rounds = 3     # Default 3 rounds
-            
-            await context.bot.send_message(
-                chat_id,
-                f"⏰ **TIEMPO AGOTADO - AUTO-INICIANDO JUEGO**\n\n"
-                f"👥 Jugadores: {len(game.players)}\n"
-                f"👹 Impostores: 1\n"
-                f"🔄 Rondas: 3"
-            )
-            
-            await start_game_rounds(context.bot, chat_id, game)
-        elif game.state == "waiting_for_players" and len(game.players) < 3:
-            await context.bot.send_message(
-                chat_id,
-                f"⏰ **TIEMPO AGOTADO**\n\n"
-                f"❌ No hay suficientes jugadores ({len(game.players)}/3 mínimo)\n"
-                f"🚫 Cancelando juego..."
-            )
-            await end_game(chat_id)
-        # Si el juego ya está en progreso, no hacer nada
+async def chat_member_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Mantiene la caché de administradores al día con los cambios de miembros"""
+    member_update = update.chat_member
+    new_member = member_update.new_chat_member
+    admin_cache.update_member(member_update.chat.id, new_member.user.id, new_member.status)
 
-async def auto_start_voting(context):
-    """Auto-inicia votación después de 2 minutos"""
-    chat_id = context.job.data
-    if chat_id in active_games:
-        game = active_games[chat_id]
-        if game.state == "discussing":
-            await context.bot.send_message(
-                chat_id,
-                "⏰ **TIEMPO DE DISCUSIÓN AGOTADO**\n\nIniciando votación automáticamente..."
-            )
-            await start_voting(context.bot, chat_id, game)
+async def auto_continue_game(context, chat_id, game):
+    """Auto-continúa el juego cuando se agota el tiempo de la encuesta"""
+    # Solo auto-continuar si está esperando jugadores
+    if game.state != STATE_WAITING:
+        return
+    
+    if len(game.players) >= 3:
+        # Auto-continuar configurando impostores y empezando
+        game.num_impostors = 1  # Default 1 impostor
+        game.max_rounds = 3     # Default 3 rounds
+        
+        status_board.set_note(chat_id, "⏰ Tiempo agotado: el juego empieza con 1 impostor y 3 rondas")
+        await start_game_rounds(context, chat_id, game)
+    else:
+        await context.bot.send_message(
+            chat_id,
+            f"⏰ **TIEMPO AGOTADO**\n\n"
+            f"❌ No hay suficientes jugadores ({len(game.players)}/3 mínimo)\n"
+            f"🚫 Cancelando juego..."
+        )
+        await end_game(chat_id)
 
-async def auto_start_voting(context):
-    """Auto-inicia votación después de 3 minutos"""
-    chat_id = context.job.data
-    if chat_id in active_games:
-        game = active_games[chat_id]
-        # Solo iniciar votación si estamos en discusión
-        if game.state == "discussing":
-            await context.bot.send_message(
-                chat_id,
-                "⏰ **TIEMPO DE DISCUSIÓN AGOTADO**\n\nIniciando votación automáticamente..."
+async def auto_start_voting(context, chat_id, game):
+    """Auto-inicia votación cuando se agota el tiempo de discusión"""
+    # Solo iniciar votación si estamos en discusión
+    if game.state != STATE_DISCUSSING:
+        return
+    
+    status_board.set_note(chat_id, "⏰ Tiempo de discusión agotado: votación iniciada automáticamente")
+    await start_voting(context, chat_id, game)
+
+async def auto_end_voting(context, chat_id, game):
+    """Cierra la votación cuando se agota su tiempo"""
+    await end_voting(context, chat_id, game)
+
+# Acciones que pueden programarse como temporizador de fase
+PHASE_TIMERS = {
+    "auto_continue": auto_continue_game,
+    "begin_round": start_round,
+    "auto_start_voting": auto_start_voting,
+    "auto_end_voting": auto_end_voting,
+    "next_round": start_round,
+}
+
+# Temporizador por defecto de cada fase, para juegos restaurados sin temporizador pendiente
+DEFAULT_PHASE_TIMERS = {
+    STATE_WAITING: ("auto_continue", POLL_DURATION),
+    STATE_REVEALING: ("begin_round", ROLE_REVEAL_DELAY),
+    STATE_DISCUSSING: ("auto_start_voting", DISCUSSION_DURATION),
+    STATE_VOTING: ("auto_end_voting", VOTE_DURATION),
+    STATE_PROCESSING: ("next_round", RESULTS_DELAY),
+}
+
+def restore_games(job_queue):
+    """Recarga los juegos guardados y vuelve a programar sus temporizadores de fase"""
+    restored = 0
+    for game in game_store.load_all():
+        if chat_filter and not chat_filter(game.chat_id):
+            continue
+        if game.state == STATE_FINISHED:
+            game_store.discard(game.chat_id)
+            continue
+        
+        add_game(game)
+        game.touch()  # El tiempo con el bot parado no cuenta como inactividad
+        turn_guard.sync(game)  # Permisos que quedaron a medias al parar el bot
+        if game.poll_message_id:
+            register_poll(game.poll_message_id, game.chat_id, POLL_KIND_JOIN)
+        if game.state == STATE_VOTING:
+            register_poll(game.voting_poll_id, game.chat_id, POLL_KIND_VOTE)
+        restored += 1
+        
+        # Respetar la hora límite original; si ya pasó, el temporizador se ejecuta enseguida
+        if game.phase_timer in PHASE_TIMERS and game.phase_deadline:
+            set_phase_timer(job_queue, game, game.phase_timer, max(0, game.phase_deadline - time.time()))
+        elif game.state in DEFAULT_PHASE_TIMERS:
+            name, delay = DEFAULT_PHASE_TIMERS[game.state]
+            set_phase_timer(job_queue, game, name, delay)
+    
+    logger.info(f"Juegos restaurados: {restored}")
+
+async def sweep_idle_games(context):
+    """Expulsa los juegos inactivos y limpia los restos de chats sin juego"""
+    now = time.time()
+    candidates = [
+        game for game in active_games.values()
+        if game.idle_seconds(now) > IDLE_TIMEOUTS.get(game.state, GAME_IDLE_TIMEOUT)
+    ]
+    idle = []
+    reclaimed = 0
+    for game in candidates:
+        async with chat_locks.hold(game.chat_id):
+            # Mientras se esperaba al chat pudo llegar actividad o terminar el juego
+            now = time.time()
+            if active_games.get(game.chat_id) is not game or game.idle_seconds(now) <= IDLE_TIMEOUTS.get(game.state, GAME_IDLE_TIMEOUT):
+                continue
+            size = game.approximate_size()
+            reclaimed += size
+            idle.append(game)
+            GAMES_EVICTED.inc(game.state)
+            EVICTED_BYTES.inc(amount=size)
+            logger.info(
+                f"Expulsando juego inactivo de {game.chat_id} en {game.state} ({game.idle_seconds(now):.0f}s sin actividad)",
+                extra=game_fields(game, 'evicted')
             )
-            await start_voting(context.bot, chat_id, game)
-            
-            # Programar auto-terminación de votación después de 30 segundos
-            if context.job_queue:
-                context.job_queue.run_once(
-                    lambda ctx: end_voting(ctx.bot, chat_id, game), 
-                    30,
-                    data={'chat_id': chat_id, 'game': game}
-                )
-        # Si no estamos en discusión, no hacer nada
+            await end_game(game.chat_id)
+    
+    # Restos que no se limpiaron al terminar un juego (encuestas, avisos, temporizadores, admins)
+    # y mazos de palabras de chats que llevan WORD_DECK_TTL segundos sin jugar
+    leftovers = 0
+    for poll_id in [poll_id for poll_id, (chat_id, _) in poll_index.items() if chat_id not in active_games]:
+        unregister_poll(poll_id)
+        leftovers += 1
+    for chat_id in [chat_id for chat_id in turn_warnings if chat_id not in active_games]:
+        del turn_warnings[chat_id]
+        leftovers += 1
+    for chat_id in [chat_id for chat_id in phase_jobs if chat_id not in active_games]:
+        cancel_phase_timer(chat_id)
+        leftovers += 1
+    leftovers += admin_cache.prune(active_games)
+    leftovers += prune_chat_decks(WORD_DECK_TTL, active_games)
+    
+    if idle or leftovers:
+        logger.info(
+            f"Barrido: {len(idle)} juego(s) inactivo(s) expulsado(s), ~{reclaimed / 1024:.1f} KiB liberados, "
+            f"{leftovers} resto(s) limpiados. Juegos activos: {len(active_games)}"
+        )
+    
+    results = await asyncio.gather(*(
+        context.bot.send_message(
+            game.chat_id,
+            "⌛ **Juego cancelado por inactividad**\n\nUn administrador puede empezar otro con /start",
+            parse_mode='Markdown',
+            rate_limit_args=PRIORITY_LOW
+        )
+        for game in idle
+    ), return_exceptions=True)
+    for game, result in zip(idle, results):
+        if isinstance(result, Exception):
+            logger.debug(f"No se pudo avisar de la expulsión en {game.chat_id}: {result}")
+
+async def flush_game_store(context):
+    """Escribe en lote los juegos modificados"""
+    await game_store.flush_async()
+
+async def flush_stats_store(context):
+    """Suma en lote los juegos terminados a las estadísticas"""
+    await stats_store.flush_async()
+
+def timing_settings():
+    """Tiempos del juego en vigor; se graban con los updates para reproducirlos con los mismos"""
+    return {
+        'POLL_DURATION': POLL_DURATION,
+        'VOTE_DURATION': VOTE_DURATION,
+        'DISCUSSION_DURATION': DISCUSSION_DURATION,
+        'ROLE_REVEAL_DELAY': ROLE_REVEAL_DELAY,
+        'RESULTS_DELAY': RESULTS_DELAY,
+        'TURN_WARNING_DURATION': TURN_WARNING_DURATION,
+        'STATUS_EDIT_INTERVAL': status_board.min_interval,
+    }
+
+async def record_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Graba cada update recibido antes de que lo vean los handlers del juego"""
+    update_recorder.record_update(update.to_dict())
+
+def record_poll_event(event, poll_id, chat_id):
+    """Graba las encuestas que registra el bot para poder enlazar sus respuestas al reproducir"""
+    if event == "register":
+        update_recorder.record_poll(poll_id, chat_id)
+
+async def flush_update_recorder(context):
+    """Escribe en lote los updates grabados"""
+    await update_recorder.flush_async()
+
+async def post_init(application):
+    """Abre el almacenamiento, restaura los juegos y levanta el servidor de métricas al arrancar"""
+    global metrics_server
+    status_board.bot = application.bot
+    turn_guard.bot = application.bot
+    if metrics_port:
+        # Listo cuando la aplicación ya atiende updates (tras restaurar los juegos)
+        metrics_server = MetricsServer(METRICS_HOST, metrics_port, ready=lambda: application.running)
+        await metrics_server.start()
+    application.job_queue.run_repeating(sweep_idle_games, GAME_SWEEP_INTERVAL, name="sweep_idle_games")
+    if game_store:
+        game_store.open()
+        chat_word_settings.update(game_store.load_chat_settings())
+        chat_turn_modes.update(game_store.load_turn_modes())
+        restore_games(application.job_queue)
+        application.job_queue.run_repeating(flush_game_store, STORE_FLUSH_INTERVAL, name="flush_game_store")
+    if stats_store:
+        stats_store.open()
+        application.job_queue.run_repeating(flush_stats_store, STORE_FLUSH_INTERVAL, name="flush_stats_store")
+    if update_recorder:
+        update_recorder.open()
+        update_recorder.record_settings(timing_settings())
+        poll_listeners.append(record_poll_event)
+        application.job_queue.run_repeating(flush_update_recorder, RECORD_FLUSH_INTERVAL, name="flush_update_recorder")
+
+async def post_shutdown(application):
+    """Guarda los cambios pendientes, cierra el almacenamiento y para el servidor de métricas"""
+    if game_store:
+        game_store.flush()
+        game_store.close()
+    if stats_store:
+        stats_store.flush()
+        stats_store.close()
+    if metrics_server:
+        await metrics_server.stop()
+    if update_recorder:
+        update_recorder.close()
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Log the error and send a telegram message to notify the developer."""
@@ -817,17 +1482,40 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
 
 async def end_game(chat_id):
     """Termina y limpia el juego"""
-    if chat_id in active_games:
-        del active_games[chat_id]
+    game = active_games.pop(chat_id, None)
+    if game:
+        game.transition(STATE_FINISHED)
+        unregister_poll(game.poll_message_id)
+        unregister_poll(game.voting_poll_id)
 
-def main():
-    """Función principal del bot"""
-    if not BOT_TOKEN:
-        logger.error("BOT_TOKEN no encontrado. Verifica tu archivo .env")
-        return
-    
-    # Crear aplicación
-    application = Application.builder().token(BOT_TOKEN).build()
+# Tipos de update que usan los handlers registrados; el resto no se pide a Telegram
+ALLOWED_UPDATES = [
+    Update.MESSAGE,
+    Update.CALLBACK_QUERY,
+    Update.POLL_ANSWER,
+    Update.CHAT_MEMBER,
+]
+
+def build_application(token, base_url=None, with_updater=True, request=None, update_processor=None):
+    """Crea la aplicación con todos los handlers registrados.
+    Sin updater, los updates se inyectan desde fuera (workers del modo multiproceso).
+    request sustituye el transporte HTTP de la Bot API (benchmarks en proceso).
+    update_processor sustituye al procesamiento concurrente con orden por chat"""
+    builder = (
+        Application.builder()
+        # Clientes HTTP separados para getUpdates y para los envíos (BOT_HTTP_* y UPDATES_HTTP_*)
+        .bot(build_bot(token, base_url=base_url, request=request, rate_limiter=outbound))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if not with_updater:
+        builder = builder.updater(None)
+    if update_processor is None and MAX_CONCURRENT_UPDATES > 1:
+        # Chats distintos a la vez; dentro de un chat, un update detrás de otro y en orden
+        update_processor = ChatUpdateProcessor(MAX_CONCURRENT_UPDATES, update_chat_id, chat_locks)
+    if update_processor is not None:
+        builder = builder.concurrent_updates(update_processor)
+    application = builder.build()
     
     # Agregar handlers
     application.add_handler(CommandHandler("start", start_command))
@@ -835,6 +1523,10 @@ def main():
     application.add_handler(CommandHandler("end_meet", end_meet_command))
     application.add_handler(CommandHandler("next_player", next_player_command))
     application.add_handler(CommandHandler("check_game", check_game_command))
+    application.add_handler(CommandHandler("pack", pack_command))
+    application.add_handler(CommandHandler("turn_mode", turn_mode_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("leaderboard", leaderboard_command))
     
     # Callbacks
     application.add_handler(CallbackQueryHandler(continue_game_callback, pattern="^continue_game$"))
@@ -845,14 +1537,65 @@ def main():
     
     # Handlers de encuestas y mensajes
     application.add_handler(PollAnswerHandler(poll_answer_handler))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_messages))
+    application.add_handler(ChatMemberHandler(chat_member_handler, ChatMemberHandler.CHAT_MEMBER))
+    # Solo los chats en ronda de turnos: el resto del texto se descarta al comprobar los filtros
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND & playing_chat_filter, handle_messages))
+    
+    # Grabación de updates (primer grupo: antes que cualquier otro handler)
+    if update_recorder:
+        application.add_handler(TypeHandler(Update, record_update), group=-1000)
+    
+    # Latencia y errores por handler
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = instrumented(handler.callback)
     
     # Error handler
     application.add_error_handler(error_handler)
     
+    return application
+
+def run_webhook(application):
+    """Sirve los updates con el servidor de webhooks integrado de python-telegram-bot"""
+    if not WEBHOOK_URL:
+        logger.error("WEBHOOK_URL no encontrado. Es obligatorio con BOT_MODE=webhook")
+        return
+    
+    # Telegram envía este token en cada petición; sin él el servidor rechaza el update
+    secret_token = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    application.run_webhook(
+        listen=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        url_path=WEBHOOK_PATH,
+        webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+        secret_token=secret_token,
+        allowed_updates=ALLOWED_UPDATES,
+        drop_pending_updates=DROP_PENDING_UPDATES
+    )
+
+def main():
+    """Función principal del bot"""
+    if not BOT_TOKEN:
+        logger.error("BOT_TOKEN no encontrado. Verifica tu archivo .env")
+        return
+    
+    if SHARD_WORKERS > 0:
+        # Un proceso frontal recibe los updates y los reparte entre workers por chat
+        from sharding import build_front_application
+        application = build_front_application(BOT_TOKEN, SHARD_WORKERS, base_url=BOT_API_BASE_URL)
+    else:
+        application = build_application(BOT_TOKEN, base_url=BOT_API_BASE_URL)
+    
     # Iniciar bot
-    logger.info("Bot iniciado")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    logger.info(f"Bot iniciado en modo {BOT_MODE}" + (f" con {SHARD_WORKERS} workers" if SHARD_WORKERS else ""))
+    if BOT_MODE == "webhook":
+        run_webhook(application)
+    else:
+        application.run_polling(
+            allowed_updates=ALLOWED_UPDATES,
+            timeout=GET_UPDATES_TIMEOUT,
+            drop_pending_updates=DROP_PENDING_UPDATES
+        )
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,31 @@
+"""
+Filtros de mensajes por chat
+Rechazan los mensajes de chats sin juego (o fuera de la ronda de turnos) al comprobar los
+filtros, antes de llamar a ningún handler. Consultan conjuntos de chats que el bot mantiene al
+día con los cambios de fase, así que cada comprobación es una búsqueda en un set
+"""
+
+from typing import Container
+
+from telegram import Message
+from telegram.ext.filters import MessageFilter
+
+from metrics import Counter
+
+MESSAGES_FILTERED = Counter(
+    'impostor_messages_filtered_total', 'Mensajes descartados por los filtros de chat antes de llegar a un handler', ('filter',)
+)
+
+class ChatSetFilter(MessageFilter):
+    """Deja pasar los mensajes de los chats de `chats` y cuenta los demás como descartados.
+    Negado (~filtro), los descartados son justo los que deja pasar"""
+
+    def __init__(self, chats: Container[int], name: str):
+        super().__init__(name=name)
+        self.chats = chats  # Se consulta en cada mensaje; quien lo creó lo mantiene al día
+
+    def filter(self, message: Message) -> bool:
+        if message.chat_id in self.chats:
+            return True
+        MESSAGES_FILTERED.inc(self.name)
+        return False
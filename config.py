@@ -10,13 +10,113 @@ load_dotenv()
 # Token del bot de Telegram
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 
+# Modo de recepción de updates: "polling" (por defecto) o "webhook"
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+# URL base de la Bot API; solo se cambia para apuntar a un servidor local de pruebas
+BOT_API_BASE_URL = os.getenv('BOT_API_BASE_URL')
+
+# Modo multiproceso: número de workers entre los que se reparten los chats (0 = un solo proceso)
+SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', '0'))
+
+# Webhook (solo con BOT_MODE=webhook)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # URL pública HTTPS, p. ej. https://mi-dominio.com
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')  # Si falta, se genera uno aleatorio en cada arranque
+
+# Clientes HTTP de la Bot API: uno para getUpdates (long polling) y otro para el resto de llamadas,
+# cada uno con su pool de conexiones, keep-alive, HTTP/2 y timeouts (segundos)
+def _http_settings(prefix: str, pool_size: int, keepalive: int, pool_timeout: float) -> dict:
+    """Ajustes de un cliente leídos de <prefix>_POOL_SIZE, <prefix>_KEEPALIVE, <prefix>_HTTP2, <prefix>_READ_TIMEOUT..."""
+    return {
+        'pool_size': int(os.getenv(f'{prefix}_POOL_SIZE', str(pool_size))),  # Conexiones abiertas como máximo
+        'keepalive': int(os.getenv(f'{prefix}_KEEPALIVE', str(keepalive))),  # Conexiones inactivas que se conservan (0 = ninguna)
+        'keepalive_expiry': float(os.getenv(f'{prefix}_KEEPALIVE_EXPIRY', '30')),  # Segundos que se conserva una conexión inactiva
+        'http2': os.getenv(f'{prefix}_HTTP2', 'false').lower() in ('1', 'true', 'yes'),  # Requiere python-telegram-bot[http2]
+        'connect_timeout': float(os.getenv(f'{prefix}_CONNECT_TIMEOUT', '5')),
+        'read_timeout': float(os.getenv(f'{prefix}_READ_TIMEOUT', '5')),  # En getUpdates se suma GET_UPDATES_TIMEOUT
+        'write_timeout': float(os.getenv(f'{prefix}_WRITE_TIMEOUT', '5')),
+        'pool_timeout': float(os.getenv(f'{prefix}_POOL_TIMEOUT', str(pool_timeout))),  # Espera por una conexión libre del pool
+    }
+
+# Con el limitador de envíos rara vez hay más de unas pocas llamadas en curso; un pool mayor no
+# acelera nada y cada conexión de más encarece el reparto de peticiones del pool de httpcore
+BOT_HTTP = _http_settings('BOT_HTTP', pool_size=64, keepalive=32, pool_timeout=5)
+UPDATES_HTTP = _http_settings('UPDATES_HTTP', pool_size=1, keepalive=1, pool_timeout=5)  # Solo hay un getUpdates a la vez
+
+# getUpdates (modo polling): updates por petición (1-100) y segundos que Telegram retiene la petición sin updates
+GET_UPDATES_LIMIT = int(os.getenv('GET_UPDATES_LIMIT', '100'))
+GET_UPDATES_TIMEOUT = int(os.getenv('GET_UPDATES_TIMEOUT', '30'))
+# Descartar los updates que llegaron con el bot parado (en polling y al registrar el webhook)
+DROP_PENDING_UPDATES = os.getenv('DROP_PENDING_UPDATES', 'false').lower() in ('1', 'true', 'yes')
+
+# Métricas de Prometheus y sondas de salud (/metrics, /healthz, /readyz). Puerto 0 = desactivado
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+
+# Grabación de updates (JSONL con gzip) para reproducirlos con benchmarks/replay.py. Vacío = desactivada
+RECORD_UPDATES_PATH = os.getenv('RECORD_UPDATES_PATH', '')
+RECORD_FLUSH_INTERVAL = float(os.getenv('RECORD_FLUSH_INTERVAL', '1'))  # Segundos entre escrituras por lote
+
+# Updates procesados a la vez entre todos los chats (los de un mismo chat van siempre de uno en uno).
+# 1 = todos en orden, uno detrás de otro
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '256'))
+
+# Límites de memoria: juegos simultáneos (0 = sin límite) y expulsión de juegos inactivos
+MAX_ACTIVE_GAMES = int(os.getenv('MAX_ACTIVE_GAMES', '0'))
+GAME_IDLE_TIMEOUT_WAITING = float(os.getenv('GAME_IDLE_TIMEOUT_WAITING', '600'))  # Sala de espera sin nadie que se una
+GAME_IDLE_TIMEOUT_PLAYING = float(os.getenv('GAME_IDLE_TIMEOUT_PLAYING', '900'))  # Turno sin mensajes ni /next_player
+GAME_IDLE_TIMEOUT = float(os.getenv('GAME_IDLE_TIMEOUT', '600'))  # Resto de fases, contados desde que venció su temporizador
+GAME_SWEEP_INTERVAL = float(os.getenv('GAME_SWEEP_INTERVAL', '60'))  # Segundos entre barridos
+
+# Logs: nivel, formato ("text" o "json", un objeto por línea con chat_id y fase) y muestreo
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '5'))  # Registros por segundo de cada evento frecuente (votos...); 0 = todos
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))  # Registros pendientes de escribir antes de descartar
+
 # Configuración del juego
 MAX_ROUNDS = 5
 MIN_ROUNDS = 2
 POLL_DURATION = 180  # 3 minutos en segundos
-VOTE_DURATION = 60   # 1 minuto en segundos
-DISCUSSION_DURATION = 120  # 2 minutos en segundos
+VOTE_DURATION = 30   # 30 segundos
+DISCUSSION_DURATION = 180  # 3 minutos en segundos
 ROLE_REVEAL_DELAY = 10  # 10 segundos para que los jugadores vean su rol
+RESULTS_DELAY = 3  # Segundos entre los resultados de la votación y la siguiente ronda
+TURN_WARNING_DURATION = 3  # Segundos que permanece visible el aviso de "no es tu turno"
+STATUS_EDIT_INTERVAL = float(os.getenv('STATUS_EDIT_INTERVAL', '3'))  # Segundos mínimos entre ediciones del mensaje de estado
+TURN_MODE = os.getenv('TURN_MODE', 'delete')  # Control de turnos por defecto: "delete" (borrar y avisar) o "mute" (silenciar); cada grupo lo cambia con /turn_mode
+TURN_MUTE_CONCURRENCY = int(os.getenv('TURN_MUTE_CONCURRENCY', '10'))  # Cambios de permisos simultáneos por grupo en el modo "mute"
+
+# Paquetes de palabras (ver word_packs.py)
+WORD_PACKS_DIR = os.getenv('WORD_PACKS_DIR', 'wordpacks')
+DEFAULT_WORD_PACK = os.getenv('DEFAULT_WORD_PACK', 'es')  # "es" es el paquete incluido en words.py
+WORD_PACK_MMAP_THRESHOLD = int(os.getenv('WORD_PACK_MMAP_THRESHOLD', str(1024 * 1024)))  # Bytes a partir de los que un .wpk se mapea en memoria
+WORD_DECK_TTL = float(os.getenv('WORD_DECK_TTL', '86400'))  # Segundos sin jugar tras los que se olvida el mazo de un chat
+
+# Envío de roles por privado
+ROLE_DM_CONCURRENCY = int(os.getenv('ROLE_DM_CONCURRENCY', '10'))  # Mensajes privados simultáneos
+
+# Planificador de mensajes salientes (límites de Telegram: ~30/s global, ~20/min por grupo)
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '30'))  # Mensajes por segundo en total
+OUTBOUND_GROUP_RATE = float(os.getenv('OUTBOUND_GROUP_RATE', '20'))  # Mensajes por minuto por grupo
+OUTBOUND_PRIVATE_RATE = float(os.getenv('OUTBOUND_PRIVATE_RATE', '1'))  # Mensajes por segundo por chat privado
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', '3'))  # Reintentos tras RetryAfter
+OUTBOUND_LOW_PRIORITY_MAX_WAIT = float(os.getenv('OUTBOUND_LOW_PRIORITY_MAX_WAIT', '10'))  # Segundos antes de descartar avisos
+
+# Persistencia de juegos (SQLite). Dejar GAME_DB_PATH vacío para desactivarla
+GAME_DB_PATH = os.getenv('GAME_DB_PATH', 'impostor.db')
+STORE_FLUSH_INTERVAL = float(os.getenv('STORE_FLUSH_INTERVAL', '2'))  # Segundos entre escrituras por lote
+
+# Estadísticas de jugadores para /stats y /leaderboard (SQLite; por defecto en el fichero de los juegos, vacío = desactivadas)
+STATS_DB_PATH = os.getenv('STATS_DB_PATH', GAME_DB_PATH)
+LEADERBOARD_SIZE = int(os.getenv('LEADERBOARD_SIZE', '10'))  # Jugadores que muestra /leaderboard
+
+# Caché de administradores
+ADMIN_CACHE_TTL = int(os.getenv('ADMIN_CACHE_TTL', '300'))  # Segundos antes de refrescar la lista de admins
+# Si Telegram falla y no hay lista previa: True permite el comando, False lo rechaza
+ADMIN_CHECK_FAIL_OPEN = os.getenv('ADMIN_CHECK_FAIL_OPEN', 'true').lower() in ('1', 'true', 'yes')
 
 # Mensajes
 MSG_IMPOSTOR = "🎭 ¡IMPOSTOR AHORA!!!!\n\nEres un IMPOSTOR. No conoces la palabra secreta. Debes intentar descubrirla sin ser descubierto."
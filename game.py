@@ -4,14 +4,142 @@ Maneja estados, jugadores, turnos y votaciones
 """
 
 import random
-from typing import Dict, List, Optional
-from words import get_random_word
+import secrets
+import sys
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Set
+from word_packs import draw_word
+from word_matcher import WordMatcher
+
+# Fases del juego
+STATE_WAITING = "waiting_for_players"
+STATE_REVEALING = "revealing_roles"
+STATE_PLAYING = "playing_round"
+STATE_DISCUSSING = "discussing"
+STATE_VOTING = "voting"
+STATE_PROCESSING = "processing_votes"
+STATE_FINISHED = "finished"
+
+# Formas de hacer respetar los turnos durante la ronda
+TURN_MODE_DELETE = "delete"  # Borrar cada mensaje fuera de turno y avisar de quién tiene el turno
+TURN_MODE_MUTE = "mute"  # Silenciar a los jugadores sin turno con los permisos del grupo
+TURN_MODES = (TURN_MODE_DELETE, TURN_MODE_MUTE)
+
+# Transiciones permitidas entre fases
+TRANSITIONS = {
+    STATE_WAITING: {STATE_REVEALING, STATE_FINISHED},
+    STATE_REVEALING: {STATE_PLAYING, STATE_FINISHED},
+    STATE_PLAYING: {STATE_DISCUSSING, STATE_FINISHED},
+    STATE_DISCUSSING: {STATE_VOTING, STATE_FINISHED},
+    STATE_VOTING: {STATE_PROCESSING, STATE_FINISHED},
+    STATE_PROCESSING: {STATE_PLAYING, STATE_FINISHED},
+    STATE_FINISHED: set(),
+}
+
+# Funciones llamadas en cada cambio de fase: listener(game, estado_anterior, estado_nuevo)
+_transition_listeners: List[Callable] = []
+
+def add_transition_listener(listener: Callable):
+    """Registra una función que se llamará en cada cambio de fase"""
+    _transition_listeners.append(listener)
+
+class VoteTally:
+    """Recuento incremental de votos por opción, con líder y empate en O(1)"""
+    __slots__ = ('counts', '_by_count', 'max_votes')
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}  # {opción: votos}
+        self._by_count: Dict[int, Set[int]] = {}  # {votos: {opciones con ese número de votos}}
+        self.max_votes = 0
+
+    def _move(self, option: int, old: int, new: int):
+        if old:
+            options = self._by_count[old]
+            options.discard(option)
+            if not options:
+                del self._by_count[old]
+        if new:
+            self._by_count.setdefault(new, set()).add(option)
+            self.counts[option] = new
+        else:
+            del self.counts[option]
+
+    def add(self, option: int):
+        old = self.counts.get(option, 0)
+        self._move(option, old, old + 1)
+        if old + 1 > self.max_votes:
+            self.max_votes = old + 1
+
+    def remove(self, option: int):
+        old = self.counts.get(option, 0)
+        if not old:
+            return
+        self._move(option, old, old - 1)
+        if old == self.max_votes and old not in self._by_count:
+            self.max_votes = old - 1  # La opción sigue teniendo old - 1 votos (o no queda ninguno)
+
+    def count(self, option: int) -> int:
+        return self.counts.get(option, 0)
+
+    def is_tie(self) -> bool:
+        """True si hay votos y varias opciones comparten el máximo"""
+        return self.max_votes > 0 and len(self._by_count[self.max_votes]) > 1
+
+    def leader(self) -> Optional[int]:
+        """Opción con más votos; None si no hay votos o hay empate"""
+        if self.max_votes == 0:
+            return None
+        leaders = self._by_count[self.max_votes]
+        if len(leaders) > 1:
+            return None
+        return next(iter(leaders))
+
+    def clear(self):
+        self.counts.clear()
+        self._by_count.clear()
+        self.max_votes = 0
+
+def _deep_sizeof(obj, seen: Set[int]) -> int:
+    """sys.getsizeof de un objeto y de todo lo que contiene (sin contar dos veces lo compartido)"""
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(key, seen) + _deep_sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, '__dict__'):
+        size += _deep_sizeof(vars(obj), seen)
+    elif hasattr(obj, '__slots__'):
+        size += sum(_deep_sizeof(getattr(obj, name), seen) for name in obj.__slots__ if hasattr(obj, name))
+    return size
+
+class Player:
+    """Jugador de una partida (registro compacto con __slots__)"""
+    __slots__ = ('user_id', 'name', 'role')
+
+    def __init__(self, user_id: int, name: str, role: Optional[str] = None):
+        self.user_id = user_id
+        self.name = name
+        self.role = role  # 'impostor', 'citizen' o None antes de repartir roles
 
 class ImpostorGame:
-    def __init__(self, chat_id: int):
+    def __init__(self, chat_id: int, seed: Optional[int] = None):
         self.chat_id = chat_id
-        self.players: Dict[int, Dict] = {}  # {user_id: {'name': str, 'role': str}}
-        self.state = "waiting_for_players"  # Estados del juego
+        self.game_id = uuid.uuid4().hex  # Distingue este juego de otros anteriores en el mismo chat
+        # Semilla del juego: con la misma semilla se repiten roles, orden de turnos y palabra
+        self.seed = seed if seed is not None else secrets.randbits(63)
+        self.players: Dict[int, Player] = {}  # {user_id: Player}
+        self.state = STATE_WAITING  # Estados del juego
+        self.phase_started_at = time.time()
+        self.last_phase_duration = 0.0  # Segundos que duró la fase anterior (se calcula en transition)
+        self.last_activity = self.phase_started_at  # Último cambio del juego (para expulsar juegos inactivos)
+        
+        # Temporizador de la fase actual (nombre de la acción y hora límite)
+        self.phase_timer: Optional[str] = None
+        self.phase_deadline: Optional[float] = None
         
         # Configuración del juego
         self.num_impostors = 1
@@ -20,15 +148,21 @@ class ImpostorGame:
         
         # Roles y palabras
         self.current_word = ""
-        self.impostors: List[int] = []
-        self.citizens: List[int] = []
+        self.word_matcher: Optional[WordMatcher] = None  # Detecta la palabra en los mensajes
+        self.word_pack: Optional[str] = None  # Paquete de palabras (None = el predeterminado)
+        self.word_category: Optional[str] = None  # Categoría del paquete (None = todas)
+        self.impostors: Set[int] = set()
+        self.citizens: Set[int] = set()
         
         # Control de turnos
         self.current_player_index = 0
         self.current_player = None
-        self.players_order: List[int] = []
-        self.players_played_this_round: List[int] = []
-        self.eliminated_players: List[int] = []  # Jugadores eliminados durante el juego
+        self.players_order: List[int] = []  # Orden de turnos (y de opciones de la votación)
+        self.active_players: List[int] = []  # players_order sin eliminados, precalculado
+        self.players_played_this_round: Set[int] = set()
+        self.eliminated_players: Set[int] = set()  # Jugadores eliminados durante el juego
+        self.turn_mode = TURN_MODE_DELETE  # Cómo se hacen respetar los turnos (TURN_MODES)
+        self.muted_players: Set[int] = set()  # Jugadores que el bot tiene silenciados ahora mismo
         
         # Seguimiento de palabras dichas por ronda
         self.round_words: Dict[int, List[Dict]] = {}  # {round_num: [{'player_id': int, 'player_name': str, 'word': str}]}
@@ -37,52 +171,169 @@ class ImpostorGame:
         
         # Votación
         self.votes: Dict[int, int] = {}  # {voter_id: voted_player_index}
+        self.vote_tally = VoteTally()  # Recuento de votos por índice, actualizado en cada voto
         self.poll_message_id = None
         self.voting_poll_id = None
+        self.correct_votes: Dict[int, int] = {}  # {citizen_id: votos a un impostor en todo el juego}
+        self.winner: Optional[str] = None  # 'impostor' o 'citizen'; None si se cancela o se expulsa
+        
+        # Mensaje fijado con el estado del juego (se edita en cada cambio)
+        self.status_message_id: Optional[int] = None
+    
+    def to_dict(self) -> Dict:
+        """Obtiene una instantánea serializable a JSON del juego"""
+        return {
+            'chat_id': self.chat_id,
+            'game_id': self.game_id,
+            'seed': self.seed,
+            'players': [[player.user_id, player.name, player.role] for player in self.players.values()],
+            'state': self.state,
+            'phase_started_at': self.phase_started_at,
+            'last_activity': self.last_activity,
+            'phase_timer': self.phase_timer,
+            'phase_deadline': self.phase_deadline,
+            'num_impostors': self.num_impostors,
+            'max_rounds': self.max_rounds,
+            'current_round': self.current_round,
+            'current_word': self.current_word,
+            'word_pack': self.word_pack,
+            'word_category': self.word_category,
+            'impostors': sorted(self.impostors),
+            'citizens': sorted(self.citizens),
+            'current_player_index': self.current_player_index,
+            'current_player': self.current_player,
+            'players_order': list(self.players_order),
+            'players_played_this_round': sorted(self.players_played_this_round),
+            'eliminated_players': sorted(self.eliminated_players),
+            'turn_mode': self.turn_mode,
+            'muted_players': sorted(self.muted_players),
+            'round_words': [[round_num, words] for round_num, words in self.round_words.items()],
+            'current_round_words': self.current_round_words,
+            'current_player_last_message': self.current_player_last_message,
+            'votes': [[voter_id, voted_index] for voter_id, voted_index in self.votes.items()],
+            'poll_message_id': self.poll_message_id,
+            'voting_poll_id': self.voting_poll_id,
+            'correct_votes': [[voter_id, count] for voter_id, count in self.correct_votes.items()],
+            'winner': self.winner,
+            'status_message_id': self.status_message_id,
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ImpostorGame':
+        """Reconstruye un juego a partir de una instantánea de to_dict"""
+        game = cls(data['chat_id'], seed=data.get('seed'))
+        game.game_id = data['game_id']
+        game.players = {user_id: Player(user_id, name, role) for user_id, name, role in data['players']}
+        game.state = data['state']
+        game.phase_started_at = data['phase_started_at']
+        game.last_activity = data.get('last_activity', game.phase_started_at)
+        game.phase_timer = data['phase_timer']
+        game.phase_deadline = data['phase_deadline']
+        game.num_impostors = data['num_impostors']
+        game.max_rounds = data['max_rounds']
+        game.current_round = data['current_round']
+        game.current_word = data['current_word']
+        game.word_pack = data.get('word_pack')
+        game.word_category = data.get('word_category')
+        if game.current_word:
+            game.word_matcher = WordMatcher(game.current_word)
+        game.impostors = set(data['impostors'])
+        game.citizens = set(data['citizens'])
+        game.current_player_index = data['current_player_index']
+        game.current_player = data['current_player']
+        game.players_order = list(data['players_order'])
+        game.players_played_this_round = set(data['players_played_this_round'])
+        game.eliminated_players = set(data['eliminated_players'])
+        game.active_players = [p for p in game.players_order if p not in game.eliminated_players]
+        game.turn_mode = data.get('turn_mode', TURN_MODE_DELETE)
+        game.muted_players = set(data.get('muted_players', ()))
+        game.round_words = {round_num: words for round_num, words in data['round_words']}
+        game.current_round_words = data['current_round_words']
+        game.current_player_last_message = data['current_player_last_message']
+        for voter_id, voted_index in data['votes']:
+            game.add_vote(voter_id, voted_index)
+        game.poll_message_id = data['poll_message_id']
+        game.voting_poll_id = data['voting_poll_id']
+        game.correct_votes = {voter_id: count for voter_id, count in data.get('correct_votes', ())}
+        game.winner = data.get('winner')
+        game.status_message_id = data.get('status_message_id')
+        return game
+    
+    def transition(self, new_state: str):
+        """Cambia de fase validando la transición y descarta el temporizador de la fase anterior"""
+        old_state = self.state
+        if new_state not in TRANSITIONS[old_state]:
+            raise ValueError(f"Transición inválida: {old_state} -> {new_state}")
+        
+        now = time.time()
+        self.last_phase_duration = now - self.phase_started_at  # Lo que duró la fase anterior
+        self.state = new_state
+        self.phase_started_at = now
+        self.last_activity = now
+        self.phase_timer = None
+        self.phase_deadline = None
+        
+        for listener in _transition_listeners:
+            listener(self, old_state, new_state)
+    
+    def touch(self):
+        """Marca el juego como activo ahora"""
+        self.last_activity = time.time()
+    
+    def idle_seconds(self, now: Optional[float] = None) -> float:
+        """Segundos sin actividad; mientras haya un temporizador de fase pendiente se cuenta desde su hora límite"""
+        now = time.time() if now is None else now
+        return now - max(self.last_activity, self.phase_deadline or 0)
+    
+    def approximate_size(self) -> int:
+        """Bytes aproximados que ocupa el juego en memoria"""
+        return _deep_sizeof(self, set())
     
     def add_player(self, user_id: int, name: str):
         """Agrega un jugador al juego"""
         if user_id not in self.players:
-            self.players[user_id] = {
-                'name': name,
-                'role': None
-            }
+            self.players[user_id] = Player(user_id, name)
     
     def remove_player(self, user_id: int):
         """Remueve un jugador del juego"""
         if user_id in self.players:
             del self.players[user_id]
     
-    def assign_roles(self):
-        """Asigna roles aleatoriamente y selecciona palabra"""
+    def assign_roles(self, word: Optional[str] = None):
+        """Asigna roles aleatoriamente y selecciona palabra (word la fija en lugar de sacarla del mazo)"""
         if len(self.players) < 3:
             raise ValueError("Se necesitan al menos 3 jugadores")
         
-        # Mejorar aleatoriedad
+        # Generador propio del juego (no el global) para poder reproducir el reparto.
+        # Un solo shuffle ya da todas las permutaciones con la misma probabilidad
+        rng = random.Random(self.seed)
         player_ids = list(self.players.keys())
-        random.shuffle(player_ids)
-        random.shuffle(player_ids)  # Doble shuffle para mayor aleatoriedad
+        rng.shuffle(player_ids)
         
         # Seleccionar impostores
-        self.impostors = player_ids[:self.num_impostors]
-        self.citizens = player_ids[self.num_impostors:]
+        self.impostors = set(player_ids[:self.num_impostors])
+        self.citizens = set(player_ids[self.num_impostors:])
         
         # Asignar roles a los jugadores
         for player_id in self.impostors:
-            self.players[player_id]['role'] = 'impostor'
+            self.players[player_id].role = 'impostor'
         
         for player_id in self.citizens:
-            self.players[player_id]['role'] = 'citizen'
+            self.players[player_id].role = 'citizen'
         
-        # Seleccionar palabra aleatoria
-        self.current_word = get_random_word()
+        # Sacar palabra del mazo del chat (sin repetir hasta agotarlo). El mazo depende de los juegos
+        # anteriores del chat, así que se baraja con un generador aparte: el orden de turnos solo
+        # depende de la semilla. La palabra se graba para reproducirla (game_word_source en bot.py)
+        deck_rng = random.Random(rng.getrandbits(64))
+        self.current_word = word or draw_word(self.chat_id, self.word_pack, self.word_category, rng=deck_rng)
+        self.word_matcher = WordMatcher(self.current_word)
         
-        # Establecer orden de juego con mayor aleatoriedad
+        # Orden de juego independiente del reparto de roles
         self.players_order = player_ids.copy()
-        random.shuffle(self.players_order)
-        random.shuffle(self.players_order)  # Doble shuffle
+        rng.shuffle(self.players_order)
+        self.active_players = list(self.players_order)
         
-        self.state = "playing_round"
+        self.transition(STATE_REVEALING)
     
     def start_new_round(self):
         """Inicia una nueva ronda"""
@@ -94,19 +345,19 @@ class ImpostorGame:
         self.current_round_words = []  # Limpiar palabras para nueva ronda
         self.current_player_index = 0
         
-        # Filtrar jugadores eliminados del orden
-        self.players_order = [p for p in self.players_order if p not in self.eliminated_players]
+        # El orden de la nueva ronda es el de los jugadores activos
+        self.players_order = list(self.active_players)
         
         self.current_player = self.players_order[0] if self.players_order else None
         self.players_played_this_round.clear()
-        self.state = "playing_round"
+        self.transition(STATE_PLAYING)
     
     def add_word(self, player_id: int, word: str):
         """Registra una palabra dicha por un jugador"""
         if player_id in self.players:
             self.current_round_words.append({
                 'player_id': player_id,
-                'player_name': self.players[player_id]['name'],
+                'player_name': self.players[player_id].name,
                 'word': word
             })
     
@@ -144,15 +395,16 @@ class ImpostorGame:
     def eliminate_player(self, player_id: int):
         """Elimina un jugador del juego"""
         if player_id not in self.eliminated_players:
-            self.eliminated_players.append(player_id)
+            self.eliminated_players.add(player_id)
+            if player_id in self.active_players:
+                self.active_players.remove(player_id)
             # Remover de impostores si estaba ahí
-            if player_id in self.impostors:
-                self.impostors.remove(player_id)
+            self.impostors.discard(player_id)
     
     def next_player(self):
         """Pasa al siguiente jugador"""
         if self.current_player:
-            self.players_played_this_round.append(self.current_player)
+            self.players_played_this_round.add(self.current_player)
         
         # Avanzar al siguiente jugador que no esté eliminado
         self.current_player_index += 1
@@ -167,48 +419,50 @@ class ImpostorGame:
     
     def all_players_played(self) -> bool:
         """Verifica si todos los jugadores activos ya jugaron en esta ronda"""
-        active_players = [p for p in self.players_order if p not in self.eliminated_players]
-        return len(self.players_played_this_round) >= len(active_players)
+        return len(self.players_played_this_round) >= len(self.active_players)
     
     def get_current_player_name(self) -> str:
         """Obtiene el nombre del jugador actual"""
         if self.current_player and self.current_player in self.players:
-            return self.players[self.current_player]['name']
+            return self.players[self.current_player].name
         return "Desconocido"
     
     def add_vote(self, voter_id: int, voted_player_index: int):
-        """Registra un voto"""
-        if 0 <= voted_player_index < len(self.players_order):
-            self.votes[voter_id] = voted_player_index
+        """Registra un voto (o cambia el anterior del mismo votante)"""
+        if not 0 <= voted_player_index < len(self.players_order):
+            return
+        previous = self.votes.get(voter_id)
+        if previous == voted_player_index:
+            return
+        if previous is not None:
+            self.vote_tally.remove(previous)
+        self.votes[voter_id] = voted_player_index
+        self.vote_tally.add(voted_player_index)
+    
+    def retract_vote(self, voter_id: int):
+        """Retira el voto de un jugador"""
+        previous = self.votes.pop(voter_id, None)
+        if previous is not None:
+            self.vote_tally.remove(previous)
+    
+    def clear_votes(self):
+        """Borra todos los votos"""
+        self.votes.clear()
+        self.vote_tally.clear()
+    
+    def count_correct_votes(self):
+        """Suma a cada ciudadano su voto de esta votación si fue a un impostor"""
+        for voter_id, voted_index in self.votes.items():
+            player = self.players.get(self.players_order[voted_index])
+            if player and player.role == 'impostor' and voter_id in self.citizens:
+                self.correct_votes[voter_id] = self.correct_votes.get(voter_id, 0) + 1
     
     def get_most_voted_player(self) -> Optional[int]:
-        """Obtiene el jugador más votado"""
-        if not self.votes:
-            return None
-        
-        # Contar votos por índice de jugador
-        vote_count = {}
-        for voted_index in self.votes.values():
-            if voted_index in vote_count:
-                vote_count[voted_index] += 1
-            else:
-                vote_count[voted_index] = 1
-        
-        # Encontrar el índice más votado
-        max_votes = max(vote_count.values())
-        most_voted_indices = [idx for idx, votes in vote_count.items() if votes == max_votes]
-        
-        # Si hay empate, retornar None
-        if len(most_voted_indices) > 1:
+        """Obtiene el jugador más votado (None si no hay votos o hay empate)"""
+        most_voted_index = self.vote_tally.leader()
+        if most_voted_index is None or most_voted_index >= len(self.players_order):
             return None
-        
-        most_voted_index = most_voted_indices[0]
-        
-        # Retornar el ID del jugador
-        if most_voted_index < len(self.players_order):
-            return self.players_order[most_voted_index]
-        
-        return None
+        return self.players_order[most_voted_index]
     
     def is_game_finished(self) -> bool:
         """Verifica si el juego ha terminado"""
@@ -216,11 +470,11 @@ class ImpostorGame:
     
     def get_impostors_names(self) -> List[str]:
         """Obtiene los nombres de los impostores"""
-        return [self.players[impostor_id]['name'] for impostor_id in self.impostors]
+        return [self.players[impostor_id].name for impostor_id in self.impostors]
     
     def get_citizens_names(self) -> List[str]:
         """Obtiene los nombres de los ciudadanos"""
-        return [self.players[citizen_id]['name'] for citizen_id in self.citizens]
+        return [self.players[citizen_id].name for citizen_id in self.citizens]
     
     def get_game_summary(self) -> str:
         """Obtiene un resumen del estado del juego"""
@@ -234,21 +488,9 @@ class ImpostorGame:
             f"⚙️ Estado: {self.state}"
         )
     
-    def reset_game(self):
-        """Reinicia el juego manteniendo los jugadores"""
-        self.current_round = 0
-        self.current_player_index = 0
-        self.current_player = None
-        self.players_played_this_round.clear()
-        self.votes.clear()
-        self.impostors.clear()
-        self.citizens.clear()
-        self.current_word = ""
-        self.state = "waiting_for_players"
-        
-        # Limpiar roles de jugadores
-        for player_id in self.players:
-            self.players[player_id]['role'] = None
+    def mentions_secret_word(self, text: str) -> bool:
+        """Verifica si el texto contiene la palabra secreta (o un plural o diminutivo)"""
+        return self.word_matcher is not None and self.word_matcher.search(text)
     
     def get_player_count_by_role(self) -> tuple:
         """Retorna (num_impostores, num_ciudadanos)"""
@@ -267,7 +509,7 @@ class ImpostorGame:
         remaining = []
         for player_id in self.players_order:
             if player_id not in self.players_played_this_round:
-                remaining.append(self.players[player_id]['name'])
+                remaining.append(self.players[player_id].name)
         return remaining
     
     def validate_game_settings(self) -> tuple:
@@ -296,18 +538,11 @@ class ImpostorGame:
         if not self.votes:
             return "📊 **No hay votos registrados**"
         
-        vote_count = {}
-        for voted_index in self.votes.values():
-            if voted_index in vote_count:
-                vote_count[voted_index] += 1
-            else:
-                vote_count[voted_index] = 1
-        
         summary = "📊 **Resumen de Votos:**\n"
-        for player_index, votes in vote_count.items():
+        for player_index, votes in self.vote_tally.counts.items():
             if player_index < len(self.players_order):
                 player_id = self.players_order[player_index]
-                player_name = self.players[player_id]['name']
+                player_name = self.players[player_id].name
                 summary += f"• {player_name}: {votes} voto(s)\n"
         
         return summary
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""
+Logs sin bloquear el event loop
+Los handlers solo encolan cada registro; un hilo aparte los formatea y los escribe en stderr.
+Formato de texto o JSON (con chat_id, fase y evento como campos propios) y muestreo de los
+eventos frecuentes (uniones, votos...) para que una avalancha de votos no inunde los logs
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+from metrics import Counter
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Campos propios que se pueden pasar con extra={...} (ver game_fields)
+FIELDS = ('chat_id', 'phase', 'event', 'user_id')
+
+LOG_DROPPED = Counter(
+    'impostor_log_records_dropped_total', 'Registros de log descartados por muestreo o por cola llena', ('reason', 'event')
+)
+
+def game_fields(game, event: Optional[str] = None, **fields) -> Dict:
+    """Campos de contexto de un juego para extra=... (chat_id, fase y evento)"""
+    data = {'chat_id': game.chat_id, 'phase': game.state}
+    if event:
+        data['event'] = event
+    data.update(fields)
+    return data
+
+class JsonFormatter(logging.Formatter):
+    """Un objeto JSON por línea con la hora, el nivel, el logger, el mensaje y los campos propios"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for field in FIELDS + ('suppressed',):
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    """El formato de siempre; indica cuántos registros del mismo evento se omitieron antes"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, 'suppressed', None)
+        return f"{text} (+{suppressed} omitidos)" if suppressed else text
+
+class SamplingFilter(logging.Filter):
+    """Limita a `rate` registros por segundo cada evento muestreado (los WARNING o más siempre pasan)"""
+
+    def __init__(self, events: Iterable[str], rate: float):
+        super().__init__()
+        self.events = set(events)
+        self.rate = rate
+        self._buckets: Dict[str, list] = {}  # {evento: [tokens, última recarga, omitidos desde el último]}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, 'event', None)
+        if self.rate <= 0 or event not in self.events or record.levelno >= logging.WARNING:
+            return True
+        now = time.monotonic()
+        bucket = self._buckets.get(event)
+        if bucket is None:
+            bucket = self._buckets[event] = [self.rate, now, 0]
+        bucket[0] = min(self.rate, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if bucket[0] < 1:
+            bucket[2] += 1
+            LOG_DROPPED.inc('sampled', event)
+            return False
+        bucket[0] -= 1
+        if bucket[2]:
+            record.suppressed, bucket[2] = bucket[2], 0
+        return True
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que descarta (y cuenta) en lugar de fallar cuando la cola está llena"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Como el original, pero la traza de la excepción queda aparte del mensaje (campo exc en JSON)
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc('queue_full', getattr(record, 'event', None) or '')
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Con la cola llena se espera a que el hilo de escritura haga hueco
+        self.queue.put(self._sentinel)
+
+_listener: Optional[_Listener] = None
+_lock = threading.Lock()
+
+def setup_logging(level: str = 'INFO', fmt: str = 'text', sampled_events: Iterable[str] = (), sample_rate: float = 0,
+                  queue_size: int = 10000, stream=None):
+    """Sustituye los handlers del logger raíz por una cola que se escribe desde un hilo aparte"""
+    global _listener
+    with _lock:
+        stop_logging()
+        formatter = JsonFormatter() if fmt == 'json' else TextFormatter(TEXT_FORMAT)
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(formatter)
+
+        records = queue.Queue(maxsize=queue_size)
+        handler = _DroppingQueueHandler(records)
+        # El muestreo se decide al encolar: lo omitido no llega a formatearse
+        handler.addFilter(SamplingFilter(sampled_events, sample_rate))
+
+        root = logging.getLogger()
+        for old in list(root.handlers):
+            root.removeHandler(old)
+        root.addHandler(handler)
+        root.setLevel(level.upper())
+
+        _listener = _Listener(records, output, respect_handler_level=True)
+        _listener.start()
+
+def stop_logging():
+    """Escribe los registros pendientes y detiene el hilo de escritura"""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
+
+# Al salir se escribe lo que quede en la cola (el hilo de escritura es daemon)
+atexit.register(stop_logging)
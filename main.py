@@ -0,0 +1,10 @@
+"""
+Punto de entrada del bot: python main.py
+No hace nada al importarse. En modo multiproceso cada worker (spawn) vuelve a importar el módulo
+principal; si fuera bot.py, el worker tendría dos copias de bot (__mp_main__ y bot) con sus
+métricas y estado duplicados
+"""
+
+if __name__ == '__main__':
+    from bot import main
+    main()
@@ -0,0 +1,201 @@
+"""
+Métricas en formato de texto de Prometheus y sondas de salud
+Contadores, histogramas y valores calculados al leerlos, servidos por un servidor HTTP mínimo
+(asyncio, sin dependencias extra) en /metrics, /healthz (vivo) y /readyz (listo para recibir updates)
+"""
+
+import asyncio
+import bisect
+import functools
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Límites de los histogramas de latencia, en segundos
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Todas las métricas creadas por nombre, en el orden en que se exportan. Crear otra con el mismo
+# nombre (un módulo importado dos veces) sustituye a la anterior: /metrics no repite familias
+_registry: Dict[str, '_Metric'] = {}
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        _registry[name] = self
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1.0):
+        self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0.0)
+
+    def values(self) -> Dict[tuple, float]:
+        """Copia de todos los valores: {(etiquetas...): valor}"""
+        return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, label_values)} {_number(value)}")
+        return lines
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, list] = {}  # {etiquetas: [conteos por límite (+Inf al final), suma]}
+
+    def observe(self, value: float, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, *label_values) -> int:
+        series = self._series.get(label_values)
+        return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for label_values, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _labels(self.label_names, label_values, f'le="{_number(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class Collected(_Metric):
+    """Métrica cuyo valor se calcula al exportar: collect() -> {(etiquetas...): valor}"""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str], collect: Callable[[], Dict[tuple, float]], kind: str = 'gauge'):
+        super().__init__(name, documentation, labels)
+        self.kind = kind
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        try:
+            values = self.collect()
+        except Exception as e:
+            logger.warning(f"No se pudo calcular la métrica {self.name}: {e}")
+            return lines
+        for label_values, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, label_values)} {_number(value)}")
+        return lines
+
+def render_metrics() -> str:
+    """Todas las métricas en formato de texto de Prometheus"""
+    lines = []
+    for metric in _registry.values():
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+HANDLER_LATENCY = Histogram('impostor_handler_seconds', 'Tiempo de cada handler de updates', ('handler',))
+HANDLER_CALLS = Counter('impostor_handler_calls_total', 'Updates procesados por handler y resultado', ('handler', 'outcome'))
+
+def instrumented(callback):
+    """Envuelve un handler para medir su latencia y contar sus errores"""
+    name = getattr(callback, '__name__', 'handler')
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        outcome = 'ok'
+        try:
+            return await callback(update, context)
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, name)
+            HANDLER_CALLS.inc(name, outcome)
+
+    return wrapper
+
+class MetricsServer:
+    """Servidor HTTP mínimo para /metrics, /healthz y /readyz"""
+
+    def __init__(self, host: str, port: int, ready: Callable[[], bool]):
+        self.host = host
+        self.port = port
+        self.ready = ready  # Sin argumentos; True si el bot puede atender updates
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Métricas en http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def _respond(self, path: str) -> Tuple[int, str]:
+        if path == '/metrics':
+            return 200, render_metrics()
+        if path == '/healthz':
+            # Si el bucle de eventos puede contestar, el proceso está vivo
+            return 200, 'ok\n'
+        if path == '/readyz':
+            return (200, 'ready\n') if self.ready() else (503, 'not ready\n')
+        return 404, 'not found\n'
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+                pass  # Las cabeceras no se usan
+            parts = request_line.decode('latin-1').split()
+            path = parts[1].split('?', 1)[0] if len(parts) >= 2 else ''
+            status, body = self._respond(path)
+            payload = body.encode('utf-8')
+            reason = {200: 'OK', 404: 'Not Found', 503: 'Service Unavailable'}[status]
+            writer.write(
+                f"HTTP/1.1 {status} {reason}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: close\r\n\r\n".encode('latin-1') + payload
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            logger.debug(f"Petición de métricas abortada: {e}")
+        finally:
+            writer.close()
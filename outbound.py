@@ -0,0 +1,321 @@
+"""
+Planificador de mensajes salientes
+Todas las llamadas del bot a Telegram pasan por aquí (como rate limiter de la Application):
+token bucket global, buckets por chat, clases de prioridad y reintentos con RetryAfter
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from datetime import timedelta
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Clases de prioridad (menor valor = se envía antes). Se pasan con rate_limit_args=...
+PRIORITY_HIGH = 0    # Roles por privado y anuncios de turno
+PRIORITY_NORMAL = 1  # Mensajes normales del juego
+PRIORITY_LOW = 2     # Avisos cosméticos (advertencias, borrados)
+PRIORITIES = (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)
+
+# Métodos que no consumen cuota de envío
+UNLIMITED_ENDPOINTS = {
+    'getMe', 'getChat', 'getChatMember', 'getChatAdministrators', 'answerCallbackQuery',
+    'setWebhook', 'deleteWebhook', 'getWebhookInfo', 'close', 'logOut',
+}
+
+# Métodos que no publican mensajes nuevos en el chat (permisos, borrados, ediciones y fijados):
+# solo cuentan para el límite global, no para el de 20 mensajes por minuto del grupo
+GLOBAL_ONLY_ENDPOINTS = {
+    'restrictChatMember', 'deleteMessage', 'editMessageText', 'editMessageReplyMarkup',
+    'pinChatMessage', 'unpinChatMessage', 'stopPoll',
+}
+
+API_CALLS = Counter(
+    'impostor_telegram_api_calls_total',
+    'Llamadas a la Bot API por método y resultado (ok, retry_after, dropped o clase de error)',
+    ('method', 'outcome')
+)
+API_LATENCY = Histogram('impostor_telegram_api_seconds', 'Duración de las llamadas a la Bot API', ('method',))
+
+async def _timed_call(callback, args, kwargs, endpoint: str):
+    """Hace la llamada a la API registrando su duración y su resultado"""
+    started = time.perf_counter()
+    outcome = 'ok'
+    try:
+        return await callback(*args, **kwargs)
+    except RetryAfter:
+        outcome = 'retry_after'
+        raise
+    except Exception as e:
+        outcome = type(e).__name__
+        raise
+    finally:
+        API_CALLS.inc(endpoint, outcome)
+        API_LATENCY.observe(time.perf_counter() - started, endpoint)
+
+class MessageDropped(Exception):
+    """Mensaje de baja prioridad descartado por esperar demasiado en la cola"""
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'blocked_until')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate  # Tokens por segundo
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0  # Pausa impuesta por un RetryAfter
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Segundos hasta que haya un token disponible (0 si ya lo hay)"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def is_idle(self, now: float) -> bool:
+        """True si el bucket está lleno y se puede descartar sin perder información"""
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+class OutboundScheduler(BaseRateLimiter[int]):
+    def __init__(
+        self,
+        global_rate: float = 30,
+        group_rate_per_minute: float = 20,
+        private_rate: float = 1,
+        max_retries: int = 3,
+        low_priority_max_wait: float = 10,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.group_rate = group_rate_per_minute / 60
+        self.group_burst = group_rate_per_minute
+        self.private_rate = private_rate
+        self.max_retries = max_retries
+        self.low_priority_max_wait = low_priority_max_wait
+
+        self.chat_buckets: Dict[Any, TokenBucket] = {}
+        self.counters = {
+            'queued': 0,    # Solicitudes que pasaron por la cola
+            'delayed': 0,   # Solicitudes que tuvieron que esperar turno o un RetryAfter
+            'retried': 0,   # Reintentos tras RetryAfter
+            'dropped': 0,   # Solicitudes descartadas (baja prioridad o sin más reintentos)
+        }
+
+        # Entradas [prioridad, secuencia, chat_id, encolado_en, future] en colas FIFO por chat y
+        # prioridad; las resueltas (canceladas o descartadas) se saltan al llegar a la cabeza
+        self._chats: Dict[Any, Tuple[Deque[list], ...]] = {}
+        # Cada chat con entradas está en uno de dos heaps: listos (su bucket tiene token), por
+        # (prioridad, secuencia) de su cabeza, o en espera, por la hora a la que tendrá token.
+        # _slots guarda la marca de su entrada vigente; las demás entradas del chat se ignoran
+        self._ready: List[tuple] = []  # Heap de (prioridad, secuencia, marca, chat_id)
+        self._sleeping: List[tuple] = []  # Heap de (listo_en, marca, chat_id)
+        self._slots: Dict[Any, int] = {}
+        self._low: Deque[list] = deque()  # Entradas de baja prioridad por orden de llegada, para caducarlas
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._last_prune = time.monotonic()
+
+    async def initialize(self) -> None:
+        if self._dispatcher:
+            return
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    async def shutdown(self) -> None:
+        if not self._dispatcher:
+            return
+        self._dispatcher.cancel()
+        try:
+            await self._dispatcher
+        except asyncio.CancelledError:
+            pass
+        self._dispatcher = None
+        for queues in self._chats.values():
+            for queue in queues:
+                for entry in queue:
+                    if not entry[4].done():
+                        entry[4].cancel()
+        self._chats.clear()
+        self._ready.clear()
+        self._sleeping.clear()
+        self._slots.clear()
+        self._low.clear()
+        logger.info(f"Planificador de salida detenido. Contadores: {self.counters}")
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            # Los grupos tienen id negativo; los chats privados, positivo
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.private_rate, self.private_rate)
+            else:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def _acquire(self, chat_id, priority: int):
+        """Espera en la cola de su chat hasta que el dispatcher conceda un token"""
+        now = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._seq), chat_id, now, future]
+        queues = self._chats.get(chat_id)
+        if queues is None:
+            queues = self._chats[chat_id] = tuple(deque() for _ in PRIORITIES)
+        queues[priority].append(entry)
+        if priority == PRIORITY_LOW:
+            self._low.append(entry)
+        if self._head(chat_id) is entry:
+            # Chat nuevo o entrada más prioritaria que la cabeza anterior
+            self._schedule(chat_id, now)
+        self.counters['queued'] += 1
+        self._wakeup.set()
+        await future
+
+    def _head(self, chat_id) -> Optional[list]:
+        """Entrada pendiente más prioritaria y antigua de un chat (None si no le queda ninguna)"""
+        queues = self._chats.get(chat_id)
+        if queues is None:
+            return None
+        for queue in queues:
+            while queue and queue[0][4].done():
+                queue.popleft()
+            if queue:
+                return queue[0]
+        del self._chats[chat_id]
+        return None
+
+    def _schedule(self, chat_id, now: float):
+        """Pone el chat en el heap de listos o en el de espera según su bucket"""
+        head = self._head(chat_id)
+        if head is None:
+            self._slots.pop(chat_id, None)
+            return
+        slot = next(self._seq)
+        self._slots[chat_id] = slot
+        wait = 0.0 if chat_id is None else self._chat_bucket(chat_id).wait_time(now)
+        if wait == 0:
+            heapq.heappush(self._ready, (head[0], head[1], slot, chat_id))
+        else:
+            heapq.heappush(self._sleeping, (now + wait, slot, chat_id))
+
+    def _expire_low_priority(self, now: float):
+        """Descarta los mensajes de baja prioridad que esperan demasiado (los más antiguos van delante)"""
+        while self._low and (self._low[0][4].done() or now - self._low[0][3] > self.low_priority_max_wait):
+            entry = self._low.popleft()
+            if not entry[4].done():
+                self.counters['dropped'] += 1
+                entry[4].set_exception(MessageDropped(f"Mensaje para {entry[2]} descartado tras esperar en la cola"))
+
+    def _wake_sleeping(self, now: float):
+        """Pasa a listos los chats cuyo bucket ya debería tener token"""
+        while self._sleeping and self._sleeping[0][0] <= now:
+            _, slot, chat_id = heapq.heappop(self._sleeping)
+            if self._slots.get(chat_id) == slot:
+                self._schedule(chat_id, now)
+
+    def _pop_ready(self, now: float) -> Optional[list]:
+        """Saca la entrada más prioritaria de los chats con token"""
+        while self._ready:
+            priority, seq, slot, chat_id = heapq.heappop(self._ready)
+            if self._slots.get(chat_id) != slot:
+                continue  # Sustituida por una entrada más reciente del mismo chat
+            head = self._head(chat_id)
+            if head is None or head[1] != seq or (chat_id is not None and self._chat_bucket(chat_id).wait_time(now) > 0):
+                # La cabeza se resolvió o cambió, o un RetryAfter bloqueó el chat
+                self._schedule(chat_id, now)
+                continue
+            self._chats[chat_id][head[0]].popleft()
+            return head
+        return None
+
+    async def _dispatch_loop(self):
+        while True:
+            now = time.monotonic()
+            self._expire_low_priority(now)
+            self._wake_sleeping(now)
+            self._prune_buckets(now)
+
+            wait = self.global_bucket.wait_time(now)
+            if wait == 0:
+                entry = self._pop_ready(now)
+                if entry is not None:
+                    if entry[2] is not None:
+                        self._chat_bucket(entry[2]).take()
+                    self.global_bucket.take()
+                    if now - entry[3] > 0.001:
+                        self.counters['delayed'] += 1
+                    entry[4].set_result(None)
+                    self._schedule(entry[2], now)
+                    continue
+                wait = self._sleeping[0][0] - now if self._sleeping else None
+            if self._low:
+                # Despertar también para caducar el mensaje de baja prioridad más antiguo
+                expires = self._low[0][3] + self.low_priority_max_wait - now
+                wait = expires if wait is None else min(wait, expires)
+
+            # Dormir hasta que haya un token, caduque un mensaje o llegue una solicitud nueva
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=None if wait is None else max(0.0, wait))
+            except asyncio.TimeoutError:
+                pass
+
+    def _prune_buckets(self, now: float):
+        """Libera los buckets de chats inactivos cada minuto"""
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        for chat_id in [c for c, b in self.chat_buckets.items() if c not in self._chats and b.is_idle(now)]:
+            del self.chat_buckets[chat_id]
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if endpoint in UNLIMITED_ENDPOINTS:
+            return await _timed_call(callback, args, kwargs, endpoint)
+
+        priority = PRIORITY_NORMAL if rate_limit_args is None else rate_limit_args
+        chat_id = None if endpoint in GLOBAL_ONLY_ENDPOINTS else data.get('chat_id')
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self._acquire(chat_id, priority)
+            except MessageDropped:
+                API_CALLS.inc(endpoint, 'dropped')
+                raise
+            try:
+                return await _timed_call(callback, args, kwargs, endpoint)
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                if attempt == self.max_retries:
+                    self.counters['dropped'] += 1
+                    logger.warning(f"{endpoint} a {chat_id} descartado tras {attempt} reintentos por RetryAfter")
+                    raise
+                self.counters['retried'] += 1
+                self.counters['delayed'] += 1
+                logger.info(f"RetryAfter en {endpoint} para {chat_id}: reintentando en {retry_after}s")
+                bucket = self._chat_bucket(chat_id) if chat_id is not None else self.global_bucket
+                bucket.block(retry_after)
@@ -0,0 +1,244 @@
+"""
+Estadísticas persistentes de los jugadores
+Al terminar cada juego con ganador se suman sus resultados a agregados por chat y globales en
+SQLite, con escritura diferida por lotes. /stats y /leaderboard leen esas filas ya calculadas
+(por clave primaria o por un índice de la clasificación) sin recorrer las partidas jugadas
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from game import ImpostorGame
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+GAMES_RECORDED = Counter('impostor_stats_games_total', 'Juegos sumados a las estadísticas de jugadores', ('winner',))
+
+GLOBAL_CHAT = 0  # chat_id de las filas globales (ningún chat de Telegram tiene id 0)
+
+SCHEMA = (
+    # Agregados por (chat, jugador); las filas con chat_id = GLOBAL_CHAT suman todos los chats
+    """
+    CREATE TABLE IF NOT EXISTS player_stats (
+        chat_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        games INTEGER NOT NULL,
+        wins INTEGER NOT NULL,
+        impostor_wins INTEGER NOT NULL,
+        citizen_wins INTEGER NOT NULL,
+        caught INTEGER NOT NULL,
+        correct_votes INTEGER NOT NULL,
+        PRIMARY KEY (chat_id, user_id)
+    ) WITHOUT ROWID
+    """,
+    # Mismo orden que LEADERBOARD_QUERY: la clasificación se lee del índice sin ordenar nada
+    """
+    CREATE INDEX IF NOT EXISTS player_stats_ranking
+    ON player_stats (chat_id, wins DESC, correct_votes DESC, games)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS chat_stats (
+        chat_id INTEGER PRIMARY KEY,
+        games INTEGER NOT NULL,
+        impostor_wins INTEGER NOT NULL,
+        citizen_wins INTEGER NOT NULL
+    )
+    """,
+    # Juegos ya contados: un lote reintentado no suma dos veces el mismo juego
+    """
+    CREATE TABLE IF NOT EXISTS recorded_games (
+        game_id TEXT PRIMARY KEY,
+        chat_id INTEGER NOT NULL,
+        winner TEXT NOT NULL,
+        players INTEGER NOT NULL,
+        ended_at REAL NOT NULL
+    )
+    """,
+)
+
+PLAYER_UPSERT = """
+INSERT INTO player_stats (chat_id, user_id, name, games, wins, impostor_wins, citizen_wins, caught, correct_votes)
+VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?)
+ON CONFLICT(chat_id, user_id) DO UPDATE SET
+    name = excluded.name,
+    games = games + 1,
+    wins = wins + excluded.wins,
+    impostor_wins = impostor_wins + excluded.impostor_wins,
+    citizen_wins = citizen_wins + excluded.citizen_wins,
+    caught = caught + excluded.caught,
+    correct_votes = correct_votes + excluded.correct_votes
+"""
+
+CHAT_UPSERT = """
+INSERT INTO chat_stats (chat_id, games, impostor_wins, citizen_wins) VALUES (?, 1, ?, ?)
+ON CONFLICT(chat_id) DO UPDATE SET
+    games = games + 1,
+    impostor_wins = impostor_wins + excluded.impostor_wins,
+    citizen_wins = citizen_wins + excluded.citizen_wins
+"""
+
+PLAYER_COLUMNS = "user_id, name, games, wins, impostor_wins, citizen_wins, caught, correct_votes"
+
+LEADERBOARD_QUERY = (
+    f"SELECT {PLAYER_COLUMNS} FROM player_stats WHERE chat_id = ? "
+    "ORDER BY wins DESC, correct_votes DESC, games LIMIT ?"
+)
+
+class PlayerStats(NamedTuple):
+    """Agregados de un jugador en un chat (o en todos)"""
+    user_id: int
+    name: str
+    games: int
+    wins: int
+    impostor_wins: int
+    citizen_wins: int
+    caught: int
+    correct_votes: int
+
+class GameResult(NamedTuple):
+    """Lo que cuenta de un juego terminado; filas: (user_id, nombre, ganó como impostor,
+    ganó como ciudadano, atrapado, votos acertados)"""
+    game_id: str
+    chat_id: int
+    winner: str
+    ended_at: float
+    rows: List[Tuple[int, str, int, int, int, int]]
+
+def game_result(game: ImpostorGame) -> Optional[GameResult]:
+    """Resultado de un juego con ganador (None si se canceló o se expulsó por inactividad)"""
+    if game.winner is None:
+        return None
+    rows = []
+    for player in game.players.values():
+        if player.role is None:
+            continue
+        won = player.role == game.winner
+        rows.append((
+            player.user_id,
+            player.name,
+            int(won and player.role == 'impostor'),
+            int(won and player.role == 'citizen'),
+            # Solo se elimina a los impostores votados
+            int(player.role == 'impostor' and player.user_id in game.eliminated_players),
+            game.correct_votes.get(player.user_id, 0),
+        ))
+    return GameResult(game.game_id, game.chat_id, game.winner, time.time(), rows)
+
+class StatsStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()  # Serializa el acceso a la conexión entre hilos
+        self._pending: Dict[str, GameResult] = {}  # Resultados pendientes de sumar, por game_id
+
+    def open(self):
+        """Abre la base de datos y crea el esquema si no existe"""
+        # timeout: en modo multiproceso varios workers suman a las mismas filas globales
+        self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def close(self):
+        """Cierra la base de datos"""
+        if self._conn:
+            with self._lock:
+                self._conn.close()
+            self._conn = None
+
+    def record(self, game: ImpostorGame):
+        """Anota el resultado de un juego terminado para sumarlo en el próximo lote"""
+        result = game_result(game)
+        if result is not None:
+            self._pending[result.game_id] = result
+
+    def has_pending(self) -> bool:
+        return bool(self._pending)
+
+    def _write_batch(self, results: List[GameResult]) -> Dict[str, int]:
+        """Suma un lote de resultados en una sola transacción; devuelve los juegos contados por ganador"""
+        counted: Dict[str, int] = {}
+        with self._lock, self._conn:
+            for result in results:
+                inserted = self._conn.execute(
+                    "INSERT OR IGNORE INTO recorded_games (game_id, chat_id, winner, players, ended_at) VALUES (?, ?, ?, ?, ?)",
+                    (result.game_id, result.chat_id, result.winner, len(result.rows), result.ended_at)
+                ).rowcount
+                if not inserted:
+                    continue  # Ya sumado en un lote anterior
+                counted[result.winner] = counted.get(result.winner, 0) + 1
+                impostor_win = int(result.winner == 'impostor')
+                for chat_id in (result.chat_id, GLOBAL_CHAT):
+                    self._conn.execute(CHAT_UPSERT, (chat_id, impostor_win, 1 - impostor_win))
+                    self._conn.executemany(PLAYER_UPSERT, [
+                        (chat_id, user_id, name, impostor_won + citizen_won, impostor_won, citizen_won, caught, correct_votes)
+                        for user_id, name, impostor_won, citizen_won, caught, correct_votes in result.rows
+                    ])
+        return counted
+
+    def flush(self):
+        """Suma los resultados pendientes de forma síncrona"""
+        if not self._conn or not self.has_pending():
+            return
+        results = list(self._pending.values())
+        self._pending = {}
+        self._count(self._write_batch(results))
+
+    def _count(self, counted: Dict[str, int]):
+        for winner, games in counted.items():
+            GAMES_RECORDED.inc(winner, amount=games)
+
+    async def flush_async(self):
+        """Suma los resultados pendientes sin bloquear el event loop"""
+        if not self._conn or not self.has_pending():
+            return
+        results = list(self._pending.values())
+        self._pending = {}
+        try:
+            counted = await asyncio.to_thread(self._write_batch, results)
+        except Exception as e:
+            logger.error(f"Error sumando {len(results)} juego(s) a las estadísticas en {self.path}: {e}")
+            for result in results:
+                self._pending.setdefault(result.game_id, result)
+            return
+        self._count(counted)
+        logger.debug(f"Sumados {sum(counted.values())} juego(s) a las estadísticas")
+
+    def _read_player(self, chat_id: int, user_id: int) -> Optional[PlayerStats]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {PLAYER_COLUMNS} FROM player_stats WHERE chat_id = ? AND user_id = ?", (chat_id, user_id)
+            ).fetchone()
+        return PlayerStats(*row) if row else None
+
+    async def player(self, chat_id: int, user_id: int) -> Optional[PlayerStats]:
+        """Estadísticas de un jugador en un chat (GLOBAL_CHAT = en todos)"""
+        return await asyncio.to_thread(self._read_player, chat_id, user_id)
+
+    def _read_leaderboard(self, chat_id: int, limit: int) -> List[PlayerStats]:
+        with self._lock:
+            rows = self._conn.execute(LEADERBOARD_QUERY, (chat_id, limit)).fetchall()
+        return [PlayerStats(*row) for row in rows]
+
+    async def leaderboard(self, chat_id: int, limit: int) -> List[PlayerStats]:
+        """Los limit mejores jugadores de un chat (GLOBAL_CHAT = de todos) por victorias"""
+        return await asyncio.to_thread(self._read_leaderboard, chat_id, limit)
+
+    def _read_chat_totals(self, chat_id: int) -> Tuple[int, int, int]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT games, impostor_wins, citizen_wins FROM chat_stats WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+        return row or (0, 0, 0)
+
+    async def chat_totals(self, chat_id: int) -> Tuple[int, int, int]:
+        """(juegos, victorias de impostores, victorias de ciudadanos) de un chat (GLOBAL_CHAT = de todos)"""
+        return await asyncio.to_thread(self._read_chat_totals, chat_id)
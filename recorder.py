@@ -0,0 +1,108 @@
+"""
+Grabación de updates para reproducir incidencias
+Añade cada update recibido a un fichero JSONL comprimido con gzip, junto con los eventos que
+hacen falta para reproducirlo de forma determinista: la semilla y la palabra de cada juego y las
+encuestas que crea el bot (sus ids cambian al reproducir). Se reproduce con benchmarks/replay.py
+
+Cada línea es un objeto JSON con "t" (hora de recepción) y uno de:
+- "update": el update tal como lo envió Telegram
+- "seed": {"chat_id", "game_id", "seed"} al crear un juego
+- "word": {"chat_id", "game_id", "word"} al repartir los roles (sale del mazo del chat, que
+  depende de los juegos anteriores y no de la semilla)
+- "poll": {"chat_id", "poll_id"} al registrar una encuesta del juego
+- "settings": tiempos del juego en vigor, al arrancar
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class UpdateRecorder:
+    def __init__(self, path: str):
+        self.path = path
+        self._file: Optional[gzip.GzipFile] = None
+        self._pending: List[str] = []  # Líneas aún no escritas
+        self._lock = threading.Lock()  # Serializa las escrituras entre hilos
+
+    def open(self):
+        """Abre el fichero en modo añadir (cada arranque añade un miembro gzip nuevo)"""
+        self._file = gzip.open(self.path, 'ab', compresslevel=6)
+
+    def close(self):
+        """Escribe lo pendiente y cierra el fichero"""
+        self.flush()
+        if self._file:
+            with self._lock:
+                self._file.close()
+            self._file = None
+
+    def _append(self, event: Dict):
+        event['t'] = time.time()
+        self._pending.append(json.dumps(event, ensure_ascii=False, separators=(',', ':')))
+
+    def record_settings(self, settings: Dict):
+        """Graba los tiempos del juego con los que arranca el bot"""
+        self._append({'settings': settings})
+
+    def record_update(self, data: Dict):
+        """Graba un update (en el formato JSON de la Bot API)"""
+        self._append({'update': data})
+
+    def record_seed(self, game):
+        """Graba la semilla de un juego recién creado"""
+        self._append({'seed': {'chat_id': game.chat_id, 'game_id': game.game_id, 'seed': game.seed}})
+
+    def record_word(self, game):
+        """Graba la palabra secreta de un juego al repartir los roles"""
+        self._append({'word': {'chat_id': game.chat_id, 'game_id': game.game_id, 'word': game.current_word}})
+
+    def record_poll(self, poll_id: str, chat_id: int):
+        """Graba una encuesta registrada por el bot"""
+        self._append({'poll': {'chat_id': chat_id, 'poll_id': poll_id}})
+
+    def _write(self, lines: List[str]):
+        with self._lock:
+            if not self._file:
+                return
+            self._file.write(('\n'.join(lines) + '\n').encode('utf-8'))
+            # Sync flush: lo escrito se puede leer aunque el proceso muera después
+            self._file.flush()
+
+    def flush(self):
+        """Escribe las líneas pendientes de forma síncrona"""
+        lines, self._pending = self._pending, []
+        if lines:
+            self._write(lines)
+
+    async def flush_async(self):
+        """Escribe las líneas pendientes sin bloquear el event loop"""
+        lines, self._pending = self._pending, []
+        if not lines:
+            return
+        try:
+            await asyncio.to_thread(self._write, lines)
+        except Exception as e:
+            logger.error(f"Error escribiendo {len(lines)} evento(s) en {self.path}: {e}")
+            # Se reintentan en el próximo volcado, delante de lo grabado mientras tanto
+            self._pending[:0] = lines
+
+def read_recording(path: str) -> Iterator[Dict]:
+    """Lee los eventos de una grabación (ignora una última línea cortada si el bot murió escribiendo)"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Línea inválida en {path}: {line[:80]}")
+        except EOFError:
+            logger.warning(f"{path} termina de forma abrupta; se usan los eventos leídos hasta ahí")
@@ -0,0 +1,230 @@
+"""
+Modo multiproceso: reparte los chats entre varios procesos worker
+Un proceso frontal recibe los updates (polling o webhook) y los reenvía al worker dueño del chat.
+Cada worker ejecuta la aplicación completa del bot sin updater, así que todo el estado de un
+chat (juego, temporizadores, caché de admins) vive en un único proceso
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+from typing import Dict, List, Optional, Set
+
+from telegram import Update
+from telegram.ext import Application, MessageHandler, TypeHandler, filters
+
+from chat_filters import ChatSetFilter
+from config import MAX_ACTIVE_GAMES, METRICS_HOST, METRICS_PORT
+from metrics import Collected, MetricsServer
+from outbound import TokenBucket
+from recorder import UpdateRecorder
+from telegram_http import build_bot
+
+logger = logging.getLogger(__name__)
+
+def shard_for_chat(chat_id: int, workers: int) -> int:
+    """Worker responsable de un chat (siempre el mismo para un chat_id dado)"""
+    return chat_id % workers
+
+class ShardRouter:
+    def __init__(self, inboxes: List):
+        self.inboxes = inboxes  # Una cola multiprocessing por worker
+        self.poll_routes: Dict[str, int] = {}  # {poll_id: worker}, lo informan los workers
+        self.game_chats: Set[int] = set()  # Chats con un juego en marcha, lo informan los workers
+        self.counters = {'routed': 0, 'broadcast': 0, 'dropped': 0}
+
+    def shard_for_update(self, update: Update) -> Optional[int]:
+        """Worker al que enviar un update. None si no se puede determinar"""
+        if update.poll_answer:
+            return self.poll_routes.get(update.poll_answer.poll_id)
+        if update.effective_chat:
+            return shard_for_chat(update.effective_chat.id, len(self.inboxes))
+        return None
+
+    def route(self, update: Update):
+        """Reenvía el update a su worker; las respuestas a encuestas desconocidas van a todos"""
+        data = update.to_dict()
+        shard = self.shard_for_update(update)
+        if shard is not None:
+            self.inboxes[shard].put(('update', data))
+            self.counters['routed'] += 1
+        elif update.poll_answer:
+            # La encuesta aún no está registrada: solo el worker que la conoce la procesará
+            for inbox in self.inboxes:
+                inbox.put(('update', data))
+            self.counters['broadcast'] += 1
+        else:
+            self.counters['dropped'] += 1
+
+    def apply_event(self, event: tuple):
+        """Aplica un aviso de un worker: ('register'|'unregister', poll_id, worker)
+        o ('game_start'|'game_end', chat_id, worker)"""
+        kind, key, shard = event
+        if kind == 'register':
+            self.poll_routes[key] = shard
+        elif kind == 'unregister':
+            self.poll_routes.pop(key, None)
+        elif kind == 'game_start':
+            self.game_chats.add(key)
+        elif kind == 'game_end':
+            self.game_chats.discard(key)
+
+class ShardCluster:
+    def __init__(self, token: str, workers: int, base_url: Optional[str] = None):
+        self.token = token
+        self.workers = workers
+        self.base_url = base_url
+        # spawn: los workers no heredan el event loop ni los sockets del proceso frontal
+        self._context = multiprocessing.get_context('spawn')
+        self.inboxes = [self._context.Queue() for _ in range(workers)]
+        self.events = self._context.Queue()  # Avisos de los workers al proceso frontal
+        self.router = ShardRouter(self.inboxes)
+        self.stats: Dict[int, int] = {}  # {worker: updates procesados}, al pedir request_stats
+        self.ready_workers = set()  # Workers que ya restauraron sus juegos y aceptan updates
+        self._processes: List[multiprocessing.Process] = []
+        self._listener: Optional[threading.Thread] = None
+
+    def start(self):
+        """Arranca los workers y el hilo que escucha sus avisos"""
+        for index in range(self.workers):
+            process = self._context.Process(
+                target=worker_main,
+                args=(index, self.workers, self.token, self.base_url, self.inboxes[index], self.events),
+                name=f"shard-{index}",
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+        self._listener = threading.Thread(target=self._listen, name="shard-events", daemon=True)
+        self._listener.start()
+        logger.info(f"Arrancados {self.workers} workers")
+
+    def _listen(self):
+        while True:
+            event = self.events.get()
+            if event is None:
+                return
+            if event[0] == 'stats':
+                self.stats[event[1]] = event[2]
+            elif event[0] == 'ready':
+                self.ready_workers.add(event[1])
+                logger.info(f"Worker {event[1]} listo")
+            else:
+                self.router.apply_event(event)
+
+    def request_stats(self):
+        """Pide a cada worker su número de updates procesados (llega a self.stats)"""
+        for inbox in self.inboxes:
+            inbox.put(('stats', None))
+
+    def stop(self, timeout: float = 30):
+        """Detiene los workers tras procesar lo que tengan en cola"""
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"El worker {process.name} no terminó a tiempo; se fuerza su cierre")
+                process.terminate()
+        self.events.put(None)
+        if self._listener:
+            self._listener.join(5)
+        logger.info(f"Workers detenidos. Contadores del router: {self.router.counters}")
+
+def worker_main(index: int, workers: int, token: str, base_url: Optional[str], inbox, events):
+    """Punto de entrada de un proceso worker"""
+    # Ctrl+C llega a todo el grupo de procesos; el worker espera la orden del proceso frontal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_run_worker(index, workers, token, base_url, inbox, events))
+
+async def _run_worker(index: int, workers: int, token: str, base_url: Optional[str], inbox, events):
+    import bot
+
+    bot.chat_filter = lambda chat_id: shard_for_chat(chat_id, workers) == index
+    # El proceso frontal usa METRICS_PORT; cada worker expone sus métricas en el siguiente libre
+    bot.metrics_port = METRICS_PORT + 1 + index if METRICS_PORT else 0
+    if bot.update_recorder:
+        # Cada worker graba sus chats en su propio fichero (updates.jsonl.gz -> updates-w0.jsonl.gz)
+        directory, filename = os.path.split(bot.update_recorder.path)
+        name, dot, extension = filename.partition('.')
+        bot.update_recorder = UpdateRecorder(os.path.join(directory, f"{name}-w{index}{dot}{extension}"))
+    bot.poll_listeners.append(lambda kind, poll_id, chat_id: events.put((kind, poll_id, index)))
+    bot.game_listeners.append(lambda kind, chat_id: events.put((f'game_{kind}', chat_id, index)))
+    # El límite de juegos simultáneos es para todo el bot: cada worker admite su parte
+    bot.max_active_games = -(-MAX_ACTIVE_GAMES // workers) if MAX_ACTIVE_GAMES else 0
+    # El límite global de Telegram es por bot: cada worker usa su parte
+    rate = bot.outbound.global_bucket.rate / workers
+    bot.outbound.global_bucket = TokenBucket(rate, max(1.0, rate))
+
+    application = bot.build_application(token, base_url=base_url, with_updater=False)
+    processed = 0
+
+    async def count_processed(update: Update, context):
+        nonlocal processed
+        processed += 1
+
+    # Último grupo: cuenta el update cuando ya pasó por todos los handlers del juego
+    application.add_handler(TypeHandler(Update, count_processed), group=1000)
+
+    loop = asyncio.get_running_loop()
+    async with application:
+        # Sin run_polling/run_webhook los hooks de arranque y parada se llaman a mano
+        await bot.post_init(application)
+        await application.start()
+        events.put(('ready', index))
+        while True:
+            item = await loop.run_in_executor(None, inbox.get)
+            if item is None:
+                break
+            kind, data = item
+            if kind == 'update':
+                await application.update_queue.put(Update.de_json(data, application.bot))
+            elif kind == 'stats':
+                # Esperar a que se vacíe la cola para que el recuento incluya lo ya recibido
+                while not application.update_queue.empty():
+                    await asyncio.sleep(0.01)
+                events.put(('stats', index, processed))
+        await application.stop()
+        await bot.post_shutdown(application)
+
+def build_front_application(token: str, workers: int, base_url: Optional[str] = None) -> Application:
+    """Crea la aplicación del proceso frontal: solo recibe updates y los reparte"""
+    cluster = ShardCluster(token, workers, base_url=base_url)
+    metrics_server = None
+
+    async def route_update(update: Update, context):
+        cluster.router.route(update)
+
+    async def drop_message(update: Update, context):
+        pass
+
+    async def start_workers(application: Application):
+        nonlocal metrics_server
+        cluster.start()
+        if METRICS_PORT:
+            Collected(
+                'impostor_router_updates_total', 'Updates del proceso frontal (enrutados, difundidos, descartados)',
+                ('event',), lambda: {(event,): value for event, value in cluster.router.counters.items()}, kind='counter'
+            )
+            Collected('impostor_ready_workers', 'Workers que terminaron de arrancar', (), lambda: {(): len(cluster.ready_workers)})
+            ready = lambda: application.running and len(cluster.ready_workers) == workers
+            metrics_server = MetricsServer(METRICS_HOST, METRICS_PORT, ready=ready)
+            await metrics_server.start()
+
+    async def stop_workers(application: Application):
+        if metrics_server:
+            await metrics_server.stop()
+        await asyncio.to_thread(cluster.stop)
+
+    bot = build_bot(token, base_url=base_url)
+    application = Application.builder().bot(bot).post_init(start_workers).post_shutdown(stop_workers).build()
+    # El texto de chats sin juego no llega a ningún worker. Mismo grupo: si lo atrapa el primer
+    # handler, route_update ya no se ejecuta
+    game_chat_filter = ChatSetFilter(cluster.router.game_chats, 'game_chat')
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND & ~game_chat_filter, drop_message))
+    application.add_handler(TypeHandler(Update, route_update))
+    application.bot_data['cluster'] = cluster
+    return application
@@ -0,0 +1,164 @@
+"""
+Mensaje de estado de cada juego
+Un único mensaje fijado por grupo que se edita en el sitio a medida que se llena la sala,
+avanzan los turnos o llegan votos. Las ediciones se agrupan: una ráfaga de cambios produce
+como máximo una edición por intervalo. Si el mensaje no se pudo enviar, cada cambio se envía
+como un mensaje nuevo
+"""
+
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Optional
+
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
+
+class _Entry:
+    __slots__ = ('game', 'text', 'markup', 'note', 'held', 'plain', 'last_edit', 'flush_task')
+
+    def __init__(self, game):
+        self.game = game
+        self.text: Optional[str] = None  # Último texto enviado a Telegram
+        self.markup: Optional[dict] = None  # Último teclado enviado (como dict, para comparar)
+        self.note: Optional[str] = None  # Línea extra bajo el estado (roles enviados, resultado...)
+        self.held = False  # Otro código está usando el mensaje (p. ej. teclados de configuración)
+        self.plain = False  # Sin mensaje de estado: los cambios se envían como mensajes nuevos
+        self.last_edit = 0.0
+        self.flush_task: Optional[asyncio.Task] = None
+
+class StatusBoard:
+    def __init__(self, render: Callable, min_interval: float):
+        self.render = render  # render(game, note) -> (texto, teclado o None)
+        self.min_interval = min_interval  # Segundos mínimos entre ediciones del mismo mensaje
+        self.bot = None  # Se asigna al arrancar la aplicación
+        self.counters = {'edits': 0, 'coalesced': 0}
+        self._entries: Dict[int, _Entry] = {}
+
+    def _entry(self, game) -> Optional[_Entry]:
+        entry = self._entries.get(game.chat_id)
+        if entry is None and game.status_message_id:
+            # Juego restaurado tras un reinicio: se sigue editando su mensaje
+            entry = self._entries[game.chat_id] = _Entry(game)
+        elif entry is not None:
+            entry.game = game
+        return entry
+
+    async def post(self, game):
+        """Envía y fija el mensaje de estado de un juego nuevo"""
+        entry = self._entries[game.chat_id] = _Entry(game)
+        text, markup = self.render(game, None)
+        message = await self.bot.send_message(game.chat_id, text, reply_markup=markup)
+        game.status_message_id = message.message_id
+        entry.text, entry.markup = text, markup.to_dict() if markup else None
+        entry.last_edit = time.monotonic()
+        try:
+            await self.bot.pin_chat_message(game.chat_id, message.message_id, disable_notification=True)
+        except Exception as e:
+            logger.debug(f"No se pudo fijar el mensaje de estado en {game.chat_id}: {e}")
+
+    def use_plain_messages(self, game):
+        """Envía los próximos cambios del juego como mensajes nuevos (no hay mensaje que editar)"""
+        entry = self._entries.setdefault(game.chat_id, _Entry(game))
+        entry.plain = True
+        entry.text = entry.markup = None
+
+    def set_note(self, chat_id: int, note: Optional[str]):
+        """Cambia la línea extra del mensaje (se muestra en la próxima edición)"""
+        entry = self._entries.get(chat_id)
+        if entry:
+            entry.note = note
+
+    def hold(self, chat_id: int):
+        """Deja de editar el mensaje mientras otro código lo usa"""
+        entry = self._entries.get(chat_id)
+        if entry:
+            entry.held = True
+
+    def release(self, chat_id: int):
+        """Vuelve a editar el mensaje (el contenido que otro código dejó se considera desconocido)"""
+        entry = self._entries.get(chat_id)
+        if entry:
+            entry.held = False
+            entry.text = entry.markup = None
+
+    def request_update(self, game):
+        """Pide una edición; los cambios que lleguen antes de hacerla se agrupan en ella"""
+        if self.bot is None:
+            return
+        entry = self._entry(game)
+        if entry is None or entry.held:
+            return
+        if entry.flush_task:
+            self.counters['coalesced'] += 1
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        delay = max(0.0, entry.last_edit + self.min_interval - time.monotonic())
+        entry.flush_task = loop.create_task(self._flush_after(entry, delay))
+
+    def update_now(self, game, rate_limit_args=None):
+        """Edita el mensaje sin esperar al intervalo, con la prioridad de salida indicada (p. ej. el turno)"""
+        if self.bot is None:
+            return
+        entry = self._entry(game)
+        if entry is None or entry.held:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if entry.flush_task:
+            # La edición agrupada pendiente se sustituye por esta, que muestra lo mismo
+            entry.flush_task.cancel()
+        entry.flush_task = loop.create_task(self._flush_after(entry, 0, rate_limit_args))
+
+    async def _flush_after(self, entry: _Entry, delay: float, rate_limit_args=None):
+        if delay:
+            await asyncio.sleep(delay)
+        entry.flush_task = None
+        if entry.held:
+            return
+        await self._edit(entry, rate_limit_args)
+
+    async def _edit(self, entry: _Entry, rate_limit_args=None):
+        game = entry.game
+        text, markup = self.render(game, entry.note)
+        markup_dict = markup.to_dict() if markup else None
+        if text == entry.text and markup_dict == entry.markup:
+            return
+        entry.text, entry.markup = text, markup_dict
+        entry.last_edit = time.monotonic()
+        self.counters['edits'] += 1
+        try:
+            if entry.plain:
+                await self.bot.send_message(game.chat_id, text, reply_markup=markup, rate_limit_args=rate_limit_args)
+                return
+            await self.bot.edit_message_text(
+                text, chat_id=game.chat_id, message_id=game.status_message_id, reply_markup=markup,
+                rate_limit_args=rate_limit_args
+            )
+        except BadRequest as e:
+            if 'not modified' not in str(e).lower():
+                logger.warning(f"No se pudo editar el mensaje de estado en {game.chat_id}: {e}")
+        except Exception as e:
+            logger.warning(f"No se pudo editar el mensaje de estado en {game.chat_id}: {e}")
+
+    async def close(self, game):
+        """Edita el mensaje por última vez, sin esperas, y lo desfija"""
+        entry = self._entries.pop(game.chat_id, None)
+        if entry is None or self.bot is None:
+            return
+        if entry.flush_task:
+            entry.flush_task.cancel()
+        entry.held = False
+        await self._edit(entry)
+        if entry.plain:
+            return
+        try:
+            await self.bot.unpin_chat_message(game.chat_id, game.status_message_id)
+        except Exception as e:
+            logger.debug(f"No se pudo desfijar el mensaje de estado en {game.chat_id}: {e}")
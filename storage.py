@@ -0,0 +1,182 @@
+"""
+Almacenamiento persistente de los juegos activos
+Guarda instantáneas de ImpostorGame en SQLite (modo WAL) con escritura diferida por lotes,
+para poder recuperar los juegos tras un reinicio del bot
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from game import ImpostorGame
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    chat_id INTEGER PRIMARY KEY,
+    game_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+# Ajustes que cada chat conserva entre juegos
+SETTINGS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_settings (
+    chat_id INTEGER PRIMARY KEY,
+    word_pack TEXT,
+    word_category TEXT,
+    turn_mode TEXT
+)
+"""
+
+class GameStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()  # Serializa el acceso a la conexión entre hilos
+        self._dirty: Dict[int, ImpostorGame] = {}  # Juegos con cambios pendientes de guardar
+        self._deleted: Set[int] = set()  # Chats cuyo juego terminó y hay que borrar
+
+    def open(self):
+        """Abre la base de datos y crea el esquema si no existe"""
+        # timeout: en modo multiproceso varios workers comparten el fichero
+        self._conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(SCHEMA)
+        self._conn.execute(SETTINGS_SCHEMA)
+        # Bases de datos creadas antes de que existiera el modo de turnos
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chat_settings)")}
+        if 'turn_mode' not in columns:
+            self._conn.execute("ALTER TABLE chat_settings ADD COLUMN turn_mode TEXT")
+        self._conn.commit()
+
+    def close(self):
+        """Cierra la base de datos"""
+        if self._conn:
+            with self._lock:
+                self._conn.close()
+            self._conn = None
+
+    def mark_dirty(self, game: ImpostorGame):
+        """Marca un juego para guardarlo en el próximo lote"""
+        self._dirty[game.chat_id] = game
+        self._deleted.discard(game.chat_id)
+
+    def discard(self, chat_id: int):
+        """Marca el juego de un chat para borrarlo en el próximo lote"""
+        self._dirty.pop(chat_id, None)
+        self._deleted.add(chat_id)
+
+    def has_pending(self) -> bool:
+        return bool(self._dirty or self._deleted)
+
+    def _take_batch(self):
+        """Serializa los cambios pendientes (en el hilo del event loop) y vacía las colas"""
+        now = time.time()
+        games, deleted = self._dirty, self._deleted
+        self._dirty = {}
+        self._deleted = set()
+        rows = [
+            (chat_id, game.game_id, game.state, json.dumps(game.to_dict(), ensure_ascii=False), now)
+            for chat_id, game in games.items()
+        ]
+        return games, deleted, rows
+
+    def _requeue(self, games: Dict[int, ImpostorGame], deleted: Set[int]):
+        """Devuelve a la cola un lote fallido sin pisar cambios más recientes"""
+        for chat_id, game in games.items():
+            if chat_id not in self._dirty and chat_id not in self._deleted:
+                self._dirty[chat_id] = game
+        for chat_id in deleted:
+            if chat_id not in self._dirty:
+                self._deleted.add(chat_id)
+
+    def _write_batch(self, rows: List[tuple], deleted: Set[int]):
+        """Escribe un lote en una sola transacción"""
+        with self._lock, self._conn:
+            if rows:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO games (chat_id, game_id, state, data, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+            if deleted:
+                self._conn.executemany("DELETE FROM games WHERE chat_id = ?", [(chat_id,) for chat_id in deleted])
+
+    def flush(self):
+        """Escribe los cambios pendientes de forma síncrona"""
+        if not self._conn or not self.has_pending():
+            return
+        games, deleted, rows = self._take_batch()
+        self._write_batch(rows, deleted)
+
+    async def flush_async(self):
+        """Escribe los cambios pendientes sin bloquear el event loop"""
+        if not self._conn or not self.has_pending():
+            return
+        games, deleted, rows = self._take_batch()
+        try:
+            await asyncio.to_thread(self._write_batch, rows, deleted)
+        except Exception as e:
+            logger.error(f"Error guardando {len(rows)} juego(s) en {self.path}: {e}")
+            self._requeue(games, deleted)
+            return
+        logger.debug(f"Guardados {len(rows)} juego(s) y borrados {len(deleted)}")
+
+    def load_all(self) -> List[ImpostorGame]:
+        """Carga todos los juegos guardados"""
+        with self._lock:
+            rows = self._conn.execute("SELECT chat_id, data FROM games").fetchall()
+
+        games = []
+        for chat_id, data in rows:
+            try:
+                games.append(ImpostorGame.from_dict(json.loads(data)))
+            except Exception as e:
+                logger.warning(f"No se pudo restaurar el juego del chat {chat_id}: {e}")
+        return games
+
+    def _write_chat_settings(self, chat_id: int, word_pack: Optional[str], word_category: Optional[str]):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO chat_settings (chat_id, word_pack, word_category) VALUES (?, ?, ?) "
+                "ON CONFLICT(chat_id) DO UPDATE SET word_pack = excluded.word_pack, word_category = excluded.word_category",
+                (chat_id, word_pack, word_category)
+            )
+
+    async def save_chat_settings(self, chat_id: int, word_pack: Optional[str], word_category: Optional[str]):
+        """Guarda el paquete y la categoría de palabras de un chat"""
+        if self._conn:
+            await asyncio.to_thread(self._write_chat_settings, chat_id, word_pack, word_category)
+
+    def _write_turn_mode(self, chat_id: int, turn_mode: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO chat_settings (chat_id, turn_mode) VALUES (?, ?) "
+                "ON CONFLICT(chat_id) DO UPDATE SET turn_mode = excluded.turn_mode",
+                (chat_id, turn_mode)
+            )
+
+    async def save_turn_mode(self, chat_id: int, turn_mode: str):
+        """Guarda cómo se hacen respetar los turnos en un chat"""
+        if self._conn:
+            await asyncio.to_thread(self._write_turn_mode, chat_id, turn_mode)
+
+    def load_turn_modes(self) -> Dict[int, str]:
+        """Carga el modo de turnos de los chats que lo cambiaron: {chat_id: modo}"""
+        with self._lock:
+            rows = self._conn.execute("SELECT chat_id, turn_mode FROM chat_settings WHERE turn_mode IS NOT NULL").fetchall()
+        return dict(rows)
+
+    def load_chat_settings(self) -> Dict[int, Tuple[Optional[str], Optional[str]]]:
+        """Carga los ajustes de todos los chats: {chat_id: (paquete, categoría)}"""
+        with self._lock:
+            rows = self._conn.execute("SELECT chat_id, word_pack, word_category FROM chat_settings").fetchall()
+        return {chat_id: (word_pack, word_category) for chat_id, word_pack, word_category in rows}
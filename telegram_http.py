@@ -0,0 +1,64 @@
+"""
+Clientes HTTP de la Bot API
+getUpdates (long polling) y el resto de llamadas usan clientes separados, cada uno con su
+pool de conexiones, keep-alive, HTTP/2 y timeouts: un long poll en curso nunca ocupa una
+conexión que necesite un envío, y los envíos no esperan detrás de él
+"""
+
+import logging
+from typing import Dict, Optional
+
+import httpx
+from telegram.ext import BaseRateLimiter, ExtBot
+from telegram.request import BaseRequest, HTTPXRequest
+
+from config import BOT_HTTP, GET_UPDATES_LIMIT, UPDATES_HTTP
+
+logger = logging.getLogger(__name__)
+
+def build_request(settings: Dict) -> HTTPXRequest:
+    """Cliente HTTPX con los ajustes de config._http_settings"""
+    limits = httpx.Limits(
+        max_connections=settings['pool_size'],
+        max_keepalive_connections=settings['keepalive'],
+        keepalive_expiry=settings['keepalive_expiry'],
+    )
+    kwargs = dict(
+        connection_pool_size=settings['pool_size'],
+        connect_timeout=settings['connect_timeout'],
+        read_timeout=settings['read_timeout'],
+        write_timeout=settings['write_timeout'],
+        pool_timeout=settings['pool_timeout'],
+        httpx_kwargs={'limits': limits},
+    )
+    if settings['http2']:
+        try:
+            return HTTPXRequest(http_version='2', **kwargs)
+        except RuntimeError as e:
+            # Falta el extra http2 de python-telegram-bot (paquete h2)
+            logger.warning(f"HTTP/2 no disponible, se usa HTTP/1.1: {e}")
+    return HTTPXRequest(http_version='1.1', **kwargs)
+
+class PollingBot(ExtBot):
+    """ExtBot que pide a getUpdates lotes de GET_UPDATES_LIMIT updates (el Updater no deja elegirlo)"""
+
+    updates_limit = GET_UPDATES_LIMIT
+
+    async def get_updates(self, offset=None, limit=None, *args, **kwargs):
+        return await super().get_updates(offset, self.updates_limit if limit is None else limit, *args, **kwargs)
+
+def build_bot(token: str, base_url: Optional[str] = None, request: Optional[BaseRequest] = None,
+              rate_limiter: Optional[BaseRateLimiter] = None) -> PollingBot:
+    """Bot con un cliente para getUpdates y otro para el resto de llamadas.
+    request sustituye al cliente de las demás llamadas (benchmarks en proceso)"""
+    kwargs = {}
+    if base_url:
+        # Permite apuntar a un servidor local que imita la Bot API (pruebas y benchmarks)
+        kwargs['base_url'] = f"{base_url.rstrip('/')}/bot"
+    return PollingBot(
+        token,
+        request=request if request is not None else build_request(BOT_HTTP),
+        get_updates_request=build_request(UPDATES_HTTP),
+        rate_limiter=rate_limiter,
+        **kwargs,
+    )
@@ -0,0 +1,148 @@
+"""
+Control de turnos con los permisos del grupo
+Alternativa a borrar y avisar cada mensaje fuera de turno: durante la ronda de turnos los
+jugadores sin turno están silenciados y en cada /next_player el silencio pasa del nuevo jugador
+de turno al anterior. En la discusión y al terminar el juego todos recuperan sus permisos.
+Telegram no deja que un miembro tenga más permisos que los del grupo, así que en lugar de
+silenciar el grupo entero se silencia a cada jugador por separado
+"""
+
+import asyncio
+import logging
+from typing import Callable, Dict, Optional, Set
+
+from telegram import ChatPermissions
+from telegram.error import BadRequest, Forbidden
+
+from game import STATE_FINISHED, STATE_PLAYING, TURN_MODE_DELETE, TURN_MODE_MUTE
+from metrics import Counter
+from outbound import PRIORITY_HIGH, PRIORITY_NORMAL
+
+logger = logging.getLogger(__name__)
+
+TURN_CALLS = Counter(
+    'impostor_turn_enforcement_calls_total', 'Llamadas a la Bot API para hacer respetar los turnos', ('mode', 'method')
+)
+TURN_ROUNDS = Counter('impostor_turn_rounds_total', 'Rondas de turnos jugadas', ('mode',))
+
+MUTED = ChatPermissions.no_permissions()
+# Todo permitido a nivel de miembro equivale a no tener restricción propia: rigen los permisos del grupo
+UNMUTED = ChatPermissions.all_permissions()
+
+def count_call(mode: str, method: str):
+    """Cuenta una llamada a la API hecha para hacer respetar los turnos"""
+    TURN_CALLS.inc(mode, method)
+
+class TurnGuard:
+    def __init__(self, concurrency: int, on_unavailable: Optional[Callable] = None):
+        self.concurrency = concurrency  # Cambios de permisos simultáneos por juego
+        self.on_unavailable = on_unavailable  # on_unavailable(game) al volver a borrar y avisar por falta de permisos
+        self.bot = None  # Se asigna al arrancar la aplicación
+        self._tasks: Dict[str, asyncio.Task] = {}  # {game_id: ajuste en curso}
+        self._pending: Set[str] = set()  # Juegos que cambiaron mientras se ajustaban sus permisos
+        self._exempt: Dict[str, Set[int]] = {}  # {game_id: jugadores que Telegram no deja silenciar (admins)}
+        self._verified: Set[str] = set()  # Juegos en los que ya se pudo silenciar a alguien
+
+    def wanted_muted(self, game) -> Set[int]:
+        """Jugadores que deberían estar silenciados en la fase actual"""
+        if game.turn_mode != TURN_MODE_MUTE or game.state != STATE_PLAYING:
+            return set()
+        exempt = self._exempt.get(game.game_id, ())
+        return {p for p in game.active_players if p != game.current_player and p not in exempt}
+
+    def sync(self, game):
+        """Pide ajustar los permisos al estado del juego; lo que cambie durante un ajuste se aplica en el siguiente"""
+        if game.state == STATE_FINISHED and game.game_id not in self._tasks:
+            self._exempt.pop(game.game_id, None)
+            self._verified.discard(game.game_id)
+        if self.bot is None or not (game.muted_players or self.wanted_muted(game)):
+            return
+        if game.game_id in self._tasks:
+            self._pending.add(game.game_id)
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._tasks[game.game_id] = loop.create_task(self._run(game))
+
+    async def _run(self, game):
+        try:
+            while True:
+                self._pending.discard(game.game_id)
+                await self._apply(game)
+                if game.game_id not in self._pending:
+                    break
+        finally:
+            del self._tasks[game.game_id]
+            if game.state == STATE_FINISHED:
+                self._exempt.pop(game.game_id, None)
+                self._verified.discard(game.game_id)
+                if game.muted_players:
+                    logger.warning(f"Jugadores que siguen silenciados en {game.chat_id} tras terminar el juego: {sorted(game.muted_players)}")
+
+    async def _apply(self, game):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def restrict(user_id, permissions, priority):
+            async with semaphore:
+                if permissions is MUTED and game.turn_mode != TURN_MODE_MUTE:
+                    return False  # Otra llamada ya vio que no se puede silenciar en este grupo
+                return await self._restrict(game, user_id, permissions, priority)
+
+        # Primero recupera la palabra el jugador de turno; después se silencia a los demás
+        wanted = self.wanted_muted(game)
+        released = sorted(game.muted_players - wanted, key=lambda user_id: user_id != game.current_player)
+        results = await asyncio.gather(*(
+            restrict(user_id, UNMUTED, PRIORITY_HIGH if user_id == game.current_player else PRIORITY_NORMAL)
+            for user_id in released
+        ))
+        game.muted_players.difference_update(user_id for user_id, done in zip(released, results) if done)
+
+        muting = sorted(self.wanted_muted(game) - game.muted_players)
+        if muting and game.game_id not in self._verified:
+            # Primer silencio del juego, solo: si el grupo no lo admite (sin permisos o grupo normal)
+            # el juego vuelve a borrar y avisar sin intentarlo con cada jugador
+            if await restrict(muting[0], MUTED, PRIORITY_NORMAL):
+                game.muted_players.add(muting[0])
+                self._verified.add(game.game_id)
+            muting = sorted(self.wanted_muted(game) - game.muted_players)
+        results = await asyncio.gather(*(restrict(user_id, MUTED, PRIORITY_NORMAL) for user_id in muting))
+        game.muted_players.update(user_id for user_id, done in zip(muting, results) if done)
+
+    async def _restrict(self, game, user_id: int, permissions: ChatPermissions, priority: int) -> bool:
+        """Cambia los permisos de un jugador. Retorna True si queda como se pidió (o ya no hace falta)"""
+        count_call(TURN_MODE_MUTE, 'restrictChatMember')
+        try:
+            await self.bot.restrict_chat_member(game.chat_id, user_id, permissions, rate_limit_args=priority)
+            return True
+        except BadRequest as e:
+            # Sin permiso para restringir, o grupo normal ("available only for supergroups"):
+            # no se puede silenciar a nadie del grupo
+            if 'rights' in str(e).lower() or 'supergroup' in str(e).lower():
+                self._unavailable(game, e)
+                return False
+            if permissions is MUTED:
+                # Administradores y creador del grupo: sus mensajes fuera de turno se siguen borrando
+                self._exempt.setdefault(game.game_id, set()).add(user_id)
+                logger.info(f"No se puede silenciar a {user_id} en {game.chat_id}: {e}")
+                return False
+            # Ya no está en el grupo: no hay nada que devolver
+            return True
+        except Forbidden as e:
+            # El bot ya no está en el grupo
+            self._unavailable(game, e)
+            return permissions is UNMUTED
+        except Exception as e:
+            logger.warning(f"No se pudieron cambiar los permisos de {user_id} en {game.chat_id}: {e}")
+            return False
+
+    def _unavailable(self, game, error: Exception):
+        """Sin permiso para restringir miembros (o en un grupo normal): el juego vuelve a borrar y avisar"""
+        if game.turn_mode != TURN_MODE_MUTE:
+            return
+        game.turn_mode = TURN_MODE_DELETE
+        self._pending.add(game.game_id)  # Devolver los permisos a los que ya estaban silenciados
+        logger.warning(f"Sin permiso para silenciar miembros en {game.chat_id} ({error}): se vuelve a borrar y avisar")
+        if self.on_unavailable:
+            self.on_unavailable(game)
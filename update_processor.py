@@ -0,0 +1,73 @@
+"""
+Procesamiento concurrente de updates con orden por chat
+Los updates de chats distintos se procesan a la vez; los de un mismo chat, uno detrás de otro y
+en el orden en que llegaron. Los temporizadores de fase toman el mismo cerrojo del chat, así que
+un handler y un temporizador nunca modifican el mismo juego a la vez
+"""
+
+import asyncio
+import contextlib
+from typing import Awaitable, Callable, Dict, Optional
+
+from telegram.ext import BaseUpdateProcessor
+
+class ChatLocks:
+    """Un asyncio.Lock por chat, creado al usarlo y borrado cuando nadie lo espera"""
+
+    def __init__(self):
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._users: Dict[int, int] = {}  # {chat_id: tareas que tienen o esperan el cerrojo}
+
+    @contextlib.asynccontextmanager
+    async def hold(self, chat_id: int):
+        """Bloquea el chat mientras dura el bloque (asyncio.Lock atiende las esperas por orden de llegada)"""
+        lock = self._locks.get(chat_id)
+        if lock is None:
+            lock = self._locks[chat_id] = asyncio.Lock()
+        self._users[chat_id] = self._users.get(chat_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[chat_id] -= 1
+            if not self._users[chat_id]:
+                del self._users[chat_id]
+                del self._locks[chat_id]
+
+    def busy(self) -> int:
+        """Chats con el cerrojo tomado o con tareas esperándolo"""
+        return len(self._locks)
+
+class ChatUpdateProcessor(BaseUpdateProcessor):
+    """Procesa hasta max_concurrent_updates updates a la vez, como mucho uno por chat.
+    resolve_chat(update) da el chat de cada update (None = sin chat, no espera a nadie)"""
+
+    # Updates aceptados a la vez, contando los que esperan por su chat (límite de la clase base)
+    MAX_PENDING_UPDATES = 65536
+
+    def __init__(self, max_concurrent_updates: int, resolve_chat: Callable[[object], Optional[int]], locks: ChatLocks):
+        # El límite de la clase base se aplica antes de esperar por el chat: con él, un chat con
+        # muchos updates pendientes ocuparía todas las plazas. Aquí se aplica con el chat ya bloqueado
+        super().__init__(self.MAX_PENDING_UPDATES)
+        self.max_running = max_concurrent_updates
+        self.resolve_chat = resolve_chat
+        self.locks = locks
+        self._running = asyncio.Semaphore(max_concurrent_updates)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable):
+        # El chat se resuelve antes del primer await: los updates de un chat piden el cerrojo
+        # en el orden en que llegaron
+        chat_id = self.resolve_chat(update)
+        if chat_id is None:
+            async with self._running:
+                await coroutine
+            return
+        async with self.locks.hold(chat_id):
+            async with self._running:
+                await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -0,0 +1,116 @@
+"""
+Detección de la palabra secreta en los mensajes
+Compila una sola vez por juego una expresión que ignora mayúsculas y tildes, respeta los
+límites de palabra y acepta plurales y diminutivos ("león", "leon", "leones", "leoncito")
+"""
+
+import os
+import re
+import unicodedata
+from typing import Dict, List
+
+# Sufijos de diminutivo que se añaden a la raíz (perr-ito) o a la palabra completa (pan-cito)
+DIMINUTIVE_SUFFIXES = ('ito', 'ita', 'illo', 'illa')
+
+# Cambios ortográficos de la raíz antes de un sufijo que empieza por i (loco -> loquito)
+_STEM_SPELLING = (('c', 'qu'), ('g', 'gu'), ('z', 'c'))
+
+def normalize(text: str) -> str:
+    """Pasa a minúsculas y elimina tildes y diéresis (ñ -> n)"""
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+def _plurals(word: str) -> List[str]:
+    if word.endswith('z'):
+        return [word[:-1] + 'ces']
+    if word.endswith('s'):
+        return []
+    if word[-1] in 'aeiou':
+        return [word + 's']
+    return [word + 'es']
+
+def _diminutives(word: str) -> List[str]:
+    stems = []
+    if word[-1] in 'aoe':
+        # Se quita la vocal final ajustando la ortografía (loco -> loqu-ito, lago -> lagu-ito)
+        stem = word[:-1]
+        for ending, replacement in _STEM_SPELLING:
+            if stem.endswith(ending):
+                stem = stem[:-len(ending)] + replacement
+                break
+        stems.append(stem)
+    if word[-1] == 'z':
+        stems.append(word[:-1] + 'c')  # lapiz -> lapic-ito
+    elif word[-1] not in 'ao':
+        stems.append(word + 'c')  # pan -> panc-ito, tigre -> tigrec-ito
+    return [stem + suffix + plural for stem in stems for suffix in DIMINUTIVE_SUFFIXES for plural in ('', 's')]
+
+def word_variants(word: str) -> List[str]:
+    """Formas normalizadas que cuentan como decir la palabra"""
+    base = normalize(word.strip())
+    if not base:
+        return []
+    variants = [base] + _plurals(base)
+    # Diminutivos solo para palabras sueltas de cierta longitud ("ajo" -> "ajito" sí, "té" no)
+    if ' ' not in base and len(base) >= 3:
+        variants += _diminutives(base)
+    return list(dict.fromkeys(variants))
+
+def _build_equivalents() -> Dict[str, str]:
+    """Para cada letra normalizada, las minúsculas de Latin-1 que se normalizan a ella (o -> oòóôõö)"""
+    equivalents: Dict[str, List[str]] = {}
+    for code in range(0xE0, 0x100):
+        char = chr(code)
+        base = normalize(char)
+        if len(base) == 1 and base.isalpha() and base.isascii():
+            equivalents.setdefault(base, [base]).append(char)
+    return {base: ''.join(dict.fromkeys(chars)) for base, chars in equivalents.items()}
+
+_EQUIVALENTS = _build_equivalents()
+_COMBINING_MARKS = '[\u0300-\u036f]*'  # Tildes escritas como carácter aparte (texto en NFD)
+
+def _char_pattern(char: str) -> str:
+    if char == ' ':
+        return r'\s+'
+    equivalents = _EQUIVALENTS.get(char)
+    if equivalents:
+        return f'[{equivalents}]{_COMBINING_MARKS}'
+    return re.escape(char)
+
+def _variants_pattern(variants: List[str]) -> str:
+    """Alternativa de variantes sacando factor común el prefijo compartido"""
+    prefix = os.path.commonprefix(variants)
+    rests = sorted({variant[len(prefix):] for variant in variants}, key=len, reverse=True)
+    head = ''.join(_char_pattern(char) for char in prefix)
+    alternatives = '|'.join(''.join(_char_pattern(char) for char in rest) for rest in rests if rest)
+    if not alternatives:
+        return head
+    optional = '?' if '' in rests else ''
+    return f"{head}(?:{alternatives}){optional}"
+
+class WordMatcher:
+    __slots__ = ('word', 'pattern')
+
+    def __init__(self, word: str):
+        self.word = word
+        variants = word_variants(word)
+        # Se busca sobre el texto original: las clases de caracteres ya cubren tildes y mayúsculas,
+        # así que no hay que normalizar cada mensaje
+        self.pattern = re.compile(_variants_pattern(variants) + r'(?!\w)', re.IGNORECASE) if variants else None
+
+    def search(self, text: str) -> bool:
+        """True si el texto contiene la palabra o una de sus variantes como palabra completa"""
+        if self.pattern is None:
+            return False
+        # El límite de palabra inicial se comprueba a mano solo en las coincidencias: una búsqueda
+        # que empieza por una letra concreta es mucho más rápida que con (?<!\w) delante
+        for match in self.pattern.finditer(text):
+            start = match.start()
+            if start == 0:
+                return True
+            previous = text[start - 1]
+            if not (previous.isalnum() or previous == '_' or unicodedata.combining(previous)):
+                return True
+        return False
@@ -0,0 +1,224 @@
+"""
+Paquetes de palabras cargados desde disco
+Cada paquete (idioma o temática) se guarda de forma compacta: todas las palabras en un único
+buffer UTF-8 y una tabla de desplazamientos. Se cargan la primera vez que se usan, y los
+paquetes compilados grandes se mapean en memoria en lugar de leerse enteros.
+
+Formatos en WORD_PACKS_DIR:
+- <nombre>.txt: líneas "[Categoría]" seguidas de palabras (una por línea o separadas por comas)
+- <nombre>.wpk: paquete compilado con `python word_packs.py compile wordpacks/<nombre>.txt`
+"""
+
+import json
+import logging
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from config import WORD_PACKS_DIR, WORD_PACK_MMAP_THRESHOLD, DEFAULT_WORD_PACK
+from words import WORDS_CATEGORIES
+
+logger = logging.getLogger(__name__)
+
+PACK_MAGIC = b'WPK1'
+BUILTIN_PACK = 'es'  # Paquete incluido en el código (words.WORDS_CATEGORIES)
+
+class WordPack:
+    """Palabras de un paquete, agrupadas por categoría en rangos contiguos"""
+
+    def __init__(self, name: str, blob, offsets: Sequence[int], categories: Dict[str, Tuple[int, int]], source=None):
+        self.name = name
+        self._blob = blob  # bytes o memoryview de un mmap con las palabras en UTF-8
+        self._offsets = offsets  # La palabra i ocupa blob[offsets[i]:offsets[i + 1]]
+        self.categories = categories  # {categoría: (primer índice, último índice + 1)}
+        self._source = source  # mmap abierto (se mantiene vivo mientras se use el paquete)
+
+    @classmethod
+    def from_categories(cls, name: str, categories: Dict[str, Iterable[str]]) -> 'WordPack':
+        """Construye un paquete en memoria; las palabras repetidas se quedan en su primera categoría"""
+        seen = set()
+        chunks: List[bytes] = []
+        offsets = array('I', [0])
+        ranges = {}
+        for category, words in categories.items():
+            start = len(offsets) - 1
+            for word in words:
+                word = word.strip()
+                if not word or word in seen:
+                    continue
+                seen.add(word)
+                encoded = word.encode('utf-8')
+                chunks.append(encoded)
+                offsets.append(offsets[-1] + len(encoded))
+            if len(offsets) - 1 > start:
+                ranges[category] = (start, len(offsets) - 1)
+        return cls(name, b''.join(chunks), offsets, ranges)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def word(self, index: int) -> str:
+        return bytes(self._blob[self._offsets[index]:self._offsets[index + 1]]).decode('utf-8')
+
+    def indices(self, category: Optional[str] = None) -> range:
+        """Índices de las palabras de una categoría (o de todo el paquete)"""
+        if category is None:
+            return range(len(self))
+        start, end = self.categories[category]
+        return range(start, end)
+
+    def random_word(self, category: Optional[str] = None) -> str:
+        """Palabra aleatoria de una categoría; si no existe, de todo el paquete"""
+        if category not in self.categories:
+            category = None
+        return self.word(random.choice(self.indices(category)))
+
+    def to_bytes(self) -> bytes:
+        """Serializa el paquete en formato .wpk"""
+        header = json.dumps({'name': self.name, 'categories': self.categories}, ensure_ascii=False).encode('utf-8')
+        header += b' ' * (-len(header) % 4)  # Alinear la tabla de desplazamientos
+        offsets = array('I', self._offsets)
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        return PACK_MAGIC + struct.pack('<II', len(header), len(self)) + header + offsets.tobytes() + bytes(self._blob)
+
+    @classmethod
+    def from_buffer(cls, name: str, buffer, source=None) -> 'WordPack':
+        """Lee un paquete .wpk desde bytes o un mmap sin copiar las palabras"""
+        view = memoryview(buffer)
+        if bytes(view[:4]) != PACK_MAGIC:
+            raise ValueError(f"{name}: no es un paquete de palabras válido")
+        header_len, count = struct.unpack_from('<II', view, 4)
+        position = 12
+        header = json.loads(bytes(view[position:position + header_len]).decode('utf-8'))
+        position += header_len
+        offsets_end = position + (count + 1) * 4
+        if sys.byteorder == 'little':
+            offsets = view[position:offsets_end].cast('I')
+        else:
+            offsets = array('I', bytes(view[position:offsets_end]))
+            offsets.byteswap()
+        categories = {category: tuple(bounds) for category, bounds in header['categories'].items()}
+        return cls(name, view[offsets_end:], offsets, categories, source=source)
+
+def parse_text_pack(path: str) -> Dict[str, List[str]]:
+    """Lee un paquete en texto: "[Categoría]" y palabras por línea o separadas por comas"""
+    categories: Dict[str, List[str]] = {}
+    current = categories.setdefault('General', [])
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('[') and line.endswith(']'):
+                current = categories.setdefault(line[1:-1].strip(), [])
+                continue
+            current.extend(word.strip() for word in line.split(','))
+    return {category: words for category, words in categories.items() if words}
+
+def compile_pack(path: str, output: Optional[str] = None) -> str:
+    """Compila un paquete de texto a formato .wpk. Retorna la ruta generada"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    pack = WordPack.from_categories(name, parse_text_pack(path))
+    output = output or os.path.splitext(path)[0] + '.wpk'
+    with open(output, 'wb') as f:
+        f.write(pack.to_bytes())
+    return output
+
+# Paquetes ya cargados (se cargan la primera vez que se piden)
+_packs: Dict[str, WordPack] = {}
+
+def available_packs() -> List[str]:
+    """Nombres de los paquetes disponibles, sin cargarlos"""
+    names = {BUILTIN_PACK}
+    if os.path.isdir(WORD_PACKS_DIR):
+        for filename in os.listdir(WORD_PACKS_DIR):
+            name, extension = os.path.splitext(filename)
+            if extension in ('.txt', '.wpk'):
+                names.add(name)
+    return sorted(names)
+
+def _load_pack(name: str) -> WordPack:
+    compiled = os.path.join(WORD_PACKS_DIR, f"{name}.wpk")
+    text = os.path.join(WORD_PACKS_DIR, f"{name}.txt")
+    if os.path.exists(compiled):
+        size = os.path.getsize(compiled)
+        with open(compiled, 'rb') as f:
+            if size >= WORD_PACK_MMAP_THRESHOLD:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                pack = WordPack.from_buffer(name, mapped, source=mapped)
+            else:
+                pack = WordPack.from_buffer(name, f.read())
+    elif os.path.exists(text):
+        pack = WordPack.from_categories(name, parse_text_pack(text))
+    elif name == BUILTIN_PACK:
+        pack = WordPack.from_categories(name, WORDS_CATEGORIES)
+    else:
+        raise KeyError(name)
+    logger.info(f"Paquete de palabras '{name}' cargado: {len(pack)} palabras en {len(pack.categories)} categorías")
+    return pack
+
+def get_pack(name: Optional[str] = None) -> WordPack:
+    """Obtiene un paquete, cargándolo si es la primera vez. KeyError si no existe"""
+    name = name or DEFAULT_WORD_PACK
+    pack = _packs.get(name)
+    if pack is None:
+        pack = _packs[name] = _load_pack(name)
+    return pack
+
+# Mazo barajado por chat: índices del paquete pendientes de salir (se sacan del final)
+_chat_decks: Dict[int, Tuple[tuple, array]] = {}  # {chat_id: ((paquete, categoría), mazo)}
+_chat_last_words: Dict[int, int] = {}  # Último índice sacado por chat, para no repetirlo al rebarajar
+_chat_deck_used: Dict[int, float] = {}  # Última vez (time.monotonic) que cada chat sacó una palabra
+
+def draw_word(chat_id: int, pack_name: Optional[str] = None, category: Optional[str] = None,
+              rng: Optional[random.Random] = None) -> str:
+    """Saca la siguiente palabra del mazo del chat; no se repite ninguna hasta agotarlo.
+    rng baraja el mazo (el generador del juego, para poder reproducirlo)"""
+    try:
+        pack = get_pack(pack_name)
+    except KeyError:
+        logger.warning(f"Paquete de palabras '{pack_name}' no disponible; se usa '{DEFAULT_WORD_PACK}'")
+        pack = get_pack(DEFAULT_WORD_PACK)
+    if category not in pack.categories:
+        category = None
+
+    key = (pack.name, category)
+    entry = _chat_decks.get(chat_id)
+    if entry is None or entry[0] != key or not entry[1]:
+        if entry is not None and entry[0] != key:
+            _chat_last_words.pop(chat_id, None)
+        population = pack.indices(category)
+        deck = array('H' if len(pack) <= 0xFFFF else 'I', population)
+        (rng or random).shuffle(deck)
+        # Al rebarajar, evitar que la primera palabra del mazo nuevo sea la última del anterior
+        if len(deck) > 1 and deck[-1] == _chat_last_words.get(chat_id):
+            deck[0], deck[-1] = deck[-1], deck[0]
+        entry = _chat_decks[chat_id] = (key, deck)
+
+    index = entry[1].pop()
+    _chat_last_words[chat_id] = index
+    _chat_deck_used[chat_id] = time.monotonic()
+    return pack.word(index)
+
+def prune_chat_decks(max_idle: float, keep) -> int:
+    """Olvida los mazos sin usar en max_idle segundos de los chats que no están en `keep`. Retorna cuántos se borraron"""
+    now = time.monotonic()
+    stale = [chat_id for chat_id, used in _chat_deck_used.items() if now - used > max_idle and chat_id not in keep]
+    for chat_id in stale:
+        del _chat_deck_used[chat_id]
+        _chat_decks.pop(chat_id, None)
+        _chat_last_words.pop(chat_id, None)
+    return len(stale)
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] != 'compile':
+        print("Uso: python word_packs.py compile wordpacks/<nombre>.txt [...]")
+        sys.exit(1)
+    for source in sys.argv[2:]:
+        print(f"{source} -> {compile_pack(source)}")
@@ -1,7 +1,6 @@
 """
 Lista exhaustiva de palabras para el juego del Impostor
 """
-import random
 
 # Lista de palabras categorizadas
 WORDS_CATEGORIES = {
@@ -105,20 +104,23 @@ WORDS_CATEGORIES = {
     ]
 }
 
+def _builtin_pack():
+    """Paquete de estas palabras, el mismo que usa el juego (sin duplicados: cada palabra en su primera categoría)"""
+    from word_packs import BUILTIN_PACK, get_pack
+    return get_pack(BUILTIN_PACK)
+
 def get_all_words():
-    """Obtiene todas las palabras de todas las categorías"""
-    all_words = []
-    for category, words in WORDS_CATEGORIES.items():
-        all_words.extend(words)
-    return all_words
+    """Obtiene todas las palabras de todas las categorías (sin duplicados)"""
+    pack = _builtin_pack()
+    return [pack.word(index) for index in pack.indices()]
 
 def get_random_word():
     """Obtiene una palabra aleatoria de todas las categorías"""
-    all_words = get_all_words()
-    return random.choice(all_words)
+    return _builtin_pack().random_word()
 
-def get_random_word_from_category(category):
-    """Obtiene una palabra aleatoria de una categoría específica"""
-    if category in WORDS_CATEGORIES:
-        return random.choice(WORDS_CATEGORIES[category])
-    return get_random_word()
+def get_random_word_from_category(category, pack=None):
+    """Obtiene una palabra aleatoria de una categoría específica (del paquete indicado o de las incluidas)"""
+    if pack is not None:
+        from word_packs import get_pack
+        return get_pack(pack).random_word(category)
+    return _builtin_pack().random_word(category)